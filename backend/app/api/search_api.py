@@ -0,0 +1,99 @@
+# backend/app/api/search_api.py
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.core.database import get_db_pool_stats
+from app.core.metrics import render_metrics
+from app.services.async_search import SearchOverloadedError
+from app.services.search_service import (
+    get_search_cache_stats, get_details_store_stats, get_search_session_stats, search_locations_paginated,
+    suggest_completions
+)
+from app.services.search_sessions import InvalidCursorError, SearchSessionExpiredError
+from app.services.warmup import retry_if_due, startup_state
+
+router = APIRouter(prefix="/api", tags=["search"])
+# Endpoint cho Prometheus (không nằm dưới /api theo quy ước của Prometheus)
+metrics_router = APIRouter(tags=["metrics"])
+
+SYNONYM_WEIGHT_DESCRIPTION = "Trọng số từ đồng nghĩa so với từ đã gõ (0 = không mở rộng; mặc định SYNONYM_EXPANSION_WEIGHT)"
+
+
+@router.get("/search")
+async def search(request: Request,
+                 q: str = Query(..., min_length=1, max_length=500, description="Câu truy vấn của người dùng"),
+                 limit: int = Query(5, ge=1, le=50, description="Số kết quả trả về"),
+                 tag: list[str] = Query(None, description="Chỉ tìm trong các địa điểm có một trong các tag này"),
+                 mode: str = Query("tfidf", pattern="^(tfidf|hybrid|semantic)$",
+                                   description="tfidf: khớp từ khóa; hybrid: TF-IDF + tag; semantic: LSA (gần nghĩa)"),
+                 synonym_weight: float = Query(None, ge=0, le=1, description=SYNONYM_WEIGHT_DESCRIPTION)):
+    """Tìm kiếm địa điểm theo TF-IDF (hoặc kết hợp tag / ngữ nghĩa, xem mode)."""
+    executor = request.app.state.search_executor
+    try:
+        results = await executor.search(q, limit, tags=tag, mode=mode, synonym_weight=synonym_weight)
+    except SearchOverloadedError as err:
+        raise HTTPException(status_code=503, detail=str(err), headers={"Retry-After": "1"})
+    return {'query': q, 'mode': mode, 'count': len(results), 'results': results}
+
+
+@router.get("/suggest")
+async def suggest(q: str = Query(..., min_length=1, max_length=100, description="Chuỗi người dùng đang gõ"),
+                  limit: int = Query(8, ge=1, le=20, description="Số gợi ý trả về")):
+    """Gợi ý hoàn thành truy vấn (type-ahead), không phân biệt dấu. Chạy trực tiếp trên event loop (dưới 1 ms)."""
+    return {'query': q, 'suggestions': suggest_completions(q, limit)}
+
+
+@router.get("/search/page")
+async def search_page(request: Request,
+                      q: str = Query(None, min_length=1, max_length=500,
+                                     description="Câu truy vấn (bắt buộc ở trang đầu, bỏ qua khi có cursor)"),
+                      page_size: int = Query(10, ge=1, le=50, description="Số kết quả mỗi trang"),
+                      cursor: str = Query(None, max_length=200, description="next_cursor của trang trước"),
+                      tag: list[str] = Query(None, description="Chỉ tìm trong các địa điểm có một trong các tag này"),
+                      synonym_weight: float = Query(None, ge=0, le=1, description=SYNONYM_WEIGHT_DESCRIPTION)):
+    """
+    Tìm kiếm TF-IDF có phân trang: trang đầu xếp hạng một lần và mở phiên, các trang sau dùng
+    next_cursor. 410 khi phiên của cursor đã hết hạn (tìm kiếm lại từ trang đầu).
+    """
+    if not cursor and not q:
+        raise HTTPException(status_code=422, detail="Cần q (trang đầu) hoặc cursor.")
+    executor = request.app.state.search_executor
+    try:
+        return await executor.run(search_locations_paginated, q, page_size, cursor=cursor, tags=tag,
+                                  synonym_weight=synonym_weight)
+    except SearchOverloadedError as err:
+        raise HTTPException(status_code=503, detail=str(err), headers={"Retry-After": "1"})
+    except InvalidCursorError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    except SearchSessionExpiredError as err:
+        raise HTTPException(status_code=410, detail=str(err))
+
+
+@router.get("/search/stats")
+async def search_stats(request: Request):
+    """Chỉ số của executor, cache kết quả, store chi tiết và pool kết nối database."""
+    return {
+        'executor': request.app.state.search_executor.stats(),
+        'result_cache': get_search_cache_stats(),
+        'search_sessions': get_search_session_stats(),
+        'details_store': get_details_store_stats(),
+        'db_pool': get_db_pool_stats(),
+    }
+
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 khi model và tokenizer đã được tải và warm-up xong, 503 trong lúc
+    đang warm-up hoặc khi warm-up lỗi. Kèm thời gian import và từng bước warm-up.
+    """
+    # Warm-up thất bại được thử lại trên thread nền khi đã hết thời gian chờ (xem warmup.retry_if_due)
+    retry_if_due()
+    state = startup_state.stats()
+    return JSONResponse(state, status_code=200 if state['ready'] else 503)
+
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Metric của đường tìm kiếm ở định dạng text của Prometheus."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
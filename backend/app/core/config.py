@@ -1,23 +1,128 @@
 # backend/app/core/config.py
+import os
 
-# !!! QUAN TRỌNG: Thay đổi thông tin cho phù hợp với DB của bạn
-# !!! Trong production, nên dùng biến môi trường thay vì hardcode
+# Thông tin kết nối database lấy từ biến môi trường.
+# Giá trị mặc định chỉ dành cho môi trường phát triển; production cần đặt DB_HOST, DB_USER, DB_PASSWORD...
 DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',  # Thay username
-    'password': '11082002',  # Thay password
-    'database': 'datn'  # Thay tên database nếu khác
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', '3306')),
+    'user': os.getenv('DB_USER', 'root'),
+    'password': os.getenv('DB_PASSWORD', '11082002'),
+    'database': os.getenv('DB_NAME', 'datn'),
+    'connection_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5')),
 }
 
+# Pool kết nối MySQL (app.core.database)
+DB_POOL_NAME = os.getenv('DB_POOL_NAME', 'datn_search')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8')) # mysql.connector giới hạn tối đa 32
+DB_POOL_CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '2.0')) # giây chờ khi pool đã hết
+# Số ID trong mỗi lần chạy prepared statement lấy chi tiết địa điểm (số placeholder cố định)
+DETAIL_QUERY_BATCH_SIZE = int(os.getenv('DETAIL_QUERY_BATCH_SIZE', '8'))
+
+# Store chi tiết địa điểm trong bộ nhớ (app.services.location_details_store)
+DETAILS_STORE_ENABLED = os.getenv('DETAILS_STORE_ENABLED', '1') == '1'
+DETAILS_REFRESH_INTERVAL = float(os.getenv('DETAILS_REFRESH_INTERVAL', '60')) # giây giữa các lần kiểm tra thay đổi
+# Cột thời gian cập nhật của bảng dia_danh; nếu bảng không có cột này store dùng CHECKSUM TABLE
+DIA_DANH_UPDATED_AT_COLUMN = os.getenv('DIA_DANH_UPDATED_AT_COLUMN', 'updated_at')
+
 # Đường dẫn đến các file model TF-IDF
 # Giả định file này nằm trong app/core/, data/ nằm cùng cấp với app/
-import os
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # trỏ về backend/
-MODEL_DIR = os.path.join(BASE_DIR, 'data', 'models')
+MODEL_DIR = os.getenv('MODEL_DIR', os.path.join(BASE_DIR, 'data', 'models')) # Giống build_tfidf_model.py
 
 VECTORIZER_PATH = os.path.join(MODEL_DIR, 'tfidf_vectorizer.pkl')
 TFIDF_MATRIX_PATH = os.path.join(MODEL_DIR, 'tfidf_matrix.pkl')
 LOCATION_IDS_PATH = os.path.join(MODEL_DIR, 'location_ids.pkl')
 
+# Thư mục index dạng memory-map (không dùng pickle), do build_tfidf_model.py tạo ra.
+# Nếu thư mục này tồn tại, TFIDFEngine ưu tiên dùng nó; nếu không sẽ dùng các file .pkl ở trên.
+TFIDF_INDEX_DIR = os.path.join(MODEL_DIR, 'tfidf_index')
+
+# (Tùy chọn) Index tìm kiếm ngữ nghĩa LSA + IVF (build_tfidf_model.py --semantic), dùng cho mode=semantic.
+# Chỉ được dùng khi được build từ đúng index TF-IDF đang tải.
+SEMANTIC_INDEX_DIR = os.path.join(MODEL_DIR, 'semantic_index')
+# Số cụm IVF được duyệt mỗi truy vấn: lớn hơn thì recall cao hơn nhưng chậm hơn
+SEMANTIC_NPROBE = int(os.getenv('SEMANTIC_NPROBE', '8'))
+
+# Index gợi ý hoàn thành truy vấn (type-ahead), build cùng model bởi build_tfidf_model.py
+SUGGESTION_INDEX_DIR = os.path.join(MODEL_DIR, 'suggestion_index')
+
+# Index phân giải token ngoài từ vựng của truy vấn (gõ không dấu, gõ sai), build cùng model bởi
+# build_tfidf_model.py; QUERY_TERM_RESOLUTION=0 để tắt
+TERM_RESOLVER_DIR = os.path.join(MODEL_DIR, 'term_resolver')
+QUERY_TERM_RESOLUTION = os.getenv('QUERY_TERM_RESOLUTION', '1') == '1'
+
+# Ma trận mở rộng từ đồng nghĩa (synonyms.json biên dịch theo từ vựng), build cùng model bởi build_tfidf_model.py.
+# Trọng số mặc định của từ đồng nghĩa so với từ người dùng gõ (1 = như nhau, 0 = tắt), có thể đổi theo từng truy vấn.
+# Không có ma trận thì từ đồng nghĩa được thêm vào chuỗi token như trước (trọng số 1).
+SYNONYM_EXPANSION_DIR = os.path.join(MODEL_DIR, 'synonym_expansion')
+SYNONYM_EXPANSION_WEIGHT = float(os.getenv('SYNONYM_EXPANSION_WEIGHT', '0.5'))
+
+# (Tùy chọn) Index TF-IDF chia shard (build_tfidf_model.py --shards N) để tìm kiếm scatter-gather trên
+# SEARCH_SHARD_PROCESSES tiến trình (0 = tắt, tính điểm trong tiến trình hiện tại như bình thường).
+# Chỉ được dùng khi được build cùng lúc với index TF-IDF đang tải.
+TFIDF_SHARDS_DIR = os.path.join(MODEL_DIR, 'tfidf_shards')
+SEARCH_SHARD_PROCESSES = int(os.getenv('SEARCH_SHARD_PROCESSES', '0'))
+
+# Số truy vấn gần đây được nhớ kết quả tách từ (underthesea) trong preprocessor
+TOKENIZE_CACHE_SIZE = int(os.getenv('TOKENIZE_CACHE_SIZE', '4096'))
+
+# Cache kết quả tìm kiếm trong search_service (có thể chỉnh qua biến môi trường)
+SEARCH_CACHE_MAX_SIZE = int(os.getenv('SEARCH_CACHE_MAX_SIZE', '2048')) # 0 = tắt cache
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv('SEARCH_CACHE_TTL_SECONDS', '600'))
+# Phiên phân trang (/api/search/page): số phiên giữ trong bộ nhớ, thời gian sống (giây) và số kết quả
+# xếp hạng tối đa của một phiên (trang cuối cùng có thể lấy tới)
+SEARCH_SESSION_MAX = int(os.getenv('SEARCH_SESSION_MAX', '1000'))
+SEARCH_SESSION_TTL_SECONDS = float(os.getenv('SEARCH_SESSION_TTL_SECONDS', '600'))
+SEARCH_SESSION_MAX_RESULTS = int(os.getenv('SEARCH_SESSION_MAX_RESULTS', '1000'))
+# Chu kỳ (giây) kiểm tra file model trên đĩa có thay đổi hay không để tải lại và xóa cache
+MODEL_RELOAD_CHECK_INTERVAL = float(os.getenv('MODEL_RELOAD_CHECK_INTERVAL', '30'))
+
+# Cập nhật index từng địa điểm (upsert/delete) trong TFIDFEngine
+# Gộp segment delta vào segment gốc khi (số dòng delta + số dòng đã xóa) / số dòng gốc vượt ngưỡng
+INDEX_MERGE_THRESHOLD = float(os.getenv('INDEX_MERGE_THRESHOLD', '0.1'))
+# Cần build lại từ vựng/IDF khi tỉ lệ token ngoài từ vựng trong các mô tả mới vượt ngưỡng
+INDEX_REFIT_OOV_THRESHOLD = float(os.getenv('INDEX_REFIT_OOV_THRESHOLD', '0.2'))
+# Lệnh build lại model chạy nền khi cần (vd: "python script/build_tfidf_model.py"); rỗng = chỉ cảnh báo
+MODEL_REBUILD_COMMAND = os.getenv('MODEL_REBUILD_COMMAND', '')
+
+# Trọng số kết hợp điểm trong HybridRanker: final_score = TFIDF_WEIGHT * tfidf_score + TAG_WEIGHT * tag_score
+TFIDF_WEIGHT = float(os.getenv('TFIDF_WEIGHT', '0.7'))
+TAG_WEIGHT = float(os.getenv('TAG_WEIGHT', '0.3'))
+
+# Số bộ lọc (mask theo dòng, theo tag) được cache để dùng lại giữa các truy vấn
+FILTER_CACHE_SIZE = int(os.getenv('FILTER_CACHE_SIZE', '256'))
+
+# Metrics/tracing (app.core.metrics): 0 = tắt, các span/counter gần như không tốn chi phí
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+# Truy vấn chậm hơn ngưỡng (ms) được ghi vào log 'app.search.slow_query' với tỉ lệ lấy mẫu (0-1)
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200'))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_SAMPLE_RATE', '1.0'))
+
+# Khởi động service (app.services.warmup): tải model, tokenizer và chạy các truy vấn mẫu
+# 'background' = trên thread nền, server nhận kết nối ngay và /api/ready trả 503 tới khi xong;
+# 'blocking' = xong mới nhận request; 'off' = không warm-up, model được tải ở truy vấn đầu tiên
+STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'background')
+# (Tùy chọn) File truy vấn mẫu cho warm-up, mỗi dòng một truy vấn; không có thì dùng danh sách mặc định
+WARMUP_QUERIES_PATH = os.getenv('WARMUP_QUERIES_PATH', os.path.join(BASE_DIR, 'data', 'warmup_queries.txt'))
+# Warm-up thất bại được thử lại sau WARMUP_RETRY_SECONDS giây, gấp đôi sau mỗi lần thất bại (tối đa
+# WARMUP_RETRY_MAX_SECONDS); lần thử lại được khởi động ở lần gọi /api/ready kế tiếp sau thời điểm đó
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', '10'))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv('WARMUP_RETRY_MAX_SECONDS', '300'))
+
 # (Tùy chọn) Đường dẫn đến file từ đồng nghĩa
-SYNONYMS_PATH = os.path.join(BASE_DIR, 'data', 'dictionaries', 'synonyms.json')
\ No newline at end of file
+SYNONYMS_PATH = os.path.join(BASE_DIR, 'data', 'dictionaries', 'synonyms.json')
+
+# HTTP API (app.main, run.py)
+API_HOST = os.getenv('API_HOST', '0.0.0.0')
+API_PORT = int(os.getenv('API_PORT', '8000'))
+# Số thread xử lý truy vấn (tách từ, tính điểm) và số truy vấn tối đa đang chờ trước khi trả 503
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', str(min(4, os.cpu_count() or 1))))
+SEARCH_MAX_PENDING = int(os.getenv('SEARCH_MAX_PENDING', '64'))
+# Số tiến trình worker của run.py. > 1: tiến trình master tải model/tokenizer một lần rồi fork các worker
+# dùng chung bộ nhớ đó (copy-on-write) trên cùng một socket, xem app.core.prefork
+API_WORKERS = int(os.getenv('API_WORKERS', '1'))
+# Chu kỳ (giây) master ghi log RSS/bộ nhớ dùng chung của từng worker; 0 = chỉ ghi khi khởi động
+WORKER_MEMORY_REPORT_INTERVAL = float(os.getenv('WORKER_MEMORY_REPORT_INTERVAL', '300'))
+# Thời gian (giây) chờ worker dừng êm khi tắt server trước khi buộc dừng (SIGKILL)
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv('WORKER_SHUTDOWN_TIMEOUT', '30'))
@@ -1,14 +1,239 @@
 # backend/app/core/database.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
 import mysql.connector
-from .config import DB_CONFIG # Import từ file config.py cùng thư mục core
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from .config import DB_CONFIG, DB_POOL_NAME, DB_POOL_SIZE, DB_POOL_CHECKOUT_TIMEOUT # Import từ file config.py cùng thư mục core
+
+
+class PooledConnection:
+    """
+    Kết nối được mượn từ DatabasePool. Dùng như một kết nối MySQL bình thường;
+    close() (hoặc thoát khỏi khối with) trả kết nối về pool thay vì đóng TCP.
+    """
+
+    def __init__(self, pool: "DatabasePool", connection):
+        self._pool = pool
+        self._connection = connection
+        # Kết nối vật lý bên dưới: PooledMySQLConnection chỉ bọc nó và được tạo mới ở mỗi lần mượn
+        self._raw_connection = getattr(connection, '_cnx', connection)
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool._release(connection)
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise PoolError("Kết nối đã được trả về pool.")
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class DatabasePool:
+    """
+    Pool kết nối MySQL dựa trên mysql.connector.pooling, bổ sung:
+    - Giới hạn số kết nối đang mượn và chờ có timeout khi pool đã hết (thay vì lỗi ngay).
+    - Kiểm tra sức khỏe: pool của mysql.connector kiểm tra/kết nối lại khi mượn,
+      health_check() chạy 'SELECT 1' để dùng cho readiness probe.
+    - Cache prepared cursor theo từng kết nối để câu lệnh chỉ prepare một lần.
+    - Bộ đếm để theo dõi (số lần mượn, thời gian chờ, timeout, lỗi...).
+    Pool chỉ được tạo (mở kết nối) ở lần mượn đầu tiên.
+    """
+
+    def __init__(self, db_config: dict, pool_name: str, pool_size: int, checkout_timeout: float):
+        self._db_config = dict(db_config)
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self._pool = None
+        self._create_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._stats_lock = threading.Lock()
+        self._prepared_cursors = {} # kết nối vật lý -> (connection_id của session, prepared cursor)
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._checkouts = 0
+        self._checkout_timeouts = 0
+        self._checkout_errors = 0
+        self._health_check_failures = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._create_lock:
+                if self._pool is None:
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name=self.pool_name,
+                        pool_size=self.pool_size,
+                        # Giữ session giữa các lần mượn để prepared statement không bị giải phóng
+                        pool_reset_session=False,
+                        **self._db_config
+                    )
+        return self._pool
+
+    def get_connection(self, timeout: float = None) -> PooledConnection:
+        """
+        Mượn một kết nối, chờ tối đa timeout giây (mặc định checkout_timeout) nếu pool đang hết.
+        Raise PoolError khi hết thời gian chờ, mysql.connector.Error khi không kết nối được.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        wait_start = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            with self._stats_lock:
+                self._checkout_timeouts += 1
+            raise PoolError(f"Không mượn được kết nối từ pool '{self.pool_name}' sau {timeout} giây.")
+
+        try:
+            connection = self._get_pool().get_connection()
+        except Exception:
+            self._slots.release()
+            with self._stats_lock:
+                self._checkout_errors += 1
+            raise
+
+        waited = time.perf_counter() - wait_start
+        with self._stats_lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._total_wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        return PooledConnection(self, connection)
+
+    def _release(self, connection):
+        try:
+            connection.close() # PooledMySQLConnection.close() trả kết nối về pool
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Mượn kết nối trong khối with; nếu có lỗi thì bỏ prepared cursor đã cache của kết nối đó."""
+        conn = self.get_connection(timeout)
+        try:
+            yield conn
+        except Exception:
+            self._discard_prepared_cursor(conn)
+            raise
+        finally:
+            conn.close()
+
+    def prepared_cursor(self, conn: PooledConnection):
+        """
+        Prepared cursor dùng lại được của kết nối conn. Thực thi lại cùng một chuỗi SQL
+        (cùng object) trên cursor này sẽ không phải prepare lại trên server.
+        Mỗi kết nối vật lý giữ tối đa một cursor; khi kết nối đã được mở lại (connection_id mới),
+        cursor của session cũ được đóng trong lúc đang mượn chính kết nối đó.
+        """
+        session = conn.connection_id
+        cached = self._prepared_cursors.get(conn._raw_connection)
+        if cached is not None and cached[0] == session:
+            return cached[1]
+        if cached is not None:
+            self._close_cursor(cached[1])
+        cursor = conn.cursor(prepared=True)
+        with self._stats_lock:
+            self._prepared_cursors[conn._raw_connection] = (session, cursor)
+        return cursor
+
+    def _discard_prepared_cursor(self, conn: PooledConnection):
+        """Bỏ và đóng prepared cursor đã cache của kết nối conn (đang được mượn) sau khi có lỗi."""
+        with self._stats_lock:
+            cached = self._prepared_cursors.pop(conn._raw_connection, None)
+        if cached is not None:
+            self._close_cursor(cached[1])
+
+    @staticmethod
+    def _close_cursor(cursor):
+        # Giải phóng statement trên server (nếu session còn) và bộ nhớ phía client; kết nối
+        # đã lỗi hoặc đã mở lại thì việc đóng có thể lỗi, cursor vẫn được bỏ khỏi cache
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+    def reset_after_fork(self):
+        """
+        Gọi trong tiến trình con sau fork (run.py chạy nhiều worker): bỏ pool và prepared cursor
+        thừa hưởng từ tiến trình cha (socket MySQL không được dùng chung giữa các tiến trình),
+        pool mới được tạo ở lần mượn đầu tiên trong tiến trình con. Prepared cursor chỉ được bỏ đi,
+        không đóng: đóng sẽ gửi lệnh giải phóng statement qua socket mà tiến trình cha vẫn đang dùng.
+        """
+        self._pool = None
+        self._create_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._stats_lock = threading.Lock()
+        self._prepared_cursors = {}
+        self._in_use = 0
+
+    def health_check(self) -> bool:
+        """Chạy 'SELECT 1' trên một kết nối của pool. Trả về True nếu database phản hồi."""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchall()
+                finally:
+                    cursor.close()
+            return True
+        except mysql.connector.Error as err:
+            with self._stats_lock:
+                self._health_check_failures += 1
+            print(f"Database health check thất bại: {err}")
+            return False
+
+    def stats(self) -> dict:
+        """Các chỉ số hiện tại của pool."""
+        with self._stats_lock:
+            return {
+                'pool_name': self.pool_name,
+                'pool_size': self.pool_size,
+                'created': self._pool is not None,
+                'in_use': self._in_use,
+                'peak_in_use': self._peak_in_use,
+                'checkouts': self._checkouts,
+                'checkout_timeouts': self._checkout_timeouts,
+                'checkout_errors': self._checkout_errors,
+                'health_check_failures': self._health_check_failures,
+                'avg_wait_ms': round(self._total_wait_seconds * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait_seconds * 1000, 3),
+                'prepared_cursors': len(self._prepared_cursors),
+            }
+
+
+db_pool = DatabasePool(DB_CONFIG, DB_POOL_NAME, DB_POOL_SIZE, DB_POOL_CHECKOUT_TIMEOUT)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=db_pool.reset_after_fork)
+
 
 def get_db_connection():
-    """Tạo và trả về một kết nối đến cơ sở dữ liệu MySQL."""
+    """
+    Mượn một kết nối đến cơ sở dữ liệu MySQL từ pool.
+    Gọi conn.close() để trả kết nối về pool. Trả về None nếu không lấy được kết nối.
+    """
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
+        return db_pool.get_connection()
     except mysql.connector.Error as err:
         print(f"Lỗi khi kết nối đến MySQL: {err}")
         # Trong ứng dụng thực tế, bạn có thể muốn log lỗi này
         # và trả về None hoặc raise một exception cụ thể
-        return None
\ No newline at end of file
+        return None
+
+
+def get_db_pool_stats() -> dict:
+    """Chỉ số của pool kết nối (dùng cho giám sát)."""
+    return db_pool.stats()
@@ -0,0 +1,256 @@
+# backend/app/core/metrics.py
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import METRICS_ENABLED, SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_SAMPLE_RATE
+
+slow_query_logger = logging.getLogger("app.search.slow_query")
+
+# Ngưỡng (giây) của histogram thời gian: từ 50µs tới 5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Ngưỡng của histogram số lượng (số ứng viên, số kết quả...)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Bộ đếm chỉ tăng, có thể có nhãn (labels) cố định theo tên."""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple((name, labels[name]) for name in self.labelnames), 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in items)
+        return lines
+
+
+class Histogram:
+    """Histogram với các ngưỡng cố định (định dạng cumulative của Prometheus)."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._series = {} # labels -> [số đếm từng ngưỡng..., tổng, số lần]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Tập các metric và các hàm thu thập gauge (đọc số liệu từ cache, pool... lúc xuất)."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets: tuple, labelnames: tuple = ()) -> Histogram:
+        metric = Histogram(name, help_text, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, prefix: str, collect):
+        """collect() trả về dict {tên: giá trị số}; xuất dưới dạng gauge '<prefix>_<tên>'."""
+        self._collectors.append((prefix, collect))
+
+    def render(self) -> str:
+        """Toàn bộ metric ở định dạng text của Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, collect in self._collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                lines.append(f"# {prefix}: lỗi khi thu thập ({e})")
+                continue
+            for name, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {prefix}_{name} gauge")
+                    lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "search_stage_seconds", "Thời gian từng bước của đường tìm kiếm.", LATENCY_BUCKETS, ("stage",)
+)
+queries_total = registry.counter("search_queries_total", "Số truy vấn tìm kiếm.", ("kind",))
+empty_results_total = registry.counter("search_empty_results_total", "Số truy vấn không có kết quả.", ("kind",))
+errors_total = registry.counter("search_errors_total", "Số lỗi trong đường tìm kiếm.", ("stage",))
+candidates = registry.histogram(
+    "search_candidates", "Số địa điểm được tính điểm (có ít nhất một term chung) mỗi truy vấn.", COUNT_BUCKETS
+)
+resolved_terms_total = registry.counter(
+    "search_resolved_terms_total", "Số token ngoài từ vựng của truy vấn được phân giải thành term.", ("method",)
+)
+slow_queries_total = registry.counter("search_slow_queries_total", "Số truy vấn chậm hơn SLOW_QUERY_THRESHOLD_MS.")
+
+
+class _Trace:
+    """Thời gian các bước của một truy vấn, dùng cho slow-query log."""
+
+    __slots__ = ('name', 'attributes', 'spans', 'start')
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.spans = {}
+        self.start = time.perf_counter()
+
+
+_current_trace = contextvars.ContextVar("search_trace", default=None)
+
+
+class _NoopContext:
+    """Context manager không làm gì (dùng khi tắt metrics để gần như không tốn chi phí)."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopContext()
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        stage_seconds.observe(elapsed, stage=self.stage)
+        if exc_type is not None:
+            errors_total.inc(stage=self.stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans[self.stage] = trace.spans.get(self.stage, 0.0) + elapsed
+        return False
+
+
+def span(stage: str):
+    """
+    Đo thời gian một bước: with span('scoring'): ...
+    Ghi vào histogram search_stage_seconds{stage=...} và vào trace của truy vấn hiện tại (nếu có).
+    Lỗi thoát khỏi khối with được đếm vào search_errors_total{stage=...}.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Span(stage)
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Bao quanh một truy vấn. Khi kết thúc, thời gian toàn bộ được ghi vào stage '<name>', và nếu chậm
+    hơn SLOW_QUERY_THRESHOLD_MS thì (theo tỉ lệ SLOW_QUERY_SAMPLE_RATE) ghi một dòng JSON gồm
+    thời gian từng bước vào logger 'app.search.slow_query'.
+    """
+    if not METRICS_ENABLED:
+        yield None
+        return
+    current = _Trace(name, attributes)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        elapsed = time.perf_counter() - current.start
+        stage_seconds.observe(elapsed, stage=name)
+        if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+            slow_queries_total.inc()
+            if random.random() < SLOW_QUERY_SAMPLE_RATE:
+                slow_query_logger.warning(json.dumps({
+                    'trace': name,
+                    'total_ms': round(elapsed * 1000, 3),
+                    'spans_ms': {stage: round(seconds * 1000, 3) for stage, seconds in current.spans.items()},
+                    **current.attributes,
+                }, ensure_ascii=False, default=str))
+
+
+def inc(counter: Counter, amount: float = 1, **labels):
+    """Tăng bộ đếm nếu metrics đang bật."""
+    if METRICS_ENABLED:
+        counter.inc(amount, **labels)
+
+
+def observe(histogram: Histogram, value: float, **labels):
+    """Ghi một giá trị vào histogram nếu metrics đang bật."""
+    if METRICS_ENABLED:
+        histogram.observe(value, **labels)
+
+
+def render_metrics() -> str:
+    return registry.render()
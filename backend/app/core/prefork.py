@@ -0,0 +1,215 @@
+# backend/app/core/prefork.py
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger("app.prefork")
+
+
+def read_memory_usage(pid: int) -> dict:
+    """
+    Bộ nhớ của tiến trình pid (kB) từ /proc/<pid>/smaps_rollup:
+    - rss: toàn bộ trang đang nằm trong RAM (kể cả trang dùng chung với tiến trình khác).
+    - shared: trang dùng chung (Shared_Clean + Shared_Dirty), vd: model tải ở master trước khi fork.
+    - private: trang chỉ tiến trình này dùng (Private_Clean + Private_Dirty).
+    - pss: RSS chia đều phần dùng chung cho các tiến trình; tổng PSS là bộ nhớ thực của cả nhóm.
+    Trả về None nếu không đọc được (không phải Linux, tiến trình đã thoát...).
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return None
+    return {
+        'rss_kb': fields.get('Rss', 0),
+        'shared_kb': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'private_kb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'pss_kb': fields.get('Pss', 0),
+    }
+
+
+def create_listen_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Socket lắng nghe tạo ở master; các worker kế thừa qua fork và cùng accept trên socket này."""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """
+    Tiến trình master quản lý num_workers tiến trình worker được fork từ nó.
+    Nơi gọi tải model/tokenizer trong master trước khi gọi run() (nên gọi gc.disable() từ đầu để
+    không tạo "lỗ" trong các trang bộ nhớ); run() gọi gc.freeze() rồi fork, nên các worker dùng chung
+    các trang đó theo copy-on-write và GC trong worker không ghi vào các object của master.
+    - serve(worker_id) chạy trong tiến trình con (vd: uvicorn trên socket chung), trả về khi worker dừng.
+    - Worker thoát ngoài ý muốn được khởi động lại; worker chết ngay sau khi khởi động (< min_uptime giây)
+      được khởi động lại với độ trễ tăng dần (tối đa max_restart_delay) để tránh vòng lặp crash.
+    - SIGTERM/SIGINT: gửi SIGTERM cho các worker, chờ tối đa shutdown_timeout giây rồi SIGKILL.
+    - Định kỳ (memory_report_interval giây, 0 = chỉ khi khởi động) ghi log RSS/dùng chung/riêng của
+      từng tiến trình (xem read_memory_usage).
+    """
+
+    def __init__(self, num_workers: int, serve, shutdown_timeout: float = 30.0,
+                 memory_report_interval: float = 300.0, min_uptime: float = 5.0,
+                 max_restart_delay: float = 30.0):
+        self.num_workers = num_workers
+        self.serve = serve
+        self.shutdown_timeout = shutdown_timeout
+        self.memory_report_interval = memory_report_interval
+        self.min_uptime = min_uptime
+        self.max_restart_delay = max_restart_delay
+        self.workers = {} # pid -> (worker_id, thời điểm khởi động)
+        self.restarts = 0
+        self._restart_delays = {} # worker_id -> độ trễ lần khởi động lại gần nhất
+        self._pending_restarts = {} # worker_id -> thời điểm sẽ khởi động lại
+        self._stopping = False
+
+    # --- Tiến trình con ---
+
+    def _spawn(self, worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                gc.enable()
+                self.serve(worker_id)
+            except BaseException:
+                logger.exception("Worker %d lỗi", worker_id)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.workers[pid] = (worker_id, time.monotonic())
+        logger.info("Đã khởi động worker %d (pid %d)", worker_id, pid)
+
+    # --- Giám sát ---
+
+    def _handle_stop_signal(self, signum, frame):
+        self._stopping = True
+
+    def _reap(self):
+        """Thu các worker đã thoát và lên lịch khởi động lại."""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker_id, started = self.workers.pop(pid, (None, None))
+            if worker_id is None or self._stopping:
+                continue
+            uptime = time.monotonic() - started
+            if uptime < self.min_uptime:
+                delay = min(self.max_restart_delay, max(1.0, self._restart_delays.get(worker_id, 0.0) * 2))
+            else:
+                delay = 0.0
+            self._restart_delays[worker_id] = delay
+            self._pending_restarts[worker_id] = time.monotonic() + delay
+            logger.warning("Worker %d (pid %d) đã thoát (%s) sau %.1fs, khởi động lại sau %.1fs",
+                           worker_id, pid, self._describe_status(status), uptime, delay)
+
+    @staticmethod
+    def _describe_status(status: int) -> str:
+        if os.WIFSIGNALED(status):
+            return f"tín hiệu {os.WTERMSIG(status)}"
+        return f"mã {os.WEXITSTATUS(status)}"
+
+    def _restart_due_workers(self):
+        now = time.monotonic()
+        for worker_id, due in list(self._pending_restarts.items()):
+            if due <= now:
+                del self._pending_restarts[worker_id]
+                self.restarts += 1
+                self._spawn(worker_id)
+
+    def memory_report(self) -> list:
+        """Bộ nhớ của master và từng worker: list các dict (role, pid, *_kb)."""
+        processes = [('master', os.getpid())]
+        processes += [(f"worker-{worker_id}", pid) for pid, (worker_id, _) in sorted(self.workers.items())]
+        report = []
+        for role, pid in processes:
+            usage = read_memory_usage(pid)
+            if usage is not None:
+                report.append({'role': role, 'pid': pid, **usage})
+        return report
+
+    def log_memory_report(self):
+        report = self.memory_report()
+        if not report:
+            logger.info("Không đọc được /proc/<pid>/smaps_rollup, bỏ qua báo cáo bộ nhớ.")
+            return
+        lines = [f"{'tiến trình':<12}{'pid':>8}{'RSS MB':>10}{'dùng chung MB':>15}{'riêng MB':>10}{'PSS MB':>10}"]
+        for item in report:
+            lines.append(
+                f"{item['role']:<12}{item['pid']:>8}{item['rss_kb'] / 1024:>10.1f}{item['shared_kb'] / 1024:>15.1f}"
+                f"{item['private_kb'] / 1024:>10.1f}{item['pss_kb'] / 1024:>10.1f}"
+            )
+        total_rss = sum(item['rss_kb'] for item in report) / 1024
+        total_pss = sum(item['pss_kb'] for item in report) / 1024
+        lines.append(f"Tổng RSS {total_rss:.1f} MB, tổng PSS (bộ nhớ thực) {total_pss:.1f} MB, "
+                     f"{len(self.workers)} worker, {self.restarts} lần khởi động lại")
+        logger.info("Bộ nhớ các tiến trình:\n%s", "\n".join(lines))
+
+    def _shutdown(self):
+        logger.info("Đang dừng %d worker...", len(self.workers))
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning("Worker pid %d không dừng sau %.0fs, gửi SIGKILL", pid, self.shutdown_timeout)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.workers.pop(pid, None)
+
+    def run(self) -> int:
+        """Fork các worker và giám sát cho tới khi nhận SIGTERM/SIGINT."""
+        # Đưa mọi object đã tải vào thế hệ "permanent" của GC: worker không quét (ghi) vào chúng nữa
+        gc.collect()
+        gc.freeze()
+        signal.signal(signal.SIGTERM, self._handle_stop_signal)
+        signal.signal(signal.SIGINT, self._handle_stop_signal)
+
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        gc.enable()
+
+        startup_report_at = time.monotonic() + 5.0 # Đợi worker khởi động xong rồi mới đo
+        next_report_at = None
+        while not self._stopping:
+            self._reap()
+            self._restart_due_workers()
+            now = time.monotonic()
+            if startup_report_at is not None and now >= startup_report_at:
+                startup_report_at = None
+                self.log_memory_report()
+                if self.memory_report_interval > 0:
+                    next_report_at = now + self.memory_report_interval
+            elif next_report_at is not None and now >= next_report_at:
+                self.log_memory_report()
+                next_report_at = now + self.memory_report_interval
+            time.sleep(0.2)
+
+        self._shutdown()
+        return 0
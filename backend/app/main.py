@@ -0,0 +1,41 @@
+# backend/app/main.py
+import time
+
+_import_start = time.perf_counter()
+
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from app.api.search_api import router as search_router, metrics_router
+from app.core import metrics
+from app.core.config import SEARCH_WORKERS, SEARCH_MAX_PENDING
+from app.services import warmup
+from app.services.async_search import AsyncSearchExecutor
+
+# Thời gian import ứng dụng (FastAPI, các router và service; model chưa được tải ở bước này)
+warmup.startup_state.record('import_app', time.perf_counter() - _import_start)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Thread pool cho phần xử lý tốn CPU, tạo khi server khởi động (sau khi fork nếu chạy nhiều worker)
+    app.state.search_executor = AsyncSearchExecutor(max_workers=SEARCH_WORKERS, max_pending=SEARCH_MAX_PENDING)
+    # Tải model/tokenizer và chạy truy vấn mẫu (mặc định trên thread nền, xem STARTUP_WARMUP)
+    warmup.start()
+    yield
+    app.state.search_executor.shutdown()
+
+
+app = FastAPI(title="DATN Search API", lifespan=lifespan)
+app.include_router(search_router)
+app.include_router(metrics_router)
+
+
+def _search_executor_metrics() -> dict:
+    """Gauge cho /metrics: search_executor_<chỉ số> của thread pool tìm kiếm (rỗng trước khi server khởi động)."""
+    executor = getattr(app.state, 'search_executor', None)
+    return executor.stats() if executor is not None else {}
+
+
+metrics.registry.register_collector('search_executor', _search_executor_metrics)
@@ -0,0 +1,8 @@
+# backend/app/models/dia_danh_tag.py
+# Bảng dia_danh_tag: quan hệ nhiều-nhiều giữa dia_danh và tag.
+
+TABLE_NAME = 'dia_danh_tag'
+LOCATION_ID_COLUMN = 'id_dia_diem'
+TAG_ID_COLUMN = 'id_tag'
+
+SELECT_ALL_QUERY = f"SELECT {LOCATION_ID_COLUMN}, {TAG_ID_COLUMN} FROM {TABLE_NAME}"
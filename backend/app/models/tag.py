@@ -0,0 +1,8 @@
+# backend/app/models/tag.py
+# Bảng tag: danh sách tag (nhãn) có thể gán cho địa điểm.
+
+TABLE_NAME = 'tag'
+ID_COLUMN = 'id_tag'
+NAME_COLUMN = 'ten_tag'
+
+SELECT_ALL_QUERY = f"SELECT {ID_COLUMN}, {NAME_COLUMN} FROM {TABLE_NAME}"
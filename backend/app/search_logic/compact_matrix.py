@@ -0,0 +1,153 @@
+# backend/app/search_logic/compact_matrix.py
+# Ma trận TF-IDF thưa lưu dạng gọn để giảm bộ nhớ và băng thông khi tính điểm:
+# - 'float32': trọng số float32 (một nửa float64).
+# - 'int8': trọng số lượng tử hóa int8 với một hệ số scale float32 cho mỗi dòng (địa điểm):
+#   w ≈ q * row_scale[dòng], q trong [-127, 127]. Vì scale là hằng số của dòng nên nó được nhân
+#   sau khi cộng điểm: score(dòng) = row_scale[dòng] * Σ q * trọng số truy vấn.
+# Chỉ số (cột của CSR, dòng của CSC) dùng uint16 khi kích thước cho phép, ngược lại int32; scipy
+# không nhận chỉ số uint16 nên dạng gọn không phải là ma trận scipy: bước tính điểm trên posting list
+# của TFIDFEngine đọc thẳng các mảng, các thao tác khác lấy các dòng đã giải lượng tử (float64, scipy).
+import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix
+
+STORAGE_TYPES = ('float64', 'float32', 'int8')
+INT8_MAX = 127
+
+
+def index_dtype(max_value: int) -> np.dtype:
+    """uint16 nếu mọi chỉ số < 65536, ngược lại int32."""
+    return np.dtype(np.uint16) if max_value <= np.iinfo(np.uint16).max + 1 else np.dtype(np.int32)
+
+
+def quantize_rows(matrix: csr_matrix, storage: str):
+    """
+    Trọng số của matrix (CSR, float64) ở dạng storage. Trả về (data, row_scale); row_scale là
+    None trừ khi storage='int8' (scale của dòng = |w| lớn nhất / 127, dòng rỗng có scale 0).
+    """
+    if storage == 'float32':
+        return matrix.data.astype(np.float32), None
+    if storage != 'int8':
+        raise ValueError(f"Kiểu lưu trữ không được hỗ trợ: {storage}")
+    lengths = np.diff(matrix.indptr)
+    row_max = np.zeros(matrix.shape[0], dtype=np.float64)
+    nonempty = lengths > 0
+    row_max[nonempty] = np.maximum.reduceat(np.abs(matrix.data), matrix.indptr[:-1][nonempty])
+    row_scale = (row_max / INT8_MAX).astype(np.float32)
+    element_scale = np.repeat(row_scale.astype(np.float64), lengths)
+    quantized = np.zeros(matrix.data.shape, dtype=np.int8)
+    valid = element_scale > 0
+    quantized[valid] = np.clip(np.rint(matrix.data[valid] / element_scale[valid]), -INT8_MAX, INT8_MAX)
+    return quantized, row_scale
+
+
+class CompactMatrix:
+    """
+    Ma trận thưa dạng nén (CSR theo địa điểm hoặc CSC theo term) với dữ liệu float32/int8 và
+    chỉ số uint16/int32. row_scale (int8): scale theo dòng (địa điểm), với cả hai dạng.
+    Cung cấp indptr/indices/data/shape/nnz như ma trận scipy cho bước tính điểm, và:
+    - rows(): các dòng đã chọn dạng scipy CSR float64 (đã giải lượng tử), chỉ dùng với CSR.
+    - dot_rows(): tích vô hướng của các dòng với một vector dày, không giải lượng tử cả ma trận.
+    - to_scipy(): toàn bộ ma trận dạng scipy float64 (tạo bản sao).
+    """
+
+    def __init__(self, fmt: str, data: np.ndarray, indices: np.ndarray, indptr: np.ndarray, shape: tuple,
+                 row_scale: np.ndarray = None):
+        if fmt not in ('csr', 'csc'):
+            raise ValueError(f"Định dạng không hợp lệ: {fmt}")
+        self.format = fmt
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+        self.row_scale = row_scale
+
+    @classmethod
+    def from_csr(cls, matrix: csr_matrix, storage: str) -> tuple:
+        """(CSR gọn, CSC gọn) của một ma trận CSR float64 đã sort_indices."""
+        data, row_scale = quantize_rows(matrix, storage)
+        compact_csr = cls('csr', data, matrix.indices.astype(index_dtype(matrix.shape[1])),
+                          matrix.indptr.astype(np.int32 if matrix.nnz < 2**31 else np.int64),
+                          matrix.shape, row_scale)
+        # CSC của chính dữ liệu đã lượng tử: cột j là posting list của term j
+        # (data là vị trí + 1 để không có phần tử 0 nào bị bỏ khi chuyển dạng)
+        transposed = csr_matrix(
+            (np.arange(1, matrix.nnz + 1), matrix.indices, matrix.indptr), shape=matrix.shape
+        ).tocsc()
+        transposed.sort_indices()
+        compact_csc = cls('csc', data[transposed.data - 1], transposed.indices.astype(index_dtype(matrix.shape[0])),
+                          transposed.indptr.astype(np.int32 if matrix.nnz < 2**31 else np.int64),
+                          matrix.shape, row_scale)
+        return compact_csr, compact_csc
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indptr[-1])
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.data.dtype
+
+    @property
+    def storage(self) -> str:
+        return self.data.dtype.name
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.data, self.indices, self.indptr]
+        if self.row_scale is not None:
+            arrays.append(self.row_scale)
+        return sum(array.nbytes for array in arrays)
+
+    def _values(self) -> np.ndarray:
+        """Mọi trọng số đã giải lượng tử (float64), theo thứ tự của data."""
+        values = self.data.astype(np.float64)
+        if self.row_scale is not None:
+            owners = self.indices if self.format == 'csc' else np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+            values *= self.row_scale[owners]
+        return values
+
+    def to_scipy(self):
+        """Bản float64 dạng scipy (csr_matrix hoặc csc_matrix)."""
+        matrix_class = csr_matrix if self.format == 'csr' else csc_matrix
+        return matrix_class(
+            (self._values(), self.indices.astype(np.int32), self.indptr.astype(np.int32 if self.nnz < 2**31 else np.int64)),
+            shape=self.shape
+        )
+
+    def rows(self, rows) -> csr_matrix:
+        """Các dòng rows (số nguyên, mảng hoặc slice) dạng scipy CSR float64."""
+        if self.format != 'csr':
+            raise ValueError("rows() chỉ dùng cho dạng CSR.")
+        rows = np.arange(self.shape[0])[rows]
+        single = rows.ndim == 0
+        rows = np.atleast_1d(rows)
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = (ends - starts).astype(np.int64)
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(int(lengths.sum())) + np.repeat(starts - offsets, lengths)
+        data = self.data[positions].astype(np.float64)
+        if self.row_scale is not None:
+            data *= np.repeat(self.row_scale[rows].astype(np.float64), lengths)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        return csr_matrix((data, self.indices[positions].astype(np.int32), indptr),
+                          shape=(1 if single else rows.size, self.shape[1]))
+
+    def __getitem__(self, rows) -> csr_matrix:
+        return self.rows(rows)
+
+    def dot_rows(self, rows: np.ndarray, vector: np.ndarray) -> np.ndarray:
+        """Tích vô hướng của các dòng rows (CSR) với vector dày (độ dài = số cột), dạng float64."""
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = (ends - starts).astype(np.int64)
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(int(lengths.sum())) + np.repeat(starts - offsets, lengths)
+        contributions = self.data[positions] * vector[self.indices[positions]]
+        scores = np.bincount(np.repeat(np.arange(rows.size), lengths), weights=contributions, minlength=rows.size)
+        if self.row_scale is not None:
+            scores *= self.row_scale[rows]
+        return scores
+
+
+def to_scipy(matrix):
+    """Ma trận scipy float64 từ một ma trận scipy hoặc CompactMatrix."""
+    return matrix.to_scipy() if isinstance(matrix, CompactMatrix) else matrix
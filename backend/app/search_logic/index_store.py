@@ -0,0 +1,217 @@
+# backend/app/search_logic/index_store.py
+# Định dạng lưu trữ model TF-IDF không dùng pickle, có thể memory-map (np.load(mmap_mode='r')).
+#
+# Một thư mục index gồm:
+#   manifest.json      - phiên bản định dạng, kích thước, dtype, tham số vectorizer, model_version
+#   csr_data.npy, csr_indices.npy, csr_indptr.npy   - ma trận TF-IDF dạng CSR (theo địa điểm)
+#   csc_data.npy, csc_indices.npy, csc_indptr.npy   - cùng ma trận dạng CSC (posting list theo term)
+#   idf.npy            - mảng IDF của vectorizer
+#   vocabulary.json    - list các term, phần tử thứ j là term của cột j
+#   location_ids.npy   - ID địa điểm tương ứng với từng dòng
+#   row_scale.npy      - (chỉ với storage='int8') scale float32 của từng dòng
+# manifest['storage'] cho biết dạng lưu trọng số: 'float64' (mặc định, ma trận scipy) hoặc dạng gọn
+# 'float32' / 'int8' (xem compact_matrix.CompactMatrix, chỉ số uint16 khi kích thước cho phép).
+# manifest.json được ghi sau cùng nên thư mục chỉ được coi là hợp lệ khi đã có manifest.
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix, csc_matrix
+
+from app.search_logic.compact_matrix import CompactMatrix, STORAGE_TYPES
+from app.search_logic.query_vectorizer import QueryVectorizer
+
+INDEX_FORMAT = "tfidf-mmap"
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+VOCABULARY_FILENAME = "vocabulary.json"
+
+# Các tham số của TfidfVectorizer cần để tái tạo phép biến đổi truy vấn
+_VECTORIZER_PARAM_NAMES = (
+    'lowercase', 'token_pattern', 'ngram_range', 'analyzer',
+    'norm', 'use_idf', 'smooth_idf', 'sublinear_tf', 'binary',
+)
+
+
+def _array_files(tfidf_matrix, postings, idf: np.ndarray, location_ids) -> dict:
+    """Các mảng numpy được ghi ra, theo tên file (không có đuôi .npy)."""
+    files = {
+        'csr_data': tfidf_matrix.data,
+        'csr_indices': tfidf_matrix.indices,
+        'csr_indptr': tfidf_matrix.indptr,
+        'csc_data': postings.data,
+        'csc_indices': postings.indices,
+        'csc_indptr': postings.indptr,
+        'idf': np.asarray(idf),
+        'location_ids': np.asarray(location_ids),
+    }
+    if getattr(tfidf_matrix, 'row_scale', None) is not None:
+        files['row_scale'] = tfidf_matrix.row_scale
+    return files
+
+
+def save_index(output_dir: str, vectorizer, tfidf_matrix, location_ids: list, storage: str = 'float64') -> dict:
+    """
+    Ghi vectorizer đã fit, ma trận TF-IDF và danh sách ID ra thư mục output_dir theo định dạng
+    memory-map. Ghi vào thư mục tạm rồi đổi tên để tiến trình đang đọc không thấy index dở dang.
+    storage: 'float64' (giữ nguyên), 'float32' hoặc 'int8' (lượng tử hóa theo dòng), xem compact_matrix.
+    Trả về manifest đã ghi.
+    """
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"storage phải là một trong {STORAGE_TYPES}")
+    tfidf_matrix = csr_matrix(tfidf_matrix)
+    tfidf_matrix.sort_indices()
+    if storage == 'float64':
+        postings = tfidf_matrix.tocsc()
+        postings.eliminate_zeros()
+        postings.sort_indices()
+    else:
+        tfidf_matrix = tfidf_matrix.copy() # Có thể là mảng memory-map chỉ đọc
+        tfidf_matrix.eliminate_zeros()
+        tfidf_matrix, postings = CompactMatrix.from_csr(tfidf_matrix, storage)
+
+    # Từ vựng theo thứ tự cột
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, column in vectorizer.vocabulary_.items():
+        terms[column] = term
+
+    tmp_dir = new_temp_directory(output_dir)
+
+    files = {}
+    digest = hashlib.sha256()
+    for name, array in _array_files(tfidf_matrix, postings, vectorizer.idf_, location_ids).items():
+        array = np.ascontiguousarray(array)
+        filename = f"{name}.npy"
+        np.save(os.path.join(tmp_dir, filename), array, allow_pickle=False)
+        digest.update(name.encode('utf-8'))
+        digest.update(array.tobytes())
+        files[name] = {'file': filename, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    vocabulary_bytes = json.dumps(terms, ensure_ascii=False).encode('utf-8')
+    with open(os.path.join(tmp_dir, VOCABULARY_FILENAME), 'wb') as f:
+        f.write(vocabulary_bytes)
+    digest.update(vocabulary_bytes)
+
+    vectorizer_params = {name: vectorizer.get_params()[name] for name in _VECTORIZER_PARAM_NAMES}
+    vectorizer_params['ngram_range'] = list(vectorizer_params['ngram_range'])
+    vectorizer_params['dtype'] = np.dtype(vectorizer.get_params()['dtype']).name
+
+    manifest = {
+        'format': INDEX_FORMAT,
+        'version': INDEX_FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'model_version': digest.hexdigest()[:16],
+        'shape': list(tfidf_matrix.shape),
+        'nnz': int(tfidf_matrix.nnz),
+        'storage': storage,
+        'vocabulary_file': VOCABULARY_FILENAME,
+        'files': files,
+        'vectorizer': vectorizer_params,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    replace_directory(tmp_dir, output_dir)
+    return manifest
+
+
+def new_temp_directory(output_dir: str) -> str:
+    """Thư mục tạm (rỗng) cạnh output_dir để ghi index trước khi đổi tên (xem replace_directory)."""
+    tmp_dir = f"{output_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def replace_directory(tmp_dir: str, output_dir: str):
+    """Thay thư mục cũ (nếu có) bằng thư mục tmp_dir đã ghi xong, để tiến trình đang đọc không thấy index dở dang."""
+    old_dir = f"{output_dir.rstrip(os.sep)}.old-{os.getpid()}"
+    if os.path.exists(output_dir):
+        os.rename(output_dir, old_dir)
+    os.rename(tmp_dir, output_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+
+def index_exists(index_dir: str) -> bool:
+    """Thư mục index có manifest hay chưa."""
+    return os.path.isfile(os.path.join(index_dir, MANIFEST_FILENAME))
+
+
+def read_manifest(index_dir: str) -> dict:
+    """Đọc và kiểm tra manifest của thư mục index."""
+    with open(os.path.join(index_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != INDEX_FORMAT:
+        raise ValueError(f"Định dạng index không hợp lệ: {manifest.get('format')}")
+    if manifest.get('version') != INDEX_FORMAT_VERSION:
+        raise ValueError(
+            f"Phiên bản index {manifest.get('version')} không được hỗ trợ (cần {INDEX_FORMAT_VERSION})"
+        )
+    return manifest
+
+
+def load_index(index_dir: str, mmap: bool = True) -> dict:
+    """
+    Tải index từ thư mục. Với mmap=True các mảng lớn được memory-map ở chế độ chỉ đọc,
+    nên việc tải gần như tức thời và nhiều worker cùng dùng chung page cache.
+    Trả về dict gồm: manifest, tfidf_matrix (CSR), postings (CSC), idf, vocabulary (dict term -> cột),
+    location_ids (list). Với storage dạng gọn, tfidf_matrix/postings là CompactMatrix.
+    """
+    manifest = read_manifest(index_dir)
+    mmap_mode = 'r' if mmap else None
+
+    arrays = {}
+    for name, info in manifest['files'].items():
+        array = np.load(os.path.join(index_dir, info['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+            raise ValueError(f"File {info['file']} không khớp với manifest.")
+        arrays[name] = array
+
+    with open(os.path.join(index_dir, manifest['vocabulary_file']), 'r', encoding='utf-8') as f:
+        terms = json.load(f)
+
+    shape = tuple(manifest['shape'])
+    if manifest.get('storage', 'float64') == 'float64':
+        tfidf_matrix = csr_matrix(
+            (arrays['csr_data'], arrays['csr_indices'], arrays['csr_indptr']), shape=shape, copy=False
+        )
+        postings = csc_matrix(
+            (arrays['csc_data'], arrays['csc_indices'], arrays['csc_indptr']), shape=shape, copy=False
+        )
+    else:
+        row_scale = arrays.get('row_scale')
+        tfidf_matrix = CompactMatrix('csr', arrays['csr_data'], arrays['csr_indices'], arrays['csr_indptr'],
+                                     shape, row_scale)
+        postings = CompactMatrix('csc', arrays['csc_data'], arrays['csc_indices'], arrays['csc_indptr'],
+                                 shape, row_scale)
+    return {
+        'manifest': manifest,
+        'tfidf_matrix': tfidf_matrix,
+        'postings': postings,
+        'idf': arrays['idf'],
+        'vocabulary': {term: column for column, term in enumerate(terms)},
+        'location_ids': arrays['location_ids'].tolist(),
+    }
+
+
+def build_query_vectorizer(manifest: dict, vocabulary: dict, idf: np.ndarray):
+    """QueryVectorizer (không cần sklearn) từ tham số trong manifest, từ vựng và IDF."""
+    return QueryVectorizer.from_params(manifest['vectorizer'], vocabulary, idf)
+
+
+def build_vectorizer(manifest: dict, vocabulary: dict, idf: np.ndarray):
+    """Tái tạo TfidfVectorizer đã fit từ tham số trong manifest, từ vựng và IDF."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    params = dict(manifest['vectorizer'])
+    params['ngram_range'] = tuple(params['ngram_range'])
+    params['dtype'] = np.dtype(params['dtype']).type
+    vectorizer = TfidfVectorizer(**params)
+    vectorizer.vocabulary_ = vocabulary
+    vectorizer.idf_ = np.asarray(idf)
+    return vectorizer
@@ -1,8 +1,10 @@
 # backend/app/search_logic/preprocessor.py
-import underthesea
 import json
 import os
-from app.core.config import SYNONYMS_PATH # Import đường dẫn từ config
+import re
+import unicodedata
+from functools import lru_cache
+from app.core.config import SYNONYMS_PATH, TOKENIZE_CACHE_SIZE # Import đường dẫn từ config
 
 synonyms_dict = {}
 try:
@@ -16,55 +18,140 @@ except Exception as e:
     print(f"Preprocessor Lỗi khi tải file từ đồng nghĩa: {e}")
 
 
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa Unicode (NFC), lowercase và gộp khoảng trắng."""
+    return " ".join(unicodedata.normalize('NFC', text).lower().split())
+
+
+def _syllables(phrase: str) -> list:
+    """Tách một cụm từ ('du lịch bụi' hoặc 'du_lịch_bụi') thành các âm tiết."""
+    return phrase.replace("_", " ").split()
+
+
+def _to_token(phrase: str) -> str:
+    """Dạng token giống lúc build model (underthesea format="text"): các âm tiết nối bằng '_'."""
+    return "_".join(_syllables(phrase))
+
+
+def synonym_key_token(phrase: str) -> str:
+    """
+    Dạng token một khối của một khóa synonyms.json ('check-in' -> 'check_in', 'view đẹp' -> 'view_đẹp'):
+    các chuỗi chữ/số nối bằng '_' để vectorizer đọc thành đúng một token. Dùng chung cho preprocess_query
+    và ma trận mở rộng từ đồng nghĩa (xem synonym_expansion).
+    """
+    return "_".join(re.findall(r"\w+", normalize_text(phrase)))
+
+
+class SynonymPhraseMatcher:
+    """
+    Từ điển đồng nghĩa được biên dịch một lần thành trie theo âm tiết.
+    expand() quét chuỗi âm tiết của truy vấn một lượt từ trái sang phải, tại mỗi vị trí lấy
+    cụm khóa dài nhất khớp được, nên không phụ thuộc vào cách underthesea gộp âm tiết thành từ
+    (vd: 'du lịch bụi' khớp dù được tách thành ['du lịch', 'bụi']).
+    """
+
+    _SYNONYMS = object() # Đánh dấu nút kết thúc một khóa trong trie
+
+    def __init__(self, synonyms: dict):
+        self._root = {}
+        self.max_phrase_length = 0
+        for key, values in synonyms.items():
+            syllables = _syllables(normalize_text(key))
+            if not syllables:
+                continue
+            node = self._root
+            for syllable in syllables:
+                node = node.setdefault(syllable, {})
+            node[self._SYNONYMS] = (
+                synonym_key_token(key), tuple(dict.fromkeys(_to_token(normalize_text(v)) for v in values))
+            )
+            self.max_phrase_length = max(self.max_phrase_length, len(syllables))
+
+    def expand(self, syllables: list) -> list:
+        """Trả về list các token đồng nghĩa (theo thứ tự xuất hiện) của các cụm khóa tìm thấy."""
+        return [token for _, synonyms in self.match(syllables) for token in synonyms]
+
+    def match(self, syllables: list) -> list:
+        """Các cụm khóa tìm thấy (theo thứ tự xuất hiện), dạng (synonym_key_token của khóa, các token đồng nghĩa)."""
+        matches = []
+        position = 0
+        while position < len(syllables):
+            node = self._root
+            match_end, match_synonyms = position, None
+            cursor = position
+            while cursor < len(syllables):
+                node = node.get(syllables[cursor])
+                if node is None:
+                    break
+                cursor += 1
+                if self._SYNONYMS in node:
+                    match_end, match_synonyms = cursor, node[self._SYNONYMS]
+            if match_synonyms is None:
+                position += 1
+            else:
+                matches.append(match_synonyms)
+                position = match_end
+        return matches
+
+
+synonym_matcher = SynonymPhraseMatcher(synonyms_dict)
+
+
+def _word_tokenize(text: str, **kwargs):
+    """
+    underthesea.word_tokenize, import ở lần gọi đầu tiên (import underthesea tốn vài trăm ms,
+    lần tách từ đầu tiên còn tải model CRF) để import module này không làm chậm khởi động.
+    Thread warm-up (app.services.warmup) gọi trước bằng các truy vấn mẫu.
+    """
+    import underthesea
+    return underthesea.word_tokenize(text, **kwargs)
+
+
+@lru_cache(maxsize=TOKENIZE_CACHE_SIZE)
+def _tokenize(normalized_text: str) -> tuple:
+    """Tách từ bằng underthesea, có nhớ kết quả cho các truy vấn gần đây."""
+    return tuple(_to_token(token) for token in _word_tokenize(normalized_text))
+
+
+def preprocess_document(text) -> str:
+    """
+    Tiền xử lý mô tả địa điểm giống hệt lúc build model: chuẩn hóa Unicode, lowercase và
+    tách từ (underthesea format="text", token dạng 'du_lịch'). Dùng chung cho
+    build_tfidf_model.py và khi cập nhật từng địa điểm vào TFIDFEngine.
+    """
+    if text is None:
+        return ""
+    text = unicodedata.normalize('NFC', str(text)).lower()
+    return _word_tokenize(text, format="text")
+
+
 def preprocess_query(query_text: str) -> dict: # Thay đổi kiểu trả về để có cả token cho TF-IDF và keyword cho Tag
     """
-    Tiền xử lý văn bản truy vấn: lowercase, tách từ, mở rộng từ đồng nghĩa.
+    Tiền xử lý văn bản truy vấn: chuẩn hóa, tách từ, mở rộng từ đồng nghĩa.
     Trả về một dictionary chứa:
     - 'tokens_for_tfidf': chuỗi token đã xử lý, nối bằng dấu cách, cho TF-IDF.
+    - 'query_tokens': chuỗi token gốc cùng dạng token một khối của các khóa đồng nghĩa tìm thấy (vd: 'view_đẹp'
+      khi câu có 'view đẹp'), chưa mở rộng; dùng khi TFIDFEngine tự mở rộng trên vector truy vấn.
     - 'keywords_for_tags': list các token/keyword gốc và mở rộng, cho Tag Engine.
+    Thứ tự token là xác định: token gốc theo thứ tự trong câu, sau đó là các từ đồng nghĩa.
     """
     if not isinstance(query_text, str) or not query_text.strip():
-        return {'tokens_for_tfidf': "", 'keywords_for_tags': []}
-
-    normalized_text = query_text.lower()
-    # Tách từ bằng underthesea
-    original_tokens = underthesea.word_tokenize(normalized_text)
-
-    expanded_tokens_set = set() # Dùng set để tránh trùng lặp từ khóa
-
-    for token in original_tokens:
-        expanded_tokens_set.add(token) # Thêm từ gốc
-        # Kiểm tra xem token (hoặc dạng có gạch nối của nó nếu underthesea tạo ra) có trong từ điển không
-        # underthesea có thể trả về 'du_lịch_bụi', trong khi key có thể là 'du lịch bụi'
-        # Nên chúng ta có thể cần chuẩn hóa token trước khi tra cứu, hoặc làm từ điển linh hoạt hơn
-        # Ví dụ đơn giản:
-        processed_token_for_lookup = token.replace("_", " ") # Chuyển 'du_lịch_bụi' thành 'du lịch bụi'
-
-        if token in synonyms_dict:
-            for synonym in synonyms_dict[token]:
-                expanded_tokens_set.add(synonym.replace(" ", "_")) # Thêm lại dạng có gạch nối nếu cần
-        elif processed_token_for_lookup in synonyms_dict:
-            for synonym in synonyms_dict[processed_token_for_lookup]:
-                expanded_tokens_set.add(synonym.replace(" ", "_"))
-
-
-    # Chuỗi token cho TF-IDF (nối lại bằng dấu cách)
-    # TF-IDF vectorizer sẽ tự tách từ theo dấu cách hoặc tokenizer riêng của nó
-    # Quan trọng là các từ đồng nghĩa phải được đưa vào đây
-    # Nên nối lại các token từ expanded_tokens_set
-    tokens_for_tfidf_str = " ".join(list(expanded_tokens_set))
-
-    # List keyword cho Tag Engine (bao gồm cả từ gốc và từ đồng nghĩa đã được tách từ)
-    # Ở đây ta có thể muốn các từ đơn lẻ hơn là cụm từ ghép
-    # Hoặc giữ lại các cụm từ nếu tags của bạn cũng là cụm từ
-    keywords_for_tags_list = list(expanded_tokens_set) 
-
-    print(f"Preprocessor: Query gốc: '{query_text}'")
-    print(f"Preprocessor: Token gốc: {original_tokens}")
-    print(f"Preprocessor: Tokens mở rộng (cho TF-IDF): '{tokens_for_tfidf_str}'")
-    print(f"Preprocessor: Keywords mở rộng (cho Tags): {keywords_for_tags_list}")
+        return {'tokens_for_tfidf': "", 'query_tokens': "", 'keywords_for_tags': []}
+
+    normalized_text = normalize_text(query_text)
+    # Tách từ bằng underthesea (token có dạng 'du_lịch' giống lúc build model)
+    original_tokens = _tokenize(normalized_text)
+
+    # Mở rộng từ đồng nghĩa trong một lượt quét chuỗi âm tiết
+    syllables = [syllable for token in original_tokens for syllable in _syllables(token)]
+    matches = synonym_matcher.match(syllables)
+    expanded_tokens = list(dict.fromkeys(
+        original_tokens + tuple(token for _, synonyms in matches for token in synonyms)
+    ))
+    query_tokens = list(dict.fromkeys(original_tokens + tuple(key for key, _ in matches)))
 
     return {
-        'tokens_for_tfidf': tokens_for_tfidf_str,
-        'keywords_for_tags': keywords_for_tags_list
+        'tokens_for_tfidf': " ".join(expanded_tokens),
+        'query_tokens': " ".join(query_tokens),
+        'keywords_for_tags': expanded_tokens
     }
@@ -0,0 +1,156 @@
+# backend/app/search_logic/query_vectorizer.py
+import math
+import re
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class QueryVectorizer:
+    """
+    Phép biến đổi truy vấn của TfidfVectorizer đã fit, không cần sklearn trên đường tìm kiếm:
+    tách token bằng token_pattern, tra từ vựng, đếm tần suất, nhân IDF và chuẩn hóa.
+    Kết quả giống hệt TfidfVectorizer.transform (cùng cột, cùng trọng số, cùng thứ tự cộng khi
+    chuẩn hóa) nhưng dạng hai mảng (indices tăng dần, weights) đưa thẳng vào bước tính điểm,
+    không qua kiểm tra đầu vào và không tạo ma trận thưa cho một chuỗi ngắn.
+    Chỉ hỗ trợ cấu hình mà build_tfidf_model.py dùng: analyzer='word', ngram_range=(1, 1),
+    không stop_words/strip_accents/preprocessor/tokenizer tùy biến.
+    """
+
+    def __init__(self, vocabulary: dict, idf: np.ndarray, token_pattern: str = r"(?u)\b\w\w+\b",
+                 lowercase: bool = True, norm: str = 'l2', use_idf: bool = True,
+                 sublinear_tf: bool = False, binary: bool = False, dtype=np.float64):
+        if norm not in ('l1', 'l2', None):
+            raise ValueError(f"norm không được hỗ trợ: {norm}")
+        self.vocabulary = vocabulary
+        self.dtype = np.dtype(dtype)
+        # IDF giữ đúng dtype lúc fit (float64 với model hiện tại) để trọng số giống hệt sklearn
+        self.idf = np.asarray(idf) if use_idf else None
+        self.token_pattern = token_pattern
+        self._token_regex = re.compile(token_pattern)
+        self.lowercase = lowercase
+        self.norm = norm
+        self.sublinear_tf = sublinear_tf
+        self.binary = binary
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer) -> "QueryVectorizer":
+        """Xuất từ một TfidfVectorizer đã fit. Raise ValueError nếu cấu hình không được hỗ trợ."""
+        params = vectorizer.get_params()
+        unsupported = {
+            'analyzer': params['analyzer'] != 'word',
+            'ngram_range': tuple(params['ngram_range']) != (1, 1),
+            'stop_words': params['stop_words'] is not None,
+            'strip_accents': params['strip_accents'] is not None,
+            'preprocessor': params['preprocessor'] is not None,
+            'tokenizer': params['tokenizer'] is not None,
+        }
+        if any(unsupported.values()):
+            names = [name for name, flag in unsupported.items() if flag]
+            raise ValueError(f"QueryVectorizer không hỗ trợ các tham số: {', '.join(names)}")
+        return cls(
+            vectorizer.vocabulary_, vectorizer.idf_ if params['use_idf'] else None,
+            token_pattern=params['token_pattern'], lowercase=params['lowercase'], norm=params['norm'],
+            use_idf=params['use_idf'], sublinear_tf=params['sublinear_tf'], binary=params['binary'],
+            dtype=params['dtype'],
+        )
+
+    @classmethod
+    def from_params(cls, params: dict, vocabulary: dict, idf: np.ndarray) -> "QueryVectorizer":
+        """Tạo từ tham số vectorizer đã lưu trong manifest của index (xem index_store)."""
+        if params.get('analyzer', 'word') != 'word' or tuple(params.get('ngram_range', (1, 1))) != (1, 1):
+            raise ValueError("QueryVectorizer chỉ hỗ trợ analyzer='word', ngram_range=(1, 1).")
+        return cls(
+            vocabulary, idf, token_pattern=params['token_pattern'], lowercase=params['lowercase'],
+            norm=params['norm'], use_idf=params['use_idf'], sublinear_tf=params['sublinear_tf'],
+            binary=params.get('binary', False), dtype=params['dtype'],
+        )
+
+    @property
+    def vocabulary_size(self) -> int:
+        return len(self.vocabulary)
+
+    def analyze(self, text: str) -> list:
+        """Danh sách token (kể cả token ngoài từ vựng), giống build_analyzer() của sklearn."""
+        if self.lowercase:
+            text = text.lower()
+        return self._token_regex.findall(text)
+
+    def transform(self, text: str):
+        """
+        Vector TF-IDF của một chuỗi đã tách từ, dạng (indices int32 tăng dần, weights).
+        Chuỗi không có token nào trong từ vựng cho hai mảng rỗng.
+        """
+        indices, counts = self.term_counts(text)
+        if not indices.size:
+            return indices, counts
+        return indices, self.weight_counts(indices, counts)
+
+    def term_counts(self, text: str, extra_vocabulary: dict = None):
+        """
+        Tần suất các token trong từ vựng của một chuỗi đã tách từ, dạng (indices int32 tăng dần, counts)
+        (toàn 1 nếu binary). extra_vocabulary: {token: cột >= vocabulary_size} được đếm thêm, vd các khóa
+        đồng nghĩa không có trong từ vựng (xem SynonymExpansion).
+        """
+        vocabulary = self.vocabulary
+        counts = {}
+        for token in self.analyze(text or ""):
+            column = vocabulary.get(token)
+            if column is None and extra_vocabulary:
+                column = extra_vocabulary.get(token)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=self.dtype)
+
+        columns = sorted(counts)
+        indices = np.array(columns, dtype=np.int32)
+        if self.binary:
+            weights = np.ones(len(columns), dtype=self.dtype)
+        else:
+            weights = np.array([counts[column] for column in columns], dtype=self.dtype)
+        return indices, weights
+
+    def weight_counts(self, indices: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        Các bước của TfidfTransformer.transform: sublinear tf, nhân IDF, chuẩn hóa, trên tần suất weights
+        (có thể không nguyên, vd sau khi mở rộng từ đồng nghĩa) của các cột indices trong từ vựng.
+        Mảng weights có thể bị ghi đè.
+        """
+        if self.sublinear_tf:
+            np.log(weights, weights)
+            weights += 1.0
+        if self.idf is not None:
+            weights *= self.idf[indices]
+        if self.norm is not None:
+            # Làm giống sparsefuncs_fast của sklearn để kết quả giống từng bit: bình phương tính theo
+            # dtype của dữ liệu, cộng tuần tự bằng số thực 64 bit, phép chia thực hiện ở 64 bit
+            total = 0.0
+            if self.norm == 'l2':
+                for value in (weights * weights).tolist():
+                    total += value
+                total = math.sqrt(total)
+            else:
+                for value in np.abs(weights).tolist():
+                    total += value
+            if total != 0.0:
+                weights = (weights.astype(np.float64, copy=False) / total).astype(self.dtype, copy=False)
+        return weights
+
+    def transform_matrix(self, texts: list) -> csr_matrix:
+        """Ma trận TF-IDF (số chuỗi, từ vựng) dạng CSR cho nhiều chuỗi (dùng cho tìm kiếm theo lô, cập nhật index)."""
+        return self.stack_vectors([self.transform(text) for text in texts])
+
+    def stack_vectors(self, vectors: list) -> csr_matrix:
+        """Ma trận (số vector, từ vựng) dạng CSR từ các vector dạng (indices, weights) như kết quả của transform."""
+        indptr = [0]
+        all_indices, all_weights = [], []
+        for indices, weights in vectors:
+            all_indices.append(indices)
+            all_weights.append(weights)
+            indptr.append(indptr[-1] + indices.size)
+        indices = np.concatenate(all_indices) if all_indices else np.empty(0, dtype=np.int32)
+        weights = np.concatenate(all_weights) if all_weights else np.empty(0, dtype=self.dtype)
+        return csr_matrix(
+            (weights, indices, np.array(indptr, dtype=np.int32)), shape=(len(vectors), self.vocabulary_size)
+        )
@@ -0,0 +1,174 @@
+# backend/app/search_logic/ranker.py
+import numpy as np
+
+from app.search_logic.tfidf_engine import _select_top_k
+
+# Số phần tử tối thiểu được sắp xếp theo điểm mỗi lần mở rộng thứ tự (xem ScoreSignal._sort_until)
+_MIN_SORTED_BLOCK = 64
+
+
+class ScoreSignal:
+    """
+    Một tín hiệu xếp hạng (TF-IDF, tag...) ở dạng thưa: các dòng có điểm > 0 và điểm tương ứng.
+    Giữ hai thứ tự:
+    - Theo điểm giảm dần (dùng để duyệt tuần tự trong HybridRanker), hòa điểm thì dòng lớn hơn trước.
+      Chỉ sắp xếp phần đầu đang cần: HybridRanker thường dừng sớm sau vài khối nên không sort toàn bộ;
+      mỗi lần cần sâu hơn thì lấy thêm phần kế tiếp bằng argpartition (ít nhất gấp đôi phần đã có).
+    - Theo dòng tăng dần (tra điểm của một dòng bất kỳ bằng searchsorted).
+    """
+
+    def __init__(self, name: str, rows: np.ndarray, scores: np.ndarray):
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+        positive = scores > 0
+        rows, scores = rows[positive], scores[positive]
+
+        self.name = name
+        if rows.size > 1 and not np.all(rows[1:] > rows[:-1]):
+            by_row = np.argsort(rows, kind='stable')
+            rows, scores = rows[by_row], scores[by_row]
+        self._rows_by_row = rows
+        self._scores_by_row = scores
+        # Phần đầu đã sắp xếp theo điểm và phần còn lại (chưa sắp xếp, mọi điểm <= điểm cuối phần đầu)
+        self._rows_by_score = rows[:0]
+        self._scores_by_score = scores[:0]
+        self._rows_rest = rows
+        self._scores_rest = scores
+
+    def __len__(self):
+        return self._rows_by_row.size
+
+    def _sort_until(self, stop: int):
+        """Mở rộng phần đã sắp xếp theo điểm cho tới khi có ít nhất stop phần tử (hoặc hết)."""
+        sorted_count = self._rows_by_score.size
+        if stop <= sorted_count or not self._rows_rest.size:
+            return
+        rows, scores = self._rows_rest, self._scores_rest
+        count = max(stop, 2 * sorted_count, _MIN_SORTED_BLOCK) - sorted_count
+        if count < rows.size:
+            partitioned = np.argpartition(scores, -count)[-count:]
+            # Lấy cả các phần tử hòa điểm ở ngưỡng để phần đầu luôn là tiền tố đúng của thứ tự toàn bộ
+            taken = scores >= scores[partitioned].min()
+        else:
+            taken = np.ones(rows.size, dtype=bool)
+        head_rows, head_scores = rows[taken], scores[taken]
+        order = np.lexsort((-head_rows, -head_scores))
+        self._rows_by_score = np.concatenate([self._rows_by_score, head_rows[order]])
+        self._scores_by_score = np.concatenate([self._scores_by_score, head_scores[order]])
+        self._rows_rest, self._scores_rest = rows[~taken], scores[~taken]
+
+    @property
+    def max_score(self) -> float:
+        return self.bound_at(0)
+
+    def bound_at(self, depth: int) -> float:
+        """Cận trên điểm của mọi dòng chưa duyệt khi đã duyệt depth phần tử đầu."""
+        self._sort_until(depth + 1)
+        return float(self._scores_by_score[depth]) if depth < len(self) else 0.0
+
+    def block(self, start: int, stop: int):
+        """(rows, scores) ở các vị trí [start, stop) theo điểm giảm dần."""
+        self._sort_until(stop)
+        return self._rows_by_score[start:stop], self._scores_by_score[start:stop]
+
+    def lookup(self, rows: np.ndarray) -> np.ndarray:
+        """Điểm của các dòng rows (0 nếu dòng không có trong tín hiệu)."""
+        if len(self) == 0:
+            return np.zeros(len(rows), dtype=np.float64)
+        positions = np.searchsorted(self._rows_by_row, rows)
+        positions = np.minimum(positions, len(self) - 1)
+        found = self._rows_by_row[positions] == rows
+        return np.where(found, self._scores_by_row[positions], 0.0)
+
+
+class HybridRanker:
+    """
+    Kết hợp nhiều tín hiệu: final_score = sum(weight_i * score_i), rồi lấy top-k.
+
+    Không tính mọi tín hiệu cho mọi địa điểm: duyệt các tín hiệu song song theo điểm giảm dần
+    từng khối (Threshold Algorithm) và dừng sớm khi điểm thứ k đã lớn hơn cận trên
+    sum(weight_i * bound_i) của mọi địa điểm chưa gặp. Với ứng viên mới gặp, cận trên
+    (điểm trong khối + cận của các tín hiệu còn lại, kiểu MaxScore) được so với điểm thứ k
+    trước khi tra điểm đầy đủ, nên ứng viên không thể vào top-k bị bỏ qua ngay.
+    Kết quả giống hệt việc tính điểm toàn bộ rồi sắp xếp (kể cả thứ tự khi bằng điểm).
+    """
+
+    def __init__(self, weights: dict, block_size: int = 64):
+        self.weights = {name: float(weight) for name, weight in weights.items()}
+        self.block_size = block_size
+        self.last_stats = {}
+
+    def rank(self, signals: list, k: int) -> list:
+        """
+        signals: list các ScoreSignal (tín hiệu không có trong weights bị bỏ qua).
+        Trả về list dict {'row', 'score', 'signals': {tên: điểm gốc}} theo điểm giảm dần.
+        """
+        active = [signal for signal in signals if self.weights.get(signal.name, 0.0) > 0 and len(signal)]
+        if k <= 0 or not active:
+            self.last_stats = {'rounds': 0, 'candidates': 0, 'scored': 0}
+            return []
+        weights = np.array([self.weights[signal.name] for signal in active])
+
+        top_rows = np.empty(0, dtype=np.int64)
+        top_scores = np.empty(0, dtype=np.float64)
+        seen = np.empty(0, dtype=np.int64) # Đã sắp xếp
+        depth, rounds, scored = 0, 0, 0
+        block_size = max(self.block_size, k)
+
+        while True:
+            rounds += 1
+            bounds = np.array([signal.bound_at(depth) for signal in active])
+            stop = depth + block_size
+
+            # Ứng viên mới trong khối của mỗi tín hiệu và cận trên của chúng
+            block_rows = [signal.block(depth, stop) for signal in active]
+            new_rows = np.unique(np.concatenate([rows for rows, _ in block_rows]))
+            new_rows = new_rows[~np.isin(new_rows, seen, assume_unique=True)]
+            if new_rows.size:
+                upper = np.zeros(new_rows.size)
+                for weight, bound, (rows, scores) in zip(weights, bounds, block_rows):
+                    in_block = np.zeros(new_rows.size, dtype=bool)
+                    block_scores = np.zeros(new_rows.size)
+                    positions = np.searchsorted(new_rows, rows)
+                    valid = (positions < new_rows.size)
+                    valid[valid] = new_rows[positions[valid]] == rows[valid]
+                    in_block[positions[valid]] = True
+                    block_scores[positions[valid]] = scores[valid]
+                    upper += weight * np.where(in_block, block_scores, bound)
+                seen = np.union1d(seen, new_rows)
+
+                kth = top_scores[-1] if top_scores.size == k else -np.inf
+                candidates = new_rows[upper >= kth]
+                if candidates.size:
+                    totals = sum(weight * signal.lookup(candidates) for weight, signal in zip(weights, active))
+                    scored += candidates.size
+                    top_rows, top_scores = _select_top_k(
+                        np.concatenate([top_rows, candidates]), np.concatenate([top_scores, totals]), k
+                    )
+
+            depth = stop
+            threshold = float(np.dot(weights, [signal.bound_at(depth) for signal in active]))
+            exhausted = all(depth >= len(signal) for signal in active)
+            if exhausted or (top_scores.size == k and top_scores[-1] > threshold):
+                break
+
+        self.last_stats = {'rounds': rounds, 'candidates': int(seen.size), 'scored': scored}
+        results = []
+        for row, score in zip(top_rows.tolist(), top_scores.tolist()):
+            breakdown = {signal.name: float(signal.lookup(np.array([row]))[0]) for signal in active}
+            results.append({'row': row, 'score': score, 'signals': breakdown})
+        return results
+
+    def rank_exhaustive(self, signals: list, k: int) -> list:
+        """Cách tính trực tiếp (mọi tín hiệu cho mọi ứng viên rồi sắp xếp), dùng để kiểm tra rank()."""
+        active = [signal for signal in signals if self.weights.get(signal.name, 0.0) > 0 and len(signal)]
+        if k <= 0 or not active:
+            return []
+        rows = np.unique(np.concatenate([signal._rows_by_row for signal in active]))
+        totals = sum(self.weights[signal.name] * signal.lookup(rows) for signal in active)
+        top_rows, top_scores = _select_top_k(rows, totals, k)
+        return [
+            {'row': row, 'score': score,
+             'signals': {signal.name: float(signal.lookup(np.array([row]))[0]) for signal in active}}
+            for row, score in zip(top_rows.tolist(), top_scores.tolist())
+        ]
@@ -0,0 +1,308 @@
+# backend/app/search_logic/semantic_index.py
+# Chế độ tìm kiếm ngữ nghĩa (tùy chọn): chiếu ma trận TF-IDF xuống không gian LSA (TruncatedSVD) thành
+# các vector float32 dày, rồi tìm láng giềng gần đúng bằng IVF (k-means cầu làm bộ lượng tử hóa thô):
+# truy vấn chỉ được so với các vector thuộc n_probe cụm có tâm gần nó nhất thay vì toàn bộ địa điểm.
+# Hai địa điểm mô tả cùng một thứ bằng các từ khác nhau vẫn gần nhau trong không gian LSA.
+#
+# Một thư mục index gồm (do build_tfidf_model.py --semantic hoặc script/build_semantic_index.py tạo ra):
+#   manifest.json      - phiên bản định dạng, model_version của index TF-IDF gốc, số chiều, số cụm, recall đo được
+#   projection.npy     - (từ vựng, số chiều) float32: vector LSA của truy vấn = q_tfidf @ projection
+#   centroids.npy      - (số cụm, số chiều) float32, đã chuẩn hóa L2
+#   list_offsets.npy   - (số cụm + 1) int64: vector của cụm i nằm ở [list_offsets[i], list_offsets[i + 1])
+#   vectors.npy        - (số địa điểm, số chiều) float32 đã chuẩn hóa L2, sắp xếp theo cụm
+#   rows.npy           - (số địa điểm) int32: dòng của ma trận TF-IDF gốc ứng với từng vector
+#   location_ids.npy   - ID địa điểm theo dòng của ma trận TF-IDF gốc
+# Chỉ lúc build mới cần sklearn; lúc tìm kiếm chỉ dùng NumPy trên các mảng memory-map.
+import json
+import os
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from app.search_logic import index_store
+
+SEMANTIC_FORMAT = "lsa-ivf"
+SEMANTIC_FORMAT_VERSION = 1
+_ARRAY_NAMES = ('projection', 'centroids', 'list_offsets', 'vectors', 'rows', 'location_ids')
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Chuẩn hóa L2 từng dòng (float32); dòng toàn 0 giữ nguyên."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    """Cụm gần nhất (tích vô hướng lớn nhất) của từng vector, tính theo khối để giới hạn bộ nhớ."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        labels[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 25, seed: int = 0,
+                     max_train_points: int = 256) -> np.ndarray:
+    """
+    K-means trên mặt cầu đơn vị (độ tương đồng cosine) bằng NumPy. Huấn luyện trên tối đa
+    max_train_points * n_clusters điểm lấy mẫu ngẫu nhiên. Cụm rỗng được khởi tạo lại bằng
+    điểm xa tâm của nó nhất. Trả về các tâm (n_clusters, số chiều) đã chuẩn hóa.
+    """
+    rng = np.random.default_rng(seed)
+    train = vectors
+    if len(vectors) > max_train_points * n_clusters:
+        train = vectors[np.sort(rng.choice(len(vectors), max_train_points * n_clusters, replace=False))]
+    train = np.asarray(train, dtype=np.float32)
+    centroids = train[rng.choice(len(train), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        labels = _assign(train, centroids)
+        # Tổng vector của từng cụm bằng một phép nhân ma trận thưa (cụm x điểm) @ (điểm x chiều)
+        membership = csr_matrix(
+            (np.ones(len(train), dtype=np.float32), (labels, np.arange(len(train)))),
+            shape=(n_clusters, len(train))
+        )
+        sums = np.asarray(membership @ train)
+        counts = np.bincount(labels, minlength=n_clusters)
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            similarity = np.einsum('ij,ij->i', train, centroids[labels])
+            farthest = np.argsort(similarity)[:empty.size]
+            sums[empty] = train[farthest]
+        new_centroids = normalize_rows(sums)
+        if np.allclose(new_centroids, centroids, atol=1e-6):
+            centroids = new_centroids
+            break
+        centroids = new_centroids
+    return centroids
+
+
+class SemanticIndex:
+    """
+    Index LSA + IVF. "Dòng" ở đây là dòng của ma trận TF-IDF lúc build (location_ids[dòng]).
+    - project(): vector LSA đã chuẩn hóa của một truy vấn (indices, weights từ QueryVectorizer).
+    - search(): top-k gần đúng, chỉ duyệt các vector của n_probe cụm gần truy vấn nhất.
+    - search_exact(): top-k chính xác trên toàn bộ vector (để đo recall).
+    """
+
+    def __init__(self, projection: np.ndarray, centroids: np.ndarray, list_offsets: np.ndarray,
+                 vectors: np.ndarray, rows: np.ndarray, location_ids: list, manifest: dict = None):
+        self.projection = projection
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.vectors = vectors
+        self.rows = rows
+        self.location_ids = location_ids
+        self.manifest = manifest or {}
+
+    @property
+    def size(self) -> int:
+        return len(self.location_ids)
+
+    @property
+    def dimensions(self) -> int:
+        return self.projection.shape[1]
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    # --- Build ---
+
+    @classmethod
+    def build(cls, tfidf_matrix, location_ids: list, n_components: int = 128, n_lists: int = None,
+              seed: int = 0) -> "SemanticIndex":
+        """
+        Fit TruncatedSVD (LSA) trên tfidf_matrix và chia các vector tài liệu vào n_lists cụm
+        (mặc định ~sqrt(số địa điểm)). Cần sklearn (chỉ dùng lúc build model).
+        """
+        from sklearn.decomposition import TruncatedSVD
+
+        tfidf_matrix = csr_matrix(tfidf_matrix)
+        n_docs, n_terms = tfidf_matrix.shape
+        n_components = max(1, min(n_components, n_terms - 1, n_docs - 1))
+        svd = TruncatedSVD(n_components=n_components, algorithm='randomized', random_state=seed)
+        document_vectors = normalize_rows(svd.fit_transform(tfidf_matrix))
+        projection = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+
+        n_lists = n_lists or int(round(np.sqrt(n_docs)))
+        n_lists = max(1, min(n_lists, n_docs))
+        centroids = spherical_kmeans(document_vectors, n_lists, seed=seed)
+        labels = _assign(document_vectors, centroids)
+
+        # Sắp vector theo cụm để mỗi cụm là một đoạn liên tục (đọc tuần tự khi tìm kiếm)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        manifest = {
+            'n_components': n_components,
+            'explained_variance': round(float(svd.explained_variance_ratio_.sum()), 4),
+        }
+        return cls(projection, centroids.astype(np.float32), list_offsets,
+                   np.ascontiguousarray(document_vectors[order]), order.astype(np.int32),
+                   list(location_ids), manifest)
+
+    # --- Tìm kiếm ---
+
+    def project(self, term_indices: np.ndarray, term_weights: np.ndarray) -> np.ndarray:
+        """Vector LSA đã chuẩn hóa của truy vấn; None nếu truy vấn không có term nào (hoặc chiếu về 0)."""
+        if term_indices.size == 0:
+            return None
+        query = np.asarray(term_weights, dtype=np.float32) @ self.projection[term_indices]
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0:
+            return None
+        return query / norm
+
+    def project_rows(self, tfidf_rows) -> np.ndarray:
+        """Vector LSA đã chuẩn hóa của các dòng TF-IDF (vd: địa điểm thêm/sửa sau khi build)."""
+        return normalize_rows(csr_matrix(tfidf_rows) @ self.projection)
+
+    def search(self, query: np.ndarray, k: int, n_probe: int, valid_mask: np.ndarray = None):
+        """
+        Top-k gần đúng: chỉ tính điểm các vector thuộc n_probe cụm gần truy vấn nhất.
+        valid_mask: mảng bool theo dòng, False = bỏ qua. Trả về (rows, scores) đã sắp xếp.
+        """
+        n_probe = max(1, min(n_probe, self.n_lists))
+        centroid_scores = self.centroids @ query
+        if n_probe < self.n_lists:
+            probed = np.argpartition(centroid_scores, -n_probe)[-n_probe:]
+        else:
+            probed = np.arange(self.n_lists)
+        starts = self.list_offsets[probed]
+        lengths = self.list_offsets[probed + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(total) + np.repeat(starts - offsets, lengths)
+
+        rows = self.rows[positions].astype(np.int64)
+        if valid_mask is not None:
+            keep = valid_mask[rows]
+            positions, rows = positions[keep], rows[keep]
+        scores = self.vectors[positions] @ query
+        from app.search_logic.tfidf_engine import _select_top_k # Tránh import vòng (tfidf_engine import module này)
+        return _select_top_k(rows, scores, k)
+
+    def search_exact(self, query: np.ndarray, k: int, valid_mask: np.ndarray = None):
+        """Top-k chính xác trên mọi vector (tham chiếu để đo recall)."""
+        rows = self.rows.astype(np.int64)
+        scores = self.vectors @ query
+        if valid_mask is not None:
+            keep = valid_mask[rows]
+            rows, scores = rows[keep], scores[keep]
+        from app.search_logic.tfidf_engine import _select_top_k # Tránh import vòng (tfidf_engine import module này)
+        return _select_top_k(rows, scores, k)
+
+    # --- Lưu / tải ---
+
+    def save(self, output_dir: str, tfidf_model_version: str, extra: dict = None) -> dict:
+        """Ghi index ra output_dir (ghi thư mục tạm rồi đổi tên). Trả về manifest đã ghi."""
+        tmp_dir = index_store.new_temp_directory(output_dir)
+        arrays = {
+            'projection': self.projection,
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'vectors': self.vectors,
+            'rows': self.rows,
+            'location_ids': np.asarray(self.location_ids),
+        }
+        files = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            filename = f"{name}.npy"
+            np.save(os.path.join(tmp_dir, filename), array, allow_pickle=False)
+            files[name] = {'file': filename, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+        manifest = dict(self.manifest)
+        manifest.update(extra or {})
+        manifest.update({
+            'format': SEMANTIC_FORMAT,
+            'version': SEMANTIC_FORMAT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'tfidf_model_version': tfidf_model_version,
+            'size': self.size,
+            'n_components': self.dimensions,
+            'n_lists': self.n_lists,
+            'files': files,
+        })
+        with open(os.path.join(tmp_dir, index_store.MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        index_store.replace_directory(tmp_dir, output_dir)
+        self.manifest = manifest
+        return manifest
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "SemanticIndex":
+        """Tải index; với mmap=True các mảng được memory-map ở chế độ chỉ đọc."""
+        with open(os.path.join(index_dir, index_store.MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != SEMANTIC_FORMAT or manifest.get('version') != SEMANTIC_FORMAT_VERSION:
+            raise ValueError(f"Định dạng index ngữ nghĩa không được hỗ trợ: {manifest.get('format')} "
+                             f"v{manifest.get('version')}")
+        arrays = {}
+        for name in _ARRAY_NAMES:
+            info = manifest['files'][name]
+            array = np.load(os.path.join(index_dir, info['file']), mmap_mode='r' if mmap else None,
+                            allow_pickle=False)
+            if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+                raise ValueError(f"File {info['file']} không khớp với manifest.")
+            arrays[name] = array
+        return cls(arrays['projection'], arrays['centroids'], arrays['list_offsets'], arrays['vectors'],
+                   arrays['rows'], arrays['location_ids'].tolist(), manifest)
+
+
+def index_exists(index_dir: str) -> bool:
+    return index_store.index_exists(index_dir)
+
+
+def sample_query_vectors(index: SemanticIndex, tfidf_matrix, num_queries: int = 200,
+                         max_terms: int = 4, seed: int = 0) -> list:
+    """
+    Truy vấn mẫu để đo recall: lấy ngẫu nhiên các địa điểm, giữ max_terms term có trọng số
+    TF-IDF cao nhất của mỗi địa điểm (giống một truy vấn ngắn) rồi chiếu vào không gian LSA.
+    """
+    tfidf_matrix = csr_matrix(tfidf_matrix)
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(tfidf_matrix.shape[0], min(num_queries, tfidf_matrix.shape[0]), replace=False)
+    queries = []
+    for row in rows.tolist():
+        start, end = tfidf_matrix.indptr[row], tfidf_matrix.indptr[row + 1]
+        indices, weights = tfidf_matrix.indices[start:end], tfidf_matrix.data[start:end]
+        top = np.argsort(-weights)[:max_terms]
+        query = index.project(indices[top], weights[top])
+        if query is not None:
+            queries.append(query)
+    return queries
+
+
+def measure_recall(index: SemanticIndex, queries: list, k: int, n_probe: int) -> dict:
+    """
+    recall@k của search() so với search_exact() (tỉ lệ trung bình kết quả đúng tìm được) và
+    thời gian trung bình mỗi truy vấn của hai cách (ms).
+    """
+    if not queries:
+        return {'k': k, 'n_probe': n_probe, 'recall': None, 'ivf_ms': None, 'exact_ms': None}
+    exact_results = []
+    start = time.perf_counter()
+    for query in queries:
+        exact_results.append(index.search_exact(query, k)[0])
+    exact_seconds = time.perf_counter() - start
+
+    hits = expected = 0
+    start = time.perf_counter()
+    approximate_results = [index.search(query, k, n_probe)[0] for query in queries]
+    ivf_seconds = time.perf_counter() - start
+    for exact_rows, approximate_rows in zip(exact_results, approximate_results):
+        hits += np.intersect1d(exact_rows, approximate_rows).size
+        expected += exact_rows.size
+    return {
+        'k': k,
+        'n_probe': n_probe,
+        'recall': round(hits / expected, 4) if expected else None,
+        'ivf_ms': round(ivf_seconds * 1000 / len(queries), 4),
+        'exact_ms': round(exact_seconds * 1000 / len(queries), 4),
+    }
@@ -0,0 +1,223 @@
+# backend/app/search_logic/sharded_index.py
+# Index TF-IDF chia theo dòng thành nhiều shard và tìm kiếm scatter-gather trên một process pool:
+# mỗi truy vấn được gửi tới tất cả shard, mỗi tiến trình tính điểm trên posting list của shard đó
+# và trả về top-k cục bộ, tiến trình gọi trộn các danh sách đã sắp xếp bằng heap.
+#
+# Một thư mục shard gồm (do build_tfidf_model.py --shards N tạo ra):
+#   manifest.json      - định dạng, model_version của index TF-IDF đầy đủ, số shard, khoảng dòng của từng shard
+#   shard_000/, ...    - mỗi shard là một index memory-map (index_store) của một đoạn dòng liên tục
+# Các shard dùng chung từ vựng và IDF của toàn bộ corpus (vector đã chuẩn hóa trước khi chia), nên điểm
+# của một địa điểm trên shard giống hệt điểm trên index đầy đủ; trộn theo (điểm giảm dần, dòng toàn cục
+# giảm dần) cho đúng kết quả và thứ tự của tìm kiếm trên một index.
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from app.search_logic import index_store
+from app.search_logic.compact_matrix import to_scipy
+from app.search_logic.tfidf_engine import _score_postings, _select_top_k
+
+SHARDS_FORMAT = "tfidf-shards"
+SHARDS_FORMAT_VERSION = 1
+
+
+def shard_boundaries(tfidf_matrix: csr_matrix, num_shards: int) -> list:
+    """Chia các dòng thành num_shards đoạn liên tục có số phần tử khác 0 (chi phí tính điểm) gần bằng nhau."""
+    num_rows = tfidf_matrix.shape[0]
+    num_shards = max(1, min(num_shards, num_rows))
+    targets = np.arange(1, num_shards) * (tfidf_matrix.nnz / num_shards)
+    cuts = np.searchsorted(tfidf_matrix.indptr, targets).tolist()
+    boundaries = [0]
+    for cut in cuts:
+        # Mỗi shard có ít nhất một dòng
+        boundaries.append(min(max(cut, boundaries[-1] + 1), num_rows - (num_shards - len(boundaries))))
+    boundaries.append(num_rows)
+    return boundaries
+
+
+def save_sharded_index(output_dir: str, vectorizer, tfidf_matrix, location_ids: list, num_shards: int,
+                       tfidf_model_version: str, storage: str = 'float64') -> dict:
+    """
+    Ghi ma trận TF-IDF thành num_shards index memory-map (xem index_store.save_index) kèm manifest.
+    tfidf_model_version: model_version của index đầy đủ được build cùng lúc (để engine kiểm tra khớp).
+    storage: dạng lưu trọng số của từng shard (xem index_store.save_index).
+    Trả về manifest đã ghi.
+    """
+    tfidf_matrix = csr_matrix(to_scipy(tfidf_matrix))
+    boundaries = shard_boundaries(tfidf_matrix, num_shards)
+    tmp_dir = index_store.new_temp_directory(output_dir)
+    shards = []
+    for shard_id, (start, end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+        shard_dir = f"shard_{shard_id:03d}"
+        shard_manifest = index_store.save_index(
+            os.path.join(tmp_dir, shard_dir), vectorizer, tfidf_matrix[start:end], location_ids[start:end], storage
+        )
+        shards.append({
+            'dir': shard_dir,
+            'row_offset': start,
+            'rows': end - start,
+            'nnz': shard_manifest['nnz'],
+            'model_version': shard_manifest['model_version'],
+        })
+
+    manifest = {
+        'format': SHARDS_FORMAT,
+        'version': SHARDS_FORMAT_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'tfidf_model_version': tfidf_model_version,
+        'shape': list(tfidf_matrix.shape),
+        'num_shards': len(shards),
+        'storage': storage,
+        'shards': shards,
+    }
+    with open(os.path.join(tmp_dir, index_store.MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    index_store.replace_directory(tmp_dir, output_dir)
+    return manifest
+
+
+def index_exists(index_dir: str) -> bool:
+    return index_store.index_exists(index_dir)
+
+
+def read_manifest(index_dir: str) -> dict:
+    with open(os.path.join(index_dir, index_store.MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != SHARDS_FORMAT or manifest.get('version') != SHARDS_FORMAT_VERSION:
+        raise ValueError(f"Định dạng index shard không được hỗ trợ: {manifest.get('format')} "
+                         f"v{manifest.get('version')}")
+    return manifest
+
+
+# --- Phía tiến trình shard ---
+
+_worker_shards = None # [(postings, row_offset)] của tiến trình shard hiện tại
+
+
+def _init_worker(index_dir: str):
+    """Tải (memory-map) posting list của mọi shard; các tiến trình dùng chung page cache nên tiến trình nào cũng nhận được shard nào."""
+    global _worker_shards
+    manifest = read_manifest(index_dir)
+    _worker_shards = [
+        (index_store.load_index(os.path.join(index_dir, shard['dir']), mmap=True)['postings'], shard['row_offset'])
+        for shard in manifest['shards']
+    ]
+
+
+def _search_shard(shard_id: int, term_indices: np.ndarray, term_weights: np.ndarray, k: int,
+                  excluded_rows: np.ndarray = None):
+    """Top-k (điểm > 0) của một shard, dòng theo chỉ số toàn cục. excluded_rows: dòng cục bộ bị bỏ qua."""
+    postings, row_offset = _worker_shards[shard_id]
+    rows, scores = _score_postings(postings, term_indices, term_weights)
+    keep = scores > 0
+    if excluded_rows is not None:
+        keep &= ~np.isin(rows, excluded_rows, assume_unique=True)
+    candidates = int(keep.sum())
+    rows, scores = _select_top_k(rows[keep], scores[keep], k)
+    return rows + row_offset, scores, candidates
+
+
+def _warm_up_worker(_):
+    return os.getpid()
+
+
+# --- Phía tiến trình gọi ---
+
+def merge_top_k(partials: list, k: int):
+    """
+    Trộn các danh sách (rows, scores) đã sắp xếp theo (điểm giảm dần, dòng giảm dần) bằng heap,
+    lấy k phần tử đầu. Cùng thứ tự với _select_top_k trên toàn bộ ứng viên.
+    """
+    streams = [zip((-scores).tolist(), (-rows).tolist()) for rows, scores in partials if rows.size]
+    merged = []
+    for item in heapq.merge(*streams):
+        merged.append(item)
+        if len(merged) == k:
+            break
+    rows = np.array([-row for _, row in merged], dtype=np.int64)
+    scores = np.array([-score for score, _ in merged], dtype=np.float64)
+    return rows, scores
+
+
+class ShardedSearcher:
+    """
+    Tìm kiếm scatter-gather trên index shard (xem save_sharded_index) bằng num_processes tiến trình.
+    Process pool được tạo ở lần tìm kiếm đầu tiên trong tiến trình đang chạy (không tạo trong master
+    của prefork), dùng context 'spawn' để tiến trình shard không kế thừa thread/khóa của server.
+    """
+
+    def __init__(self, index_dir: str, num_processes: int):
+        self.index_dir = index_dir
+        self.manifest = read_manifest(index_dir)
+        self.num_processes = max(1, num_processes)
+        self.row_offsets = np.array([shard['row_offset'] for shard in self.manifest['shards']], dtype=np.int64)
+        self.num_rows = self.manifest['shape'][0]
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def num_shards(self) -> int:
+        return self.manifest['num_shards']
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_processes, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self.index_dir,)
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def warm_up(self):
+        """Khởi động sẵn các tiến trình shard (tránh độ trễ spawn ở truy vấn đầu tiên)."""
+        executor = self._get_executor()
+        list(executor.map(_warm_up_worker, range(self.num_processes)))
+
+    def _excluded_rows_by_shard(self, tombstones: np.ndarray) -> list:
+        if tombstones is None:
+            return [None] * self.num_shards
+        deleted = np.flatnonzero(tombstones[:self.num_rows])
+        shard_of = np.searchsorted(self.row_offsets, deleted, side='right') - 1
+        return [
+            (deleted[shard_of == shard_id] - self.row_offsets[shard_id]) if np.any(shard_of == shard_id) else None
+            for shard_id in range(self.num_shards)
+        ]
+
+    def search(self, term_indices: np.ndarray, term_weights: np.ndarray, k: int,
+               tombstones: np.ndarray = None, extra: list = None):
+        """
+        Top-k trên mọi shard. tombstones: mảng bool theo dòng toàn cục (dòng True bị bỏ qua).
+        extra: các danh sách (rows, scores) đã sắp xếp khác cần trộn cùng (vd: segment delta).
+        Trả về (rows, scores, số ứng viên có điểm > 0 đã xét).
+        """
+        if k <= 0 or term_indices.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64), 0
+        executor = self._get_executor()
+        futures = [
+            executor.submit(_search_shard, shard_id, term_indices, term_weights, k, excluded_rows)
+            for shard_id, excluded_rows in enumerate(self._excluded_rows_by_shard(tombstones))
+        ]
+        partials = list(extra or [])
+        candidates = 0
+        for future in futures:
+            rows, scores, shard_candidates = future.result()
+            partials.append((rows, scores))
+            candidates += shard_candidates
+        rows, scores = merge_top_k(partials, k)
+        return rows, scores, candidates
+
+    def close(self):
+        """Dừng process pool sau khi các truy vấn đã gửi chạy xong; lần tìm kiếm sau sẽ tạo pool mới."""
+        with self._executor_lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
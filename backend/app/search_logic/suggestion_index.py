@@ -0,0 +1,286 @@
+# backend/app/search_logic/suggestion_index.py
+# Gợi ý hoàn thành truy vấn (type-ahead) cho tiền tố người dùng đang gõ, không cần tách từ hay tính TF-IDF.
+# Nguồn gợi ý: từ vựng của vectorizer, các khóa của synonyms.json và tên địa điểm (dia_danh.ten), mỗi
+# mục có trọng số phổ biến tính sẵn lúc build:
+# - term: số văn bản chứa term / số văn bản của term phổ biến nhất (0-1].
+# - synonym: trọng số lớn nhất của khóa và các từ đồng nghĩa có trong từ vựng (ít nhất SYNONYM_MIN_WEIGHT).
+# - location: LOCATION_NAME_WEIGHT; tên cũng được gợi ý khi gõ từ giữa tên ("long" -> "Vịnh Hạ Long"),
+#   với trọng số nhân SUFFIX_WEIGHT_FACTOR.
+# Tìm theo tiền tố bằng tìm kiếm nhị phân trên hai mảng khóa đã sắp xếp: khóa có dấu (chữ thường, NFC) và
+# khóa bỏ dấu. Tiền tố có dấu ưu tiên các mục khớp đúng dấu, sau đó là các mục khớp khi bỏ dấu (người dùng
+# đang gõ dở dấu: "biê" vẫn gợi ý "biển"); tiền tố không dấu khớp mọi mục. Top-k trong khoảng khóa tìm được
+# chọn bằng argpartition theo trọng số.
+#
+# Một thư mục index gồm (do build_tfidf_model.py hoặc script/build_suggestion_index.py tạo ra):
+#   manifest.json           - phiên bản định dạng, model_version của index TF-IDF, số mục theo loại
+#   texts.npy               - (số mục) chuỗi hiển thị
+#   kinds.npy               - (số mục) int8: KIND_TERM, KIND_SYNONYM, KIND_LOCATION
+#   weights.npy             - (số mục) float32: trọng số phổ biến
+#   location_rows.npy       - (số mục) int32: vị trí trong location_ids.npy, -1 nếu không phải địa điểm
+#   location_ids.npy        - ID của các mục địa điểm
+#   accented_keys.npy, accented_entries.npy, accented_weights.npy - khóa có dấu đã sắp xếp, mục và trọng số của khóa
+#   plain_keys.npy, plain_entries.npy, plain_weights.npy          - tương tự với khóa bỏ dấu
+import json
+import os
+import time
+
+import numpy as np
+
+from app.search_logic import index_store
+from app.search_logic.preprocessor import normalize_text
+from app.search_logic.utils import strip_accents
+
+SUGGESTION_FORMAT = "suggestion-index"
+SUGGESTION_FORMAT_VERSION = 1
+
+KIND_TERM, KIND_SYNONYM, KIND_LOCATION = 0, 1, 2
+KIND_NAMES = ('term', 'synonym', 'location')
+
+LOCATION_NAME_WEIGHT = 0.3
+SYNONYM_MIN_WEIGHT = 0.4
+SUFFIX_WEIGHT_FACTOR = 0.8
+
+_ARRAY_NAMES = ('texts', 'kinds', 'weights', 'location_rows', 'location_ids',
+                'accented_keys', 'accented_entries', 'accented_weights',
+                'plain_keys', 'plain_entries', 'plain_weights')
+# Ký tự lớn nhất của Unicode: mọi khóa bắt đầu bằng prefix đều < prefix + _MAX_CHAR
+_MAX_CHAR = '\U0010ffff'
+
+
+def _sorted_keys(keys: list, entries: list, weights: list) -> tuple:
+    keys = np.array(keys, dtype=str)
+    order = np.argsort(keys, kind='stable')
+    return (keys[order], np.asarray(entries, dtype=np.int32)[order],
+            np.asarray(weights, dtype=np.float32)[order])
+
+
+class SuggestionIndex:
+    """Index gợi ý theo tiền tố (xem mô tả đầu module). Các mảng có thể là memory-map chỉ đọc."""
+
+    def __init__(self, arrays: dict, manifest: dict = None):
+        self.texts = arrays['texts']
+        self.kinds = arrays['kinds']
+        self.weights = arrays['weights']
+        self.location_rows = arrays['location_rows']
+        self.location_ids = arrays['location_ids']
+        self._accented = (arrays['accented_keys'], arrays['accented_entries'], arrays['accented_weights'])
+        self._plain = (arrays['plain_keys'], arrays['plain_entries'], arrays['plain_weights'])
+        self.manifest = manifest or {}
+
+    @property
+    def size(self) -> int:
+        return self.texts.shape[0]
+
+    @classmethod
+    def build(cls, vocabulary: dict, document_frequency: np.ndarray, synonyms: dict,
+              locations: list) -> "SuggestionIndex":
+        """
+        vocabulary: {term: cột} của vectorizer; document_frequency: số văn bản chứa term theo cột;
+        synonyms: nội dung synonyms.json; locations: list (id_dia_diem, ten).
+        """
+        max_frequency = max(1, int(np.max(document_frequency))) if len(document_frequency) else 1
+        term_weights = {term: float(document_frequency[column]) / max_frequency for term, column in vocabulary.items()}
+
+        # Term và khóa đồng nghĩa cùng chữ được gộp thành một mục (giữ trọng số lớn hơn)
+        phrases = {} # chữ thường -> [kind, weight]
+        for term, weight in term_weights.items():
+            phrases[normalize_text(term.replace('_', ' '))] = [KIND_TERM, weight]
+        for key, values in synonyms.items():
+            text = normalize_text(key.replace('_', ' '))
+            if not text:
+                continue
+            candidates = [text] + [normalize_text(value.replace('_', ' ')) for value in values]
+            weight = max([SYNONYM_MIN_WEIGHT] + [term_weights.get(candidate.replace(' ', '_'), 0.0)
+                                                 for candidate in candidates])
+            entry = phrases.setdefault(text, [KIND_SYNONYM, weight])
+            entry[1] = max(entry[1], weight)
+
+        texts, kinds, weights, location_rows, location_ids = [], [], [], [], []
+        for text, (kind, weight) in phrases.items():
+            texts.append(text)
+            kinds.append(kind)
+            weights.append(weight)
+            location_rows.append(-1)
+        seen_names = set()
+        for location_id, name in locations:
+            display = " ".join(str(name or '').split())
+            if not display or normalize_text(display) in seen_names:
+                continue
+            seen_names.add(normalize_text(display))
+            texts.append(display)
+            kinds.append(KIND_LOCATION)
+            weights.append(LOCATION_NAME_WEIGHT)
+            location_rows.append(len(location_ids))
+            location_ids.append(location_id)
+
+        keys, key_entries, key_weights = [], [], []
+        for entry, (text, weight) in enumerate(zip(texts, weights)):
+            words = normalize_text(text).split()
+            # Tên địa điểm: thêm các khóa bắt đầu từ mỗi từ sau từ đầu tiên
+            starts = range(len(words)) if kinds[entry] == KIND_LOCATION else range(1)
+            for start in starts:
+                keys.append(" ".join(words[start:]))
+                key_entries.append(entry)
+                key_weights.append(weight if start == 0 else weight * SUFFIX_WEIGHT_FACTOR)
+
+        accented = _sorted_keys(keys, key_entries, key_weights)
+        plain = _sorted_keys([strip_accents(key) for key in keys], key_entries, key_weights)
+        arrays = {
+            'texts': np.array(texts, dtype=str),
+            'kinds': np.array(kinds, dtype=np.int8),
+            'weights': np.array(weights, dtype=np.float32),
+            'location_rows': np.array(location_rows, dtype=np.int32),
+            'location_ids': np.asarray(location_ids) if location_ids else np.empty(0, dtype=str),
+            'accented_keys': accented[0], 'accented_entries': accented[1], 'accented_weights': accented[2],
+            'plain_keys': plain[0], 'plain_entries': plain[1], 'plain_weights': plain[2],
+        }
+        counts = np.bincount(arrays['kinds'], minlength=len(KIND_NAMES))
+        manifest = {'entries': {name: int(count) for name, count in zip(KIND_NAMES, counts)}, 'keys': len(keys)}
+        return cls(arrays, manifest)
+
+    # --- Tìm kiếm ---
+
+    @staticmethod
+    def _top_entries(keys: np.ndarray, entries: np.ndarray, weights: np.ndarray, prefix: str, k: int,
+                     seen: set) -> list:
+        """Tối đa k mục (chưa có trong seen) có khóa bắt đầu bằng prefix, theo trọng số giảm dần."""
+        low = int(np.searchsorted(keys, prefix, side='left'))
+        high = int(np.searchsorted(keys, prefix + _MAX_CHAR, side='left'))
+        count = high - low
+        if count <= 0:
+            return []
+        range_weights = np.asarray(weights[low:high])
+        # Một mục có thể có nhiều khóa trong khoảng (tên địa điểm): lấy dư rồi bỏ trùng,
+        # chỉ sắp xếp toàn bộ khoảng khi vẫn thiếu
+        wanted = min(count, 3 * k + len(seen))
+        while True:
+            if wanted < count:
+                candidates = np.argpartition(-range_weights, wanted - 1)[:wanted]
+            else:
+                candidates = np.arange(count)
+            # Trọng số giảm dần, cùng trọng số thì theo thứ tự khóa
+            candidates = candidates[np.lexsort((candidates, -range_weights[candidates]))]
+            found = []
+            local_seen = set(seen)
+            for entry in np.asarray(entries[low:high])[candidates].tolist():
+                if entry not in local_seen:
+                    local_seen.add(entry)
+                    found.append(entry)
+                    if len(found) == k:
+                        break
+            if len(found) == k or wanted >= count:
+                return found
+            wanted = count
+
+    def complete(self, prefix: str, k: int = 8) -> list:
+        """Chỉ số các mục hoàn thành prefix (đã chuẩn hóa), tối đa k mục."""
+        prefix = normalize_text(prefix)
+        if not prefix or k <= 0:
+            return []
+        plain_prefix = strip_accents(prefix)
+        seen = set()
+        found = []
+        if plain_prefix != prefix:
+            found = self._top_entries(*self._accented, prefix, k, seen)
+            seen.update(found)
+        if len(found) < k:
+            found += self._top_entries(*self._plain, plain_prefix, k - len(found), seen)
+        return found
+
+    def suggest(self, text: str, k: int = 8) -> list:
+        """
+        Tối đa k gợi ý cho chuỗi đang gõ, dạng dict: text, kind ('term', 'synonym', 'location'), score
+        (trọng số phổ biến) và id_dia_diem (với tên địa điểm). Nếu cả chuỗi có nhiều từ và không đủ k
+        gợi ý thì hoàn thành từ cuối và giữ nguyên phần trước ("bai bien d" -> "bai bien đẹp").
+        """
+        suggestions = [self._suggestion(entry) for entry in self.complete(text, k)]
+        words = normalize_text(text).split() if len(suggestions) < k else []
+        if len(words) > 1:
+            head = " ".join(words[:-1])
+            seen = {suggestion['text'].lower() for suggestion in suggestions}
+            for entry in self.complete(words[-1], k):
+                suggestion = self._suggestion(entry, include_location=False)
+                suggestion['text'] = f"{head} {suggestion['text']}"
+                if suggestion['text'].lower() not in seen:
+                    seen.add(suggestion['text'].lower())
+                    suggestions.append(suggestion)
+                    if len(suggestions) == k:
+                        break
+        return suggestions
+
+    def _suggestion(self, entry: int, include_location: bool = True) -> dict:
+        suggestion = {
+            'text': str(self.texts[entry]),
+            'kind': KIND_NAMES[self.kinds[entry]],
+            'score': round(float(self.weights[entry]), 4),
+        }
+        location_row = int(self.location_rows[entry])
+        if include_location and location_row >= 0:
+            suggestion['id_dia_diem'] = self.location_ids[location_row].item()
+        return suggestion
+
+    # --- Lưu / tải ---
+
+    def _arrays(self) -> dict:
+        return {
+            'texts': self.texts, 'kinds': self.kinds, 'weights': self.weights,
+            'location_rows': self.location_rows, 'location_ids': self.location_ids,
+            'accented_keys': self._accented[0], 'accented_entries': self._accented[1],
+            'accented_weights': self._accented[2],
+            'plain_keys': self._plain[0], 'plain_entries': self._plain[1], 'plain_weights': self._plain[2],
+        }
+
+    def save(self, output_dir: str, tfidf_model_version: str) -> dict:
+        """Ghi index ra output_dir (ghi thư mục tạm rồi đổi tên). Trả về manifest đã ghi."""
+        tmp_dir = index_store.new_temp_directory(output_dir)
+        files = {}
+        for name, array in self._arrays().items():
+            array = np.ascontiguousarray(array)
+            filename = f"{name}.npy"
+            np.save(os.path.join(tmp_dir, filename), array, allow_pickle=False)
+            files[name] = {'file': filename, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+        manifest = dict(self.manifest)
+        manifest.update({
+            'format': SUGGESTION_FORMAT,
+            'version': SUGGESTION_FORMAT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'tfidf_model_version': tfidf_model_version,
+            'size': self.size,
+            'files': files,
+        })
+        with open(os.path.join(tmp_dir, index_store.MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        index_store.replace_directory(tmp_dir, output_dir)
+        self.manifest = manifest
+        return manifest
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = False) -> "SuggestionIndex":
+        """
+        Tải index. Mặc định đọc hẳn vào bộ nhớ (index nhỏ, mỗi lần gõ phím chỉ chạm vài trang);
+        mmap=True để memory-map ở chế độ chỉ đọc.
+        """
+        with open(os.path.join(index_dir, index_store.MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != SUGGESTION_FORMAT or manifest.get('version') != SUGGESTION_FORMAT_VERSION:
+            raise ValueError(f"Định dạng index gợi ý không được hỗ trợ: {manifest.get('format')} "
+                             f"v{manifest.get('version')}")
+        arrays = {}
+        for name in _ARRAY_NAMES:
+            info = manifest['files'][name]
+            array = np.load(os.path.join(index_dir, info['file']), mmap_mode='r' if mmap else None,
+                            allow_pickle=False)
+            if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+                raise ValueError(f"File {info['file']} không khớp với manifest.")
+            arrays[name] = array
+        return cls(arrays, manifest)
+
+
+def index_exists(index_dir: str) -> bool:
+    return index_store.index_exists(index_dir)
+
+
+def document_frequency(postings) -> np.ndarray:
+    """Số văn bản chứa mỗi term: độ dài posting list (CSC, scipy hoặc CompactMatrix) của từng cột."""
+    return np.diff(np.asarray(postings.indptr)).astype(np.int64)
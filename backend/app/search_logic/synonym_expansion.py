@@ -0,0 +1,179 @@
+# backend/app/search_logic/synonym_expansion.py
+# Mở rộng từ đồng nghĩa trên vector truy vấn thay vì trên chuỗi token. Lúc build model, synonyms.json được
+# biên dịch theo từ vựng đã fit thành ma trận thưa S (nguồn × từ vựng):
+# - Nguồn: các cột của từ vựng (dòng 0..V-1) và các khóa không có trong từ vựng (dòng V.., extra_terms),
+#   vd khóa nhiều từ 'view_đẹp' mà preprocess_query thêm vào query_tokens khi câu có cụm 'view đẹp'.
+#   Khóa được viết theo synonym_key_token.
+# - S[i, j] = 1 khi term j là một từ đồng nghĩa của nguồn i. Từ đồng nghĩa không có trong từ vựng bị bỏ
+#   (cách cũ cũng không tính được chúng); không tách cụm thành các âm tiết vì dễ đổi nghĩa
+#   ('không ồn ào' -> 'ồn_ào').
+# Lúc truy vấn (TFIDFEngine.vectorize_query), với vector tần suất c của token truy vấn trên các nguồn:
+#   c' = c[:V] + w * (c @ S), rồi nhân IDF và chuẩn hóa L2 như bình thường.
+# w = 1 tương đương thêm từ đồng nghĩa vào chuỗi token (cách của preprocess_query) khi mỗi từ đồng nghĩa chỉ
+# đến từ một khóa của truy vấn (nhiều khóa cùng dẫn đến một term thì cộng dồn), w < 1 giảm trọng số từ
+# đồng nghĩa so với từ người dùng gõ, w = 0 tắt mở rộng; w chọn theo từng truy vấn, không cần tách từ lại.
+#
+# Một thư mục index gồm (do build_tfidf_model.py hoặc script/build_synonym_expansion.py tạo ra):
+#   manifest.json    - phiên bản định dạng, model_version của index TF-IDF, số nguồn, khóa không dùng được
+#   extra_terms.npy  - khóa nguồn không có trong từ vựng (dòng V + i của S)
+#   data.npy, indices.npy, indptr.npy - ma trận S dạng CSR, (V + số khóa thêm) × V
+import json
+import os
+import time
+
+import numpy as np
+
+from app.search_logic import index_store
+from app.search_logic.preprocessor import synonym_key_token
+
+EXPANSION_FORMAT = "synonym-expansion"
+EXPANSION_FORMAT_VERSION = 1
+
+_ARRAY_NAMES = ('extra_terms', 'data', 'indices', 'indptr')
+
+
+class SynonymExpansion:
+    """Ma trận mở rộng từ đồng nghĩa (xem mô tả đầu module). Các mảng có thể là memory-map chỉ đọc."""
+
+    def __init__(self, arrays: dict, vocabulary_size: int, manifest: dict = None):
+        self.extra_terms = arrays['extra_terms']
+        self.data = arrays['data']
+        self.indices = arrays['indices']
+        self.indptr = arrays['indptr']
+        self.vocabulary_size = vocabulary_size
+        self.manifest = manifest or {}
+        # Token -> dòng của các khóa nguồn không có trong từ vựng (QueryVectorizer.term_counts)
+        self.extra_vocabulary = {str(term): vocabulary_size + i for i, term in enumerate(self.extra_terms)}
+        # Các dòng khác rỗng của S dạng {dòng: ((cột, trọng số), ...)}: vector truy vấn chỉ có vài phần tử nên
+        # phép nhân được làm trên dict như QueryVectorizer.transform, nhanh hơn nhiều lệnh numpy trên mảng nhỏ
+        indptr, indices, data = self.indptr.tolist(), self.indices.tolist(), self.data.tolist()
+        self._rows = {
+            row: tuple(zip(indices[indptr[row]:indptr[row + 1]], data[indptr[row]:indptr[row + 1]]))
+            for row in range(len(indptr) - 1) if indptr[row + 1] > indptr[row]
+        }
+
+    @property
+    def num_sources(self) -> int:
+        return self.indptr.shape[0] - 1
+
+    @classmethod
+    def build(cls, vocabulary: dict, synonyms: dict) -> "SynonymExpansion":
+        """vocabulary: {term: cột} của vectorizer; synonyms: nội dung synonyms.json."""
+        vocabulary_size = len(vocabulary)
+        extra_terms = {}
+        rows = {} # dòng nguồn -> tập cột đồng nghĩa
+        skipped_keys = []
+        for key, values in synonyms.items():
+            key_token = synonym_key_token(key)
+            if not key_token:
+                continue
+            source = vocabulary.get(key_token)
+            if source is None:
+                source = extra_terms.setdefault(key_token, vocabulary_size + len(extra_terms))
+            targets = rows.setdefault(source, set())
+            for value in values:
+                column = vocabulary.get(synonym_key_token(value))
+                if column is not None and column != source:
+                    targets.add(column)
+            if not targets:
+                skipped_keys.append(key)
+
+        num_sources = vocabulary_size + len(extra_terms)
+        row_lengths = np.zeros(num_sources, dtype=np.int64)
+        for source, targets in rows.items():
+            row_lengths[source] = len(targets)
+        indptr = np.concatenate([[0], np.cumsum(row_lengths)]).astype(np.int32)
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        for source, targets in rows.items():
+            indices[indptr[source]:indptr[source + 1]] = sorted(targets)
+        data = np.ones(indptr[-1], dtype=np.float64)
+        arrays = {
+            'extra_terms': np.array(sorted(extra_terms, key=extra_terms.get), dtype=str),
+            'data': data, 'indices': indices, 'indptr': indptr,
+        }
+        manifest = {
+            'keys': len(synonyms),
+            'sources': int(np.count_nonzero(row_lengths)),
+            'extra_sources': len(extra_terms),
+            'entries': int(indptr[-1]),
+            'skipped_keys': skipped_keys,
+        }
+        return cls(arrays, vocabulary_size, manifest)
+
+    def expand(self, indices: np.ndarray, counts: np.ndarray, weight: float):
+        """
+        Tần suất sau khi mở rộng: counts (trên từ vựng) + weight * (vector tần suất trên các nguồn @ S).
+        indices: cột tăng dần, có thể gồm dòng của khóa thêm (>= vocabulary_size, xem extra_vocabulary).
+        Trả về (indices int32 tăng dần, counts) chỉ gồm các cột của từ vựng.
+        """
+        rows = self._rows
+        vocabulary_size = self.vocabulary_size
+        expanded = {}
+        sources = []
+        for row, count in zip(indices.tolist(), counts.tolist()):
+            if row < vocabulary_size:
+                expanded[row] = expanded.get(row, 0.0) + count
+            if weight > 0 and row in rows:
+                sources.append((rows[row], weight * count))
+        if not sources and len(expanded) == indices.size:
+            return indices, counts
+        for synonyms, scale in sources:
+            for column, value in synonyms:
+                expanded[column] = expanded.get(column, 0.0) + scale * value
+        columns = sorted(expanded)
+        return (np.array(columns, dtype=np.int32),
+                np.array([expanded[column] for column in columns], dtype=counts.dtype))
+
+    # --- Lưu / tải ---
+
+    def save(self, output_dir: str, tfidf_model_version: str) -> dict:
+        """Ghi ma trận ra output_dir (ghi thư mục tạm rồi đổi tên). Trả về manifest đã ghi."""
+        tmp_dir = index_store.new_temp_directory(output_dir)
+        files = {}
+        for name in _ARRAY_NAMES:
+            array = np.ascontiguousarray(getattr(self, name))
+            filename = f"{name}.npy"
+            np.save(os.path.join(tmp_dir, filename), array, allow_pickle=False)
+            files[name] = {'file': filename, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+        manifest = dict(self.manifest)
+        manifest.update({
+            'format': EXPANSION_FORMAT,
+            'version': EXPANSION_FORMAT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'tfidf_model_version': tfidf_model_version,
+            'vocabulary_size': self.vocabulary_size,
+            'files': files,
+        })
+        with open(os.path.join(tmp_dir, index_store.MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        index_store.replace_directory(tmp_dir, output_dir)
+        self.manifest = manifest
+        return manifest
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "SynonymExpansion":
+        """Tải ma trận; với mmap=True các mảng được memory-map ở chế độ chỉ đọc."""
+        with open(os.path.join(index_dir, index_store.MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != EXPANSION_FORMAT or manifest.get('version') != EXPANSION_FORMAT_VERSION:
+            raise ValueError(f"Định dạng ma trận mở rộng từ đồng nghĩa không được hỗ trợ: {manifest.get('format')} "
+                             f"v{manifest.get('version')}")
+        arrays = {}
+        for name in _ARRAY_NAMES:
+            info = manifest['files'][name]
+            # Mảng rỗng (vd không có khóa thêm) không memory-map được
+            use_mmap = mmap and int(np.prod(info['shape'])) > 0
+            array = np.load(os.path.join(index_dir, info['file']), mmap_mode='r' if use_mmap else None,
+                            allow_pickle=False)
+            if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+                raise ValueError(f"File {info['file']} không khớp với manifest.")
+            arrays[name] = array
+        vocabulary_size = int(manifest['vocabulary_size'])
+        if arrays['indptr'].shape[0] != vocabulary_size + arrays['extra_terms'].shape[0] + 1:
+            raise ValueError("Số dòng ma trận mở rộng không khớp với manifest.")
+        return cls(arrays, vocabulary_size, manifest)
+
+
+def index_exists(index_dir: str) -> bool:
+    return index_store.index_exists(index_dir)
@@ -0,0 +1,200 @@
+# backend/app/search_logic/tag_engine.py
+import threading
+
+import mysql.connector
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from app.core.config import FILTER_CACHE_SIZE
+from app.core.database import db_pool
+from app.models import dia_danh_tag, tag
+from app.search_logic.preprocessor import normalize_text, _to_token
+from app.search_logic.utils import LRUCache
+
+
+def tag_lookup_key(name: str) -> str:
+    """Khóa tra cứu của tên tag/keyword: chuẩn hóa rồi nối âm tiết bằng '_' (giống token của preprocess_query)."""
+    return _to_token(normalize_text(name))
+
+
+class TagEngine:
+    """
+    Tính điểm khớp tag giữa truy vấn và toàn bộ địa điểm mà không cần JOIN SQL mỗi truy vấn.
+    Quan hệ dia_danh_tag được tải từ database và lưu dưới dạng:
+    - _tag_locations: ma trận CSR (số tag, số địa điểm); dòng t là mảng đã sắp xếp các dòng
+      (theo thứ tự location_ids: các dòng gốc rồi dòng delta của ảnh chụp index TFIDFEngine) được gán tag t.
+    - _tag_cols_by_key: dict khóa tra cứu (vd 'bãi_biển') -> tuple các dòng tag có tên đó.
+    Điểm của một địa điểm = số tag (khớp với truy vấn) mà địa điểm có / số tag khớp với truy vấn,
+    nằm trong [0, 1].
+    Khi dữ liệu tag thay đổi (reload) hoặc thứ tự dòng thay đổi (realign), một TagEngine mới được tạo
+    thay cho bản đang dùng.
+    """
+
+    def __init__(self, location_ids: list, tags: list = None, pairs: list = None):
+        """
+        location_ids: thứ tự dòng cần căn theo (TFIDFEngine.location_ids).
+        tags: list (id_tag, ten_tag); pairs: list (id_dia_diem, id_tag). Nếu bỏ trống thì gọi load().
+        """
+        self.location_ids = location_ids
+        self._tags = []
+        self._pairs = []
+        self._tag_ids = []
+        self._tag_names = []
+        self._tag_cols_by_key = {}
+        self._tag_locations: csr_matrix = None
+        self._lock = threading.Lock()
+        self._ids_cache = LRUCache(max_size=FILTER_CACHE_SIZE) # tập khóa tag -> frozenset ID địa điểm
+        if tags is not None and pairs is not None:
+            self._build(tags, pairs)
+
+    @staticmethod
+    def _fetch():
+        """(tags, pairs) đọc từ bảng tag và dia_danh_tag, hoặc None nếu lỗi."""
+        try:
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(tag.SELECT_ALL_QUERY)
+                    tags = cursor.fetchall()
+                    cursor.execute(dia_danh_tag.SELECT_ALL_QUERY)
+                    pairs = cursor.fetchall()
+                finally:
+                    cursor.close()
+        except mysql.connector.Error as err:
+            print(f"TagEngine Lỗi khi tải tag: {err}")
+            return None
+        return list(tags), list(pairs)
+
+    def load(self) -> bool:
+        """Tải bảng tag và dia_danh_tag từ database. Trả về True nếu thành công."""
+        data = self._fetch()
+        if data is None:
+            return False
+        self._build(*data)
+        print(f"TagEngine: Đã tải {len(self._tag_ids)} tag, {self._tag_locations.nnz} cặp địa điểm - tag.")
+        return True
+
+    def reload(self) -> "TagEngine":
+        """
+        Đọc lại tag/dia_danh_tag; trả về TagEngine mới (cùng location_ids) nếu dữ liệu đã thay đổi,
+        None nếu không đổi hoặc lỗi.
+        """
+        data = self._fetch()
+        if data is None or data == (self._tags, self._pairs):
+            return None
+        tag_engine = TagEngine(self.location_ids, *data)
+        print(f"TagEngine: Đã tải lại {len(tag_engine._tag_ids)} tag, {tag_engine._tag_locations.nnz} cặp địa điểm - tag.")
+        return tag_engine
+
+    def _build(self, tags: list, pairs: list):
+        tag_ids = [tag_id for tag_id, _ in tags]
+        tag_names = [name for _, name in tags]
+        col_by_tag_id = {tag_id: col for col, tag_id in enumerate(tag_ids)}
+        cols_by_key = {}
+        for col, name in enumerate(tag_names):
+            if name:
+                cols_by_key.setdefault(tag_lookup_key(name), []).append(col)
+
+        row_by_id = {location_id: row for row, location_id in enumerate(self.location_ids)}
+        tag_cols, rows = [], []
+        for location_id, tag_id in pairs:
+            row = row_by_id.get(location_id)
+            col = col_by_tag_id.get(tag_id)
+            if row is not None and col is not None:
+                tag_cols.append(col)
+                rows.append(row)
+        matrix = csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (np.asarray(tag_cols, dtype=np.int64), np.asarray(rows, dtype=np.int64))),
+            shape=(len(tag_ids), len(self.location_ids))
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.0 # Cặp trùng lặp trong bảng chỉ tính một lần
+
+        with self._lock:
+            self._tags, self._pairs = list(tags), list(pairs)
+            self._tag_ids, self._tag_names = tag_ids, tag_names
+            self._tag_cols_by_key = {key: tuple(cols) for key, cols in cols_by_key.items()}
+            self._tag_locations = matrix
+        self._ids_cache.clear()
+
+    def realign(self, location_ids: list) -> "TagEngine":
+        """
+        TagEngine mới căn theo location_ids khác (khi model được tải lại/gộp hoặc có địa điểm mới trong delta),
+        không truy vấn lại database.
+        """
+        return TagEngine(location_ids, self._tags, self._pairs)
+
+    def is_ready(self) -> bool:
+        return self._tag_locations is not None
+
+    def match_tags(self, keywords: list) -> np.ndarray:
+        """Các dòng tag (đã sắp xếp, không trùng) có tên khớp với keywords."""
+        cols = [col for keyword in keywords for col in self._tag_cols_by_key.get(tag_lookup_key(keyword), ())]
+        return np.unique(np.asarray(cols, dtype=np.int64))
+
+    def locations_with_tags(self, tag_cols: np.ndarray) -> np.ndarray:
+        """Mảng đã sắp xếp các dòng địa điểm có ít nhất một trong các tag tag_cols."""
+        matrix = self._tag_locations
+        if matrix is None or len(tag_cols) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(matrix[tag_cols].indices).astype(np.int64, copy=False)
+
+    def location_ids_with_tags(self, tag_names: list) -> frozenset:
+        """
+        Tập ID địa điểm có ít nhất một trong các tag tag_names (dùng làm bộ lọc tìm kiếm).
+        Kết quả được cache theo tập tag.
+        """
+        key = frozenset(tag_lookup_key(name) for name in tag_names)
+        location_ids = self._ids_cache.get(key)
+        if location_ids is None:
+            rows = self.locations_with_tags(self.match_tags(list(key)))
+            location_ids = frozenset(self.location_ids[row] for row in rows.tolist())
+            self._ids_cache.put(key, location_ids)
+        return location_ids
+
+    def score_rows(self, keywords: list):
+        """
+        Điểm khớp tag cho truy vấn dưới dạng thưa: (rows, scores), rows tăng dần,
+        chỉ gồm các địa điểm có điểm > 0.
+        """
+        matrix = self._tag_locations
+        if matrix is None or not keywords:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        tag_cols = self.match_tags(keywords)
+        if tag_cols.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        # Nối posting của các tag khớp rồi đếm số lần xuất hiện mỗi dòng
+        counts = np.bincount(matrix[tag_cols].indices, minlength=matrix.shape[1])
+        rows = np.flatnonzero(counts)
+        return rows, counts[rows] / tag_cols.size
+
+    def score_vector(self, keywords: list) -> np.ndarray:
+        """Điểm khớp tag của mọi địa điểm (mảng dày, căn theo location_ids)."""
+        scores = np.zeros(len(self.location_ids), dtype=np.float64)
+        rows, row_scores = self.score_rows(keywords)
+        scores[rows] = row_scores
+        return scores
+
+    def calculate_scores(self, keywords: list) -> dict:
+        """Điểm khớp tag dạng dict {id_dia_diem: score} (chỉ các địa điểm có điểm > 0)."""
+        rows, scores = self.score_rows(keywords)
+        return {self.location_ids[row]: float(score) for row, score in zip(rows.tolist(), scores.tolist())}
+
+    def tags_of(self, location_id) -> list:
+        """Tên các tag của một địa điểm (dùng để hiển thị/debug)."""
+        matrix = self._tag_locations
+        try:
+            row = self.location_ids.index(location_id)
+        except ValueError:
+            return []
+        cols = np.flatnonzero(matrix[:, row].toarray().ravel())
+        return [self._tag_names[col] for col in cols]
+
+    def stats(self) -> dict:
+        matrix = self._tag_locations
+        return {
+            'ready': self.is_ready(),
+            'tags': len(self._tag_ids),
+            'lookup_keys': len(self._tag_cols_by_key),
+            'pairs': int(matrix.nnz) if matrix is not None else 0,
+        }
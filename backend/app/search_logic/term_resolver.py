@@ -0,0 +1,327 @@
+# backend/app/search_logic/term_resolver.py
+# Phân giải token ngoài từ vựng của truy vấn (gõ không dấu, gõ sai) thành term có trong từ vựng, giữa bước
+# preprocess_query và vector hóa (xem TFIDFEngine.vectorize_query). Thứ tự thử:
+# 1. Ghép token liền kề (tối đa MAX_JOIN_TOKENS) khi có token ngoài từ vựng: gõ không dấu thường làm
+#    underthesea không gộp được từ ghép ("bai bien" -> "bai_bien" -> "bãi_biển").
+# 2. Khớp chính xác sau khi bỏ dấu (bảng dạng bỏ dấu -> các cột, tính sẵn).
+# 3. Sửa lỗi gõ kiểu SymSpell: lúc build, mọi chuỗi nhận được khi xóa tối đa MAX_EDIT_DISTANCE ký tự của
+#    PREFIX_LENGTH ký tự đầu (dạng bỏ dấu) của mỗi term được lưu vào index xóa ký tự. Lúc truy vấn chỉ cần
+#    sinh các chuỗi xóa của token rồi tra (tìm kiếm nhị phân trên mảng đã sắp xếp), không duyệt từ vựng;
+#    ứng viên được kiểm tra bằng khoảng cách Damerau-Levenshtein trên dạng bỏ dấu.
+# Khi nhiều term cùng khớp: khoảng cách nhỏ nhất, rồi khoảng cách trên dạng có dấu (giữ dấu người dùng đã
+# gõ), rồi số văn bản chứa term lớn nhất.
+#
+# Một thư mục index gồm (do build_tfidf_model.py hoặc script/build_term_resolver.py tạo ra):
+#   manifest.json           - phiên bản định dạng, model_version của index TF-IDF, MAX_EDIT_DISTANCE, PREFIX_LENGTH
+#   terms.npy               - (từ vựng) term của từng cột
+#   plain_forms.npy         - (từ vựng) dạng bỏ dấu của từng term
+#   document_frequency.npy  - (từ vựng) int64: số văn bản chứa term
+#   plain_keys.npy, plain_offsets.npy, plain_columns.npy           - dạng bỏ dấu đã sắp xếp -> các cột
+#   deletion_keys.npy, deletion_offsets.npy, deletion_columns.npy  - chuỗi xóa ký tự đã sắp xếp -> các cột
+import json
+import os
+import time
+
+import numpy as np
+
+from app.core import metrics
+from app.search_logic import index_store
+from app.search_logic.utils import LRUCache, strip_accents
+
+RESOLVER_FORMAT = "term-resolver"
+RESOLVER_FORMAT_VERSION = 1
+
+MAX_EDIT_DISTANCE = 2
+# Chỉ PREFIX_LENGTH ký tự đầu của term được đưa vào index xóa ký tự (giới hạn kích thước với term dài);
+# term trung bình ~6.5 ký tự nên phần lớn term được phủ trọn và số ứng viên cần kiểm tra ít
+PREFIX_LENGTH = 10
+MAX_JOIN_TOKENS = 3
+# Token bỏ dấu ngắn hơn FUZZY_MIN_LENGTH ký tự không được sửa lỗi gõ (quá nhiều term cách 1 ký tự);
+# từ FUZZY_LONG_LENGTH ký tự được sửa tới MAX_EDIT_DISTANCE ký tự, còn lại 1 ký tự.
+FUZZY_MIN_LENGTH = 4
+FUZZY_LONG_LENGTH = 8
+# Token ghép chỉ được phân giải khi khớp chính xác sau khi bỏ dấu: sửa lỗi gõ trên token ghép dễ tạo
+# ra từ ghép sai từ hai từ đúng ("o da" -> "bổ_đà")
+JOIN_MAX_DISTANCE = 0
+RESOLVE_CACHE_SIZE = 4096
+
+_ARRAY_NAMES = ('terms', 'plain_forms', 'document_frequency',
+                'plain_keys', 'plain_offsets', 'plain_columns',
+                'deletion_keys', 'deletion_offsets', 'deletion_columns')
+_UNRESOLVED = object() # Giá trị cache của token không phân giải được
+
+
+def deletions(word: str, max_distance: int) -> set:
+    """Mọi chuỗi nhận được khi xóa tối đa max_distance ký tự của word (kể cả chính word)."""
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Khoảng cách Damerau-Levenshtein (optimal string alignment: thêm, xóa, thay, đổi chỗ hai ký tự liền nhau).
+    Bỏ phần đầu/cuối chung trước khi tính (lỗi gõ thường chỉ ở một chỗ nên bảng quy hoạch động rất nhỏ),
+    dừng sớm và trả về max_distance + 1 khi khoảng cách chắc chắn lớn hơn max_distance.
+    """
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+
+    # Chỉ tính các ô cách đường chéo không quá max_distance (các ô khác chắc chắn > max_distance)
+    limit = max_distance + 1
+    before_previous = None
+    previous = [j if j <= max_distance else limit for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        current = [i if i <= max_distance else limit] + [limit] * len(b)
+        low, high = max(1, i - max_distance), min(len(b), i + max_distance)
+        row_min = limit
+        for j in range(low, high + 1):
+            value = previous[j - 1] if char == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1] and before_previous[j - 2] + 1 < value:
+                value = before_previous[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return limit
+        before_previous, previous = previous, current
+    return min(previous[-1], limit)
+
+
+def _group(pairs: list) -> tuple:
+    """(khóa, cột) đã sắp xếp theo khóa -> (khóa duy nhất, offsets, cột): cột của khóa i ở [offsets[i], offsets[i + 1])."""
+    keys = np.array([key for key, _ in pairs], dtype=str)
+    columns = np.array([column for _, column in pairs], dtype=np.int32)
+    if not keys.size:
+        return keys, np.zeros(1, dtype=np.int64), columns
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.append(starts, keys.size).astype(np.int64), columns
+
+
+class TermResolver:
+    """Phân giải token ngoài từ vựng thành term (xem mô tả đầu module). Các mảng có thể là memory-map chỉ đọc."""
+
+    def __init__(self, arrays: dict, manifest: dict = None):
+        self.terms = arrays['terms']
+        self.plain_forms = arrays['plain_forms']
+        self.document_frequency = arrays['document_frequency']
+        self._plain = (arrays['plain_keys'], arrays['plain_offsets'], arrays['plain_columns'])
+        self._deletions = (arrays['deletion_keys'], arrays['deletion_offsets'], arrays['deletion_columns'])
+        self.manifest = manifest or {}
+        self.max_distance = int(self.manifest.get('max_edit_distance', MAX_EDIT_DISTANCE))
+        self.prefix_length = int(self.manifest.get('prefix_length', PREFIX_LENGTH))
+        self._plain_lengths = np.char.str_len(np.asarray(self.plain_forms)) if len(self.plain_forms) else np.zeros(0, int)
+        self._cache = LRUCache(max_size=RESOLVE_CACHE_SIZE)
+
+    @property
+    def vocabulary_size(self) -> int:
+        return self.terms.shape[0]
+
+    @classmethod
+    def build(cls, vocabulary: dict, document_frequency: np.ndarray, max_distance: int = MAX_EDIT_DISTANCE,
+              prefix_length: int = PREFIX_LENGTH) -> "TermResolver":
+        """vocabulary: {term: cột} của vectorizer; document_frequency: số văn bản chứa term theo cột."""
+        terms = [None] * len(vocabulary)
+        for term, column in vocabulary.items():
+            terms[column] = term
+        plain_forms = [strip_accents(term) for term in terms]
+        document_frequency = np.asarray(document_frequency, dtype=np.int64)
+
+        # Cùng dạng bỏ dấu: cột phổ biến hơn đứng trước
+        plain_pairs = sorted(((plain, column) for column, plain in enumerate(plain_forms)),
+                             key=lambda pair: (pair[0], -int(document_frequency[pair[1]]), pair[1]))
+        deletion_pairs = sorted({
+            (deletion, column)
+            for column, plain in enumerate(plain_forms)
+            for deletion in deletions(plain[:prefix_length], max_distance)
+        })
+        plain_keys, plain_offsets, plain_columns = _group(plain_pairs)
+        deletion_keys, deletion_offsets, deletion_columns = _group(deletion_pairs)
+        arrays = {
+            'terms': np.array(terms, dtype=str),
+            'plain_forms': np.array(plain_forms, dtype=str),
+            'document_frequency': document_frequency,
+            'plain_keys': plain_keys, 'plain_offsets': plain_offsets, 'plain_columns': plain_columns,
+            'deletion_keys': deletion_keys, 'deletion_offsets': deletion_offsets, 'deletion_columns': deletion_columns,
+        }
+        manifest = {
+            'max_edit_distance': max_distance,
+            'prefix_length': prefix_length,
+            'plain_keys': int(plain_keys.size),
+            'deletion_keys': int(deletion_keys.size),
+            'deletion_entries': int(deletion_columns.size),
+        }
+        return cls(arrays, manifest)
+
+    # --- Phân giải ---
+
+    @staticmethod
+    def _lookup(table: tuple, lookups: list) -> np.ndarray:
+        """Các cột của mọi khóa trong lookups có trong bảng (khóa, offsets, cột)."""
+        keys, offsets, columns = table
+        if not keys.size or not lookups:
+            return np.empty(0, dtype=np.int32)
+        lookups = np.array(lookups, dtype=str)
+        positions = np.minimum(np.searchsorted(keys, lookups), keys.size - 1)
+        found = positions[keys[positions] == lookups].tolist()
+        if not found:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate([columns[offsets[position]:offsets[position + 1]] for position in found])
+
+    def _max_distance_for(self, length: int) -> int:
+        if length < FUZZY_MIN_LENGTH:
+            return 0
+        return min(self.max_distance, 1 if length < FUZZY_LONG_LENGTH else 2)
+
+    def _best_column(self, token: str, columns: list, distances: list) -> int:
+        """Cột có (khoảng cách bỏ dấu, khoảng cách có dấu, -số văn bản) nhỏ nhất."""
+        best_distance = min(distances)
+        columns = [column for column, distance in zip(columns, distances) if distance == best_distance]
+        if len(columns) == 1:
+            return columns[0]
+        return min(columns, key=lambda column: (edit_distance(token, str(self.terms[column]), len(token) + 1),
+                                                -int(self.document_frequency[column]), column))
+
+    def resolve(self, token: str, max_distance: int = None) -> tuple:
+        """
+        (term, cách phân giải: 'accent' hoặc 'typo') cho một token ngoài từ vựng, (None, None) nếu không
+        có term nào đủ gần. max_distance: giới hạn thêm số ký tự được sửa.
+        """
+        key = (token, max_distance)
+        cached = self._cache.get(key)
+        if cached is None:
+            cached = self._resolve(token, max_distance)
+            self._cache.put(key, cached if cached is not None else _UNRESOLVED)
+        return (None, None) if cached is _UNRESOLVED or cached is None else cached
+
+    def _resolve(self, token: str, max_distance: int):
+        plain = strip_accents(token)
+        columns = self._lookup(self._plain, [plain])
+        if columns.size:
+            return str(self.terms[self._best_column(token, columns.tolist(), [0] * columns.size)]), 'accent'
+
+        allowed = self._max_distance_for(len(plain))
+        if max_distance is not None:
+            allowed = min(allowed, max_distance)
+        if allowed == 0:
+            return None
+        candidates = np.unique(self._lookup(self._deletions, list(deletions(plain[:self.prefix_length], allowed))))
+        candidates = candidates[np.abs(self._plain_lengths[candidates] - len(plain)) <= allowed].tolist()
+        matches, distances = [], []
+        for column in candidates:
+            distance = edit_distance(plain, str(self.plain_forms[column]), allowed)
+            if distance <= allowed:
+                matches.append(column)
+                distances.append(distance)
+        if not matches:
+            return None
+        return str(self.terms[self._best_column(token, matches, distances)]), 'typo'
+
+    def resolve_tokens(self, tokens: list, vocabulary: dict) -> list:
+        """
+        Các token của truy vấn (QueryVectorizer.analyze) sau khi phân giải: token trong vocabulary giữ nguyên,
+        nhóm token liền kề có token ngoài từ vựng được thử ghép trước (nhóm dài trước), token không phân giải
+        được giữ nguyên (vectorizer bỏ qua).
+        """
+        if all(token in vocabulary for token in tokens):
+            return tokens
+        resolved = []
+        position = 0
+        while position < len(tokens):
+            for size in range(min(MAX_JOIN_TOKENS, len(tokens) - position), 1, -1):
+                window = tokens[position:position + size]
+                if all(token in vocabulary for token in window):
+                    continue
+                term, _ = self.resolve("_".join(window), JOIN_MAX_DISTANCE)
+                if term is not None:
+                    metrics.inc(metrics.resolved_terms_total, method='join')
+                    resolved.append(term)
+                    position += size
+                    break
+            else:
+                token = tokens[position]
+                if token not in vocabulary:
+                    term, method = self.resolve(token)
+                    if term is not None:
+                        metrics.inc(metrics.resolved_terms_total, method=method)
+                        token = term
+                resolved.append(token)
+                position += 1
+        return resolved
+
+    # --- Lưu / tải ---
+
+    def _arrays(self) -> dict:
+        return {
+            'terms': self.terms, 'plain_forms': self.plain_forms, 'document_frequency': self.document_frequency,
+            'plain_keys': self._plain[0], 'plain_offsets': self._plain[1], 'plain_columns': self._plain[2],
+            'deletion_keys': self._deletions[0], 'deletion_offsets': self._deletions[1],
+            'deletion_columns': self._deletions[2],
+        }
+
+    def save(self, output_dir: str, tfidf_model_version: str) -> dict:
+        """Ghi index ra output_dir (ghi thư mục tạm rồi đổi tên). Trả về manifest đã ghi."""
+        tmp_dir = index_store.new_temp_directory(output_dir)
+        files = {}
+        for name, array in self._arrays().items():
+            array = np.ascontiguousarray(array)
+            filename = f"{name}.npy"
+            np.save(os.path.join(tmp_dir, filename), array, allow_pickle=False)
+            files[name] = {'file': filename, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+        manifest = dict(self.manifest)
+        manifest.update({
+            'format': RESOLVER_FORMAT,
+            'version': RESOLVER_FORMAT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'tfidf_model_version': tfidf_model_version,
+            'vocabulary_size': self.vocabulary_size,
+            'files': files,
+        })
+        with open(os.path.join(tmp_dir, index_store.MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        index_store.replace_directory(tmp_dir, output_dir)
+        self.manifest = manifest
+        return manifest
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "TermResolver":
+        """Tải index; với mmap=True các mảng được memory-map ở chế độ chỉ đọc."""
+        with open(os.path.join(index_dir, index_store.MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != RESOLVER_FORMAT or manifest.get('version') != RESOLVER_FORMAT_VERSION:
+            raise ValueError(f"Định dạng index phân giải term không được hỗ trợ: {manifest.get('format')} "
+                             f"v{manifest.get('version')}")
+        arrays = {}
+        for name in _ARRAY_NAMES:
+            info = manifest['files'][name]
+            array = np.load(os.path.join(index_dir, info['file']), mmap_mode='r' if mmap else None,
+                            allow_pickle=False)
+            if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+                raise ValueError(f"File {info['file']} không khớp với manifest.")
+            arrays[name] = array
+        return cls(arrays, manifest)
+
+
+def index_exists(index_dir: str) -> bool:
+    return index_store.index_exists(index_dir)
@@ -1,13 +1,337 @@
 # backend/app/search_logic/tfidf_engine.py
-import joblib
+import hashlib
+import logging
 import os
+import threading
+from typing import TYPE_CHECKING
+
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer # Để Python hiểu type hint
-from scipy.sparse import csr_matrix # Để Python hiểu type hint
+from scipy.sparse import csr_matrix, csc_matrix, hstack, vstack # Để Python hiểu type hint
 
 # Import đường dẫn từ config
-from app.core.config import VECTORIZER_PATH, TFIDF_MATRIX_PATH, LOCATION_IDS_PATH
+from app.core.config import (
+    VECTORIZER_PATH, TFIDF_MATRIX_PATH, LOCATION_IDS_PATH, TFIDF_INDEX_DIR,
+    INDEX_MERGE_THRESHOLD, INDEX_REFIT_OOV_THRESHOLD, FILTER_CACHE_SIZE, SEMANTIC_INDEX_DIR, SEMANTIC_NPROBE,
+    TFIDF_SHARDS_DIR, SEARCH_SHARD_PROCESSES, TERM_RESOLVER_DIR, QUERY_TERM_RESOLUTION,
+    SYNONYM_EXPANSION_DIR, SYNONYM_EXPANSION_WEIGHT
+)
+from app.search_logic import index_store, semantic_index, synonym_expansion, term_resolver
+from app.search_logic.compact_matrix import CompactMatrix
+from app.search_logic.query_vectorizer import QueryVectorizer
+from app.search_logic.semantic_index import SemanticIndex
+from app.search_logic.synonym_expansion import SynonymExpansion
+from app.search_logic.term_resolver import TermResolver
+from app.search_logic.utils import LRUCache
+from app.core import metrics
+
+if TYPE_CHECKING:
+    # Chỉ dùng cho type hint: sklearn chỉ được import khi thật sự cần tái tạo/tải vectorizer
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger(__name__)
+
+
+def _score_postings(postings: csc_matrix, term_indices: np.ndarray, term_weights: np.ndarray):
+    """
+    Tính điểm (tích vô hướng) giữa vector truy vấn và các địa điểm bằng posting list.
+    postings là ma trận TF-IDF dạng CSC: cột j chứa các (row, weight) của term j
+    (hoặc CompactMatrix dạng CSC: trọng số float32/int8, scale int8 được nhân sau khi cộng).
+    Chỉ duyệt posting list của những term có trong truy vấn, nên chi phí tỉ lệ với
+    số posting chạm tới thay vì số địa điểm.
+    Trả về (rows, scores): các dòng có ít nhất một term chung và điểm tương ứng.
+    """
+    starts = postings.indptr[term_indices]
+    lengths = postings.indptr[term_indices + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    # Vị trí của từng posting trong mảng indices/data (nối các đoạn [start, end) lại)
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(total) + np.repeat(starts - offsets, lengths)
+
+    rows = postings.indices[positions]
+    contributions = postings.data[positions] * np.repeat(term_weights, lengths)
+
+    # Gộp đóng góp theo từng dòng
+    candidate_rows, inverse = np.unique(rows, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions, minlength=candidate_rows.size)
+    row_scale = getattr(postings, 'row_scale', None)
+    if row_scale is not None:
+        scores *= row_scale[candidate_rows]
+    return candidate_rows.astype(np.int64, copy=False), scores
+
+
+def _score_postings_batch(postings: CompactMatrix, query_matrix: csr_matrix) -> csr_matrix:
+    """
+    Phiên bản theo lô của _score_postings cho CompactMatrix dạng CSC (float32/int8): chỉ giải lượng tử
+    posting list của các term xuất hiện trong lô (không giải lượng tử cả index), rồi nhân ma trận thưa.
+    query_matrix: (số_truy_vấn, từ_vựng) dạng CSR. Trả về ma trận điểm (số_truy_vấn, số dòng) dạng CSR.
+    """
+    num_queries, num_rows = query_matrix.shape[0], postings.shape[0]
+    terms = np.unique(query_matrix.indices)
+    starts = postings.indptr[terms].astype(np.int64)
+    lengths = postings.indptr[terms + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return csr_matrix((num_queries, num_rows), dtype=np.float64)
+
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(total) + np.repeat(starts - offsets, lengths)
+    rows = postings.indices[positions].astype(np.int32)
+    weights = postings.data[positions].astype(np.float64)
+    if postings.row_scale is not None:
+        weights *= postings.row_scale[rows]
+    # Ma trận (term của lô, dòng) và truy vấn với cột đánh lại theo thứ tự của terms
+    term_matrix = csr_matrix((weights, rows, np.concatenate([[0], np.cumsum(lengths)])),
+                             shape=(terms.size, num_rows))
+    local_queries = csr_matrix(
+        (query_matrix.data, np.searchsorted(terms, query_matrix.indices), query_matrix.indptr),
+        shape=(num_queries, terms.size)
+    )
+    return local_queries @ term_matrix
+
+
+def _replace_csr_row(matrix: csr_matrix, row: int, vector: csr_matrix) -> csr_matrix:
+    """Bản sao của matrix (CSR) với dòng row thay bằng vector (CSR một dòng), ghép trực tiếp các đoạn indptr."""
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    indptr = matrix.indptr.astype(np.int64)
+    indptr[row + 1:] += vector.nnz - (end - start)
+    return csr_matrix(
+        (np.concatenate([matrix.data[:start], vector.data, matrix.data[end:]]),
+         np.concatenate([matrix.indices[:start], vector.indices, matrix.indices[end:]]), indptr),
+        shape=matrix.shape
+    )
+
+
+def _select_top_k(rows: np.ndarray, scores: np.ndarray, k: int):
+    """
+    Chọn k cặp (row, score) có điểm cao nhất bằng argpartition (không sort toàn bộ).
+    Thứ tự: điểm giảm dần, hòa điểm thì row lớn hơn đứng trước
+    (giống np.argsort(scores)[::-1] của cách tính cũ).
+    """
+    if k <= 0 or rows.size == 0:
+        return rows[:0], scores[:0]
+    if rows.size > k:
+        partitioned = np.argpartition(scores, -k)[-k:]
+        threshold = scores[partitioned].min()
+        # Giữ cả các phần tử hòa điểm ở ngưỡng để thứ tự hòa điểm được quyết định nhất quán
+        keep = np.flatnonzero(scores >= threshold)
+        rows, scores = rows[keep], scores[keep]
+    order = np.lexsort((-rows, -scores))[:k]
+    return rows[order], scores[order]
+
+
+def _select_top_k_per_row(score_matrix: csr_matrix, k: int, excluded_rows: np.ndarray = None):
+    """
+    Chọn top-k cho từng dòng của ma trận điểm (mỗi dòng là một truy vấn) mà không lặp
+    Python theo từng truy vấn: sắp xếp một lần theo (truy vấn, -score, -row) rồi giữ
+    k phần tử đầu của mỗi nhóm. Thứ tự trong nhóm giống _select_top_k.
+    excluded_rows: mảng bool theo cột (địa điểm); các cột True bị bỏ qua.
+    Trả về (query_positions, rows, scores) đã sắp xếp theo truy vấn.
+    """
+    counts = np.diff(score_matrix.indptr)
+    query_positions = np.repeat(np.arange(score_matrix.shape[0]), counts)
+    rows = score_matrix.indices.astype(np.int64, copy=False)
+    scores = score_matrix.data
+
+    positive = scores > 0
+    if excluded_rows is not None:
+        positive &= ~excluded_rows[rows]
+    query_positions, rows, scores = query_positions[positive], rows[positive], scores[positive]
+    if k <= 0 or rows.size == 0:
+        return query_positions[:0], rows[:0], scores[:0]
+
+    order = np.lexsort((-rows, -scores, query_positions))
+    sorted_queries = query_positions[order]
+    # Hạng của mỗi phần tử trong nhóm truy vấn của nó
+    group_starts = np.searchsorted(sorted_queries, sorted_queries, side='left')
+    ranks = np.arange(order.size) - group_starts
+    keep = order[ranks < k]
+    return query_positions[keep], rows[keep], scores[keep]
+
+
+def current_artifacts_signature() -> tuple:
+    """
+    Chữ ký (đường dẫn, mtime, kích thước) của các file model mà TFIDFEngine sẽ tải,
+    dùng để phát hiện model trên đĩa đã được build lại.
+    """
+    if index_store.index_exists(TFIDF_INDEX_DIR):
+        paths = [os.path.join(TFIDF_INDEX_DIR, index_store.MANIFEST_FILENAME)]
+    else:
+        paths = [VECTORIZER_PATH, TFIDF_MATRIX_PATH, LOCATION_IDS_PATH]
+    if semantic_index.index_exists(SEMANTIC_INDEX_DIR):
+        paths.append(os.path.join(SEMANTIC_INDEX_DIR, index_store.MANIFEST_FILENAME))
+    if SEARCH_SHARD_PROCESSES > 0 and index_store.index_exists(TFIDF_SHARDS_DIR):
+        paths.append(os.path.join(TFIDF_SHARDS_DIR, index_store.MANIFEST_FILENAME))
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+class _IndexState:
+    """
+    Ảnh chụp bất biến của index mà một truy vấn sử dụng:
+    - Segment gốc: tfidf_matrix (CSR), postings (CSC) và location_ids tải từ file model.
+    - Segment delta: các địa điểm thêm/sửa sau khi tải (vector hóa bằng từ vựng và IDF hiện tại),
+      dòng j của delta có chỉ số toàn cục len(location_ids) + j.
+    - tombstones: mảng bool theo chỉ số toàn cục, True = dòng đã bị xóa hoặc bị thay bằng bản mới.
+    Mỗi thay đổi tạo một _IndexState mới rồi gán thay thế, nên truy vấn đang chạy không bị ảnh hưởng.
+    """
+
+    def __init__(self, tfidf_matrix: csr_matrix, postings: csc_matrix, location_ids: list,
+                 delta_ids: list = None, delta_matrix: csr_matrix = None, tombstones: np.ndarray = None,
+                 base_row_by_id: dict = None, delta_row_by_id: dict = None):
+        self.tfidf_matrix = tfidf_matrix
+        self.postings = postings
+        self.location_ids = location_ids
+        self.delta_ids = delta_ids or []
+        self.delta_matrix = delta_matrix
+        self.delta_postings = delta_matrix.tocsc() if delta_matrix is not None else None
+        self.tombstones = tombstones
+        self.base_row_by_id = base_row_by_id # Tạo khi cần lần đầu (xem _base_row_map)
+        self.delta_row_by_id = delta_row_by_id or {}
+
+    @property
+    def num_base_rows(self) -> int:
+        return self.tfidf_matrix.shape[0]
+
+    @property
+    def num_rows(self) -> int:
+        """Tổng số dòng toàn cục (gốc + delta), kể cả các dòng đã xóa."""
+        return self.num_base_rows + len(self.delta_ids)
+
+    @property
+    def num_deleted(self) -> int:
+        return int(self.tombstones.sum()) if self.tombstones is not None else 0
+
+    @property
+    def has_updates(self) -> bool:
+        return bool(self.delta_ids) or self.tombstones is not None
+
+    def location_id_at(self, row: int):
+        if row < self.num_base_rows:
+            return self.location_ids[row]
+        return self.delta_ids[row - self.num_base_rows]
+
+    def drop_deleted(self, rows: np.ndarray, scores: np.ndarray):
+        """Bỏ các dòng đã bị xóa khỏi (rows, scores)."""
+        if self.tombstones is None:
+            return rows, scores
+        alive = ~self.tombstones[rows]
+        return rows[alive], scores[alive]
+
+    def _base_row_map(self) -> dict:
+        """Map ID -> dòng của segment gốc, tạo ở lần dùng đầu tiên (không tốn chi phí lúc khởi động)."""
+        if self.base_row_by_id is None:
+            self.base_row_by_id = {location_id: row for row, location_id in enumerate(self.location_ids)}
+        return self.base_row_by_id
+
+    def live_row_of(self, location_id):
+        """Chỉ số toàn cục của bản hiện hành của location_id, hoặc None."""
+        row = self.delta_row_by_id.get(location_id)
+        if row is not None:
+            return row
+        row = self._base_row_map().get(location_id)
+        if row is not None and (self.tombstones is None or not self.tombstones[row]):
+            return row
+        return None
+
+    def live_mask(self) -> np.ndarray:
+        """Mảng bool theo chỉ số toàn cục, True = dòng chưa bị xóa."""
+        if self.tombstones is None:
+            return np.ones(self.num_rows, dtype=bool)
+        return ~self.tombstones
+
+
+class RowFilter:
+    """
+    Tập địa điểm được phép xuất hiện trong kết quả, đã chuyển thành mask theo dòng của một
+    ảnh chụp index (state). Được áp dụng ngay khi tính điểm, trước khi chọn top-k, nên luôn
+    trả đủ num_results kết quả (nếu có) thay vì lọc sau trên top-k.
+    - allowed_ids: chỉ giữ các ID này (None = không giới hạn).
+    - excluded_ids: bỏ các ID này (vd: địa điểm bị ẩn).
+    Tạo bằng TFIDFEngine.build_filter (có cache); dùng lại được cho nhiều truy vấn.
+    """
+
+    def __init__(self, state: _IndexState, allowed_ids: frozenset, excluded_ids: frozenset):
+        self.state = state
+        self.allowed_ids = allowed_ids
+        self.excluded_ids = excluded_ids
+        if allowed_ids is None:
+            mask = state.live_mask()
+        else:
+            mask = np.zeros(state.num_rows, dtype=bool)
+            rows = [state.live_row_of(location_id) for location_id in allowed_ids]
+            mask[[row for row in rows if row is not None]] = True
+        if excluded_ids:
+            rows = [state.live_row_of(location_id) for location_id in excluded_ids]
+            mask[[row for row in rows if row is not None]] = False
+        self.mask = mask
+        self.rows = np.flatnonzero(mask) # Các dòng được phép, tăng dần
+
+    @property
+    def count(self) -> int:
+        return self.rows.size
+
+    @property
+    def spec(self) -> tuple:
+        """Mô tả bộ lọc không phụ thuộc ảnh chụp (dùng làm key cache)."""
+        return (self.allowed_ids, self.excluded_ids)
+
+
+class _SemanticView:
+    """
+    Các vector của SemanticIndex còn dùng được với một ảnh chụp index (và bộ lọc):
+    - row_of: dòng toàn cục trong state của từng dòng của SemanticIndex (-1 = không dùng được:
+      địa điểm đã bị xóa, đã được sửa sau khi build hoặc không thuộc bộ lọc).
+    - valid: mask tương ứng (None = tất cả đều dùng được, không cần lọc).
+    - extra_rows/extra_vectors: các địa điểm thêm/sửa sau khi build (changed_ids) còn hiệu lực,
+      chiếu vector TF-IDF hiện tại của chúng vào không gian LSA và tính điểm chính xác.
+    """
+
+    def __init__(self, state: _IndexState, index: SemanticIndex, changed_ids: frozenset, row_filter: RowFilter = None):
+        self.state = state
+        if not changed_ids and not state.has_updates and row_filter is None and state.location_ids == index.location_ids:
+            self.row_of = np.arange(index.size, dtype=np.int64)
+            self.valid = None
+            self.extra_rows = np.empty(0, dtype=np.int64)
+            self.extra_vectors = np.empty((0, index.dimensions), dtype=np.float32)
+            return
+
+        row_of = np.full(index.size, -1, dtype=np.int64)
+        for semantic_row, location_id in enumerate(index.location_ids):
+            if location_id not in changed_ids:
+                row = state.live_row_of(location_id)
+                if row is not None:
+                    row_of[semantic_row] = row
+        valid = row_of >= 0
+        if row_filter is not None:
+            valid &= row_filter.mask[np.maximum(row_of, 0)]
+        row_of[~valid] = -1
+        self.row_of = row_of
+        self.valid = valid
+
+        extra_rows = []
+        for location_id in changed_ids:
+            row = state.live_row_of(location_id)
+            if row is not None and (row_filter is None or row_filter.mask[row]):
+                extra_rows.append(row)
+        self.extra_rows = np.array(sorted(extra_rows), dtype=np.int64)
+        if extra_rows:
+            tfidf_rows = [
+                state.tfidf_matrix[row] if row < state.num_base_rows else state.delta_matrix[row - state.num_base_rows]
+                for row in self.extra_rows.tolist()
+            ]
+            self.extra_vectors = index.project_rows(vstack(tfidf_rows, format='csr'))
+        else:
+            self.extra_vectors = np.empty((0, index.dimensions), dtype=np.float32)
+
 
 class TFIDFEngine:
     def __init__(self):
@@ -15,12 +339,160 @@ class TFIDFEngine:
         Khởi tạo TFIDFEngine bằng cách tải các model đã được huấn luyện.
         Việc tải này chỉ nên xảy ra một lần khi đối tượng TFIDFEngine được tạo.
         """
-        self.vectorizer: TfidfVectorizer = None
-        self.tfidf_matrix: csr_matrix = None
-        self.location_ids: list = None
+        self.query_vectorizer: QueryVectorizer = None # Biến đổi truy vấn trên đường tìm kiếm (không cần sklearn)
+        self._vectorizer: "TfidfVectorizer" = None
+        self._vectorizer_source: tuple = None # (manifest, vocabulary, idf) để tái tạo TfidfVectorizer khi cần
+        self._state: _IndexState = None # Segment gốc + delta + tombstone (xem _IndexState)
+        self.artifact_source: str = None # 'mmap' hoặc 'pkl'
+        self.base_model_version: str = None # Phiên bản của model tải từ file
+        self.model_version: str = None # Định danh phiên bản index hiện tại (dùng để vô hiệu hóa cache)
+        self._artifacts_signature: tuple = None
+        self._generation = 0 # Tăng sau mỗi lần thêm/sửa/xóa địa điểm
+        self._update_lock = threading.Lock()
+        self._merge_thread: threading.Thread = None
+        self._delta_tokens = 0 # Tổng số token của các mô tả được thêm/sửa
+        self._delta_oov_tokens = 0 # Số token không có trong từ vựng
+        self._filter_cache = LRUCache(max_size=FILTER_CACHE_SIZE) # (state, allowed, excluded) -> RowFilter
+        self.semantic_index: SemanticIndex = None # Index LSA + IVF (tùy chọn, xem calculate_semantic_similarity)
+        self._changed_ids = frozenset() # ID được thêm/sửa sau khi tải (vector LSA đã lưu không còn đúng)
+        self._semantic_view_cache = LRUCache(max_size=FILTER_CACHE_SIZE) # (state, bộ lọc) -> _SemanticView
+        self.sharded_searcher = None # Tìm kiếm scatter-gather trên index shard (SEARCH_SHARD_PROCESSES > 0)
+        self._sharded_base_matrix = None # Segment gốc mà các shard tương ứng (hết hiệu lực sau merge_updates)
+        self.term_resolver: TermResolver = None # Phân giải token ngoài từ vựng của truy vấn (xem vectorize_query)
+        self.synonym_expansion: SynonymExpansion = None # Mở rộng từ đồng nghĩa trên vector truy vấn
+        self._query_terms = None # Từ vựng + khóa đồng nghĩa thêm: token không cần phân giải
         self._load_artifacts()
 
+    # --- Thuộc tính của segment gốc (giữ tương thích với code cũ) ---
+
+    @property
+    def vectorizer(self) -> "TfidfVectorizer":
+        """
+        TfidfVectorizer của sklearn (cho script kiểm tra/benchmark; đường tìm kiếm dùng query_vectorizer).
+        Với index memory-map, vectorizer chỉ được tái tạo (import sklearn) ở lần truy cập đầu tiên.
+        """
+        if self._vectorizer is None and self._vectorizer_source is not None:
+            self._vectorizer = index_store.build_vectorizer(*self._vectorizer_source)
+        return self._vectorizer
+
+    @property
+    def tfidf_matrix(self) -> csr_matrix:
+        return self._state.tfidf_matrix if self._state is not None else None
+
+    @property
+    def location_ids(self) -> list:
+        return self._state.location_ids if self._state is not None else None
+
+    @property
+    def _postings(self) -> csc_matrix:
+        return self._state.postings if self._state is not None else None
+
+    def has_artifacts_changed(self) -> bool:
+        """Kiểm tra file model trên đĩa có khác với bản đã tải hay không."""
+        return current_artifacts_signature() != self._artifacts_signature
+
     def _load_artifacts(self):
+        """
+        Tải các thành phần TF-IDF. Ưu tiên index dạng memory-map (TFIDF_INDEX_DIR) vì khởi động
+        nhanh và các worker dùng chung page cache; nếu không có hoặc lỗi thì dùng các file .pkl.
+        """
+        self._artifacts_signature = current_artifacts_signature()
+        if index_store.index_exists(TFIDF_INDEX_DIR):
+            if self._load_mmap_index():
+                self._load_semantic_index()
+                self._load_term_resolver()
+                self._load_synonym_expansion()
+                self._load_sharded_searcher()
+                return
+            print("TFIDFEngine: Chuyển sang tải từ các file .pkl.")
+        self._load_pickle_artifacts()
+
+    def _load_semantic_index(self):
+        """Tải index ngữ nghĩa (nếu có) khi nó được build từ đúng index TF-IDF vừa tải."""
+        if not semantic_index.index_exists(SEMANTIC_INDEX_DIR):
+            return
+        try:
+            index = SemanticIndex.load(SEMANTIC_INDEX_DIR, mmap=True)
+            if (index.manifest.get('tfidf_model_version') != self.base_model_version
+                    or index.location_ids != self.location_ids
+                    or index.projection.shape[0] != self.query_vectorizer.vocabulary_size):
+                print("TFIDFEngine Cảnh báo: Index ngữ nghĩa không khớp model TF-IDF hiện tại, bỏ qua "
+                      "(chạy lại build_tfidf_model.py --semantic).")
+                return
+            self.semantic_index = index
+            print(f"TFIDFEngine: Tải thành công index ngữ nghĩa ({index.dimensions} chiều, {index.n_lists} cụm).")
+        except Exception as e:
+            print(f"TFIDFEngine Lỗi khi tải index ngữ nghĩa: {e}")
+
+    def _load_term_resolver(self):
+        """Tải index phân giải term (nếu có và QUERY_TERM_RESOLUTION bật) khi nó được build từ đúng model vừa tải."""
+        if not QUERY_TERM_RESOLUTION or not term_resolver.index_exists(TERM_RESOLVER_DIR):
+            return
+        try:
+            resolver = TermResolver.load(TERM_RESOLVER_DIR, mmap=True)
+            if (resolver.manifest.get('tfidf_model_version') != self.base_model_version
+                    or resolver.vocabulary_size != self.query_vectorizer.vocabulary_size):
+                print("TFIDFEngine Cảnh báo: Index phân giải term không khớp model TF-IDF hiện tại, bỏ qua "
+                      "(chạy lại build_tfidf_model.py).")
+                return
+            self.term_resolver = resolver
+            print(f"TFIDFEngine: Tải thành công index phân giải term ({resolver.manifest['deletion_keys']} khóa xóa ký tự).")
+        except Exception as e:
+            print(f"TFIDFEngine Lỗi khi tải index phân giải term: {e}")
+
+    def _load_synonym_expansion(self):
+        """Tải ma trận mở rộng từ đồng nghĩa (nếu có) khi nó được biên dịch theo đúng từ vựng vừa tải."""
+        self._query_terms = self.query_vectorizer.vocabulary
+        if not synonym_expansion.index_exists(SYNONYM_EXPANSION_DIR):
+            return
+        try:
+            expansion = SynonymExpansion.load(SYNONYM_EXPANSION_DIR, mmap=True)
+            if (expansion.manifest.get('tfidf_model_version') != self.base_model_version
+                    or expansion.vocabulary_size != self.query_vectorizer.vocabulary_size):
+                print("TFIDFEngine Cảnh báo: Ma trận mở rộng từ đồng nghĩa không khớp model TF-IDF hiện tại, bỏ qua "
+                      "(chạy lại build_tfidf_model.py).")
+                return
+            self.synonym_expansion = expansion
+            self._query_terms = {**self.query_vectorizer.vocabulary, **expansion.extra_vocabulary}
+            print(f"TFIDFEngine: Tải thành công ma trận mở rộng từ đồng nghĩa ({expansion.manifest['sources']} nguồn, "
+                  f"{expansion.manifest['entries']} phần tử).")
+        except Exception as e:
+            print(f"TFIDFEngine Lỗi khi tải ma trận mở rộng từ đồng nghĩa: {e}")
+
+    def _validate_artifacts(self, tfidf_matrix, location_ids):
+        """Kiểm tra sự nhất quán cơ bản giữa ma trận, danh sách ID và từ vựng."""
+        if tfidf_matrix.shape[0] != len(location_ids):
+            raise ValueError("Số dòng ma trận TF-IDF không khớp với số lượng ID địa điểm.")
+        if tfidf_matrix.shape[1] != self.query_vectorizer.vocabulary_size:
+             raise ValueError("Số cột ma trận TF-IDF không khớp với kích thước từ vựng của vectorizer.")
+
+    def _load_mmap_index(self) -> bool:
+        """Tải index dạng memory-map. Trả về True nếu thành công."""
+        print(f"TFIDFEngine: Đang tải index memory-map từ {TFIDF_INDEX_DIR}...")
+        try:
+            artifacts = index_store.load_index(TFIDF_INDEX_DIR, mmap=True)
+            self.query_vectorizer = index_store.build_query_vectorizer(
+                artifacts['manifest'], artifacts['vocabulary'], artifacts['idf']
+            )
+            self._vectorizer_source = (artifacts['manifest'], artifacts['vocabulary'], artifacts['idf'])
+            self._validate_artifacts(artifacts['tfidf_matrix'], artifacts['location_ids'])
+            # Posting list (CSC) đã được lưu sẵn nên không cần tocsc() - giữ nguyên vùng nhớ memory-map
+            self._state = _IndexState(artifacts['tfidf_matrix'], artifacts['postings'], artifacts['location_ids'])
+            self.artifact_source = 'mmap'
+            self.base_model_version = self.model_version = artifacts['manifest']['model_version']
+            print(f"TFIDFEngine: Tải thành công index (model_version={artifacts['manifest']['model_version']}, "
+                  f"storage={artifacts['manifest'].get('storage', 'float64')}).")
+            print(f"  - Kích thước từ vựng: {self.query_vectorizer.vocabulary_size}")
+            print(f"  - Kích thước ma trận TF-IDF: {self.tfidf_matrix.shape}")
+            return True
+        except Exception as e:
+            print(f"TFIDFEngine Lỗi khi tải index memory-map: {e}")
+            self.query_vectorizer = None
+            self._vectorizer_source = None
+            self._state = None
+            return False
+
+    def _load_pickle_artifacts(self):
         """Tải các thành phần TF-IDF từ file .pkl."""
         print("TFIDFEngine: Đang tải các thành phần TF-IDF...")
         try:
@@ -31,83 +503,537 @@ class TFIDFEngine:
             if not os.path.exists(LOCATION_IDS_PATH):
                 raise FileNotFoundError(f"Không tìm thấy file ID địa điểm tại: {LOCATION_IDS_PATH}")
 
-            self.vectorizer = joblib.load(VECTORIZER_PATH)
-            self.tfidf_matrix = joblib.load(TFIDF_MATRIX_PATH)
-            self.location_ids = joblib.load(LOCATION_IDS_PATH)
+            import joblib # Chỉ cần cho định dạng .pkl dự phòng (joblib kéo theo sklearn khi unpickle)
+
+            self._vectorizer = joblib.load(VECTORIZER_PATH)
+            self.query_vectorizer = QueryVectorizer.from_vectorizer(self._vectorizer)
+            tfidf_matrix = joblib.load(TFIDF_MATRIX_PATH)
+            location_ids = joblib.load(LOCATION_IDS_PATH)
             print("TFIDFEngine: Tải thành công vectorizer, ma trận TF-IDF, và danh sách ID.")
-            print(f"  - Kích thước từ vựng: {len(self.vectorizer.vocabulary_)}")
-            print(f"  - Kích thước ma trận TF-IDF: {self.tfidf_matrix.shape}")
-            print(f"  - Số lượng ID địa điểm: {len(self.location_ids)}")
+            print(f"  - Kích thước từ vựng: {self.query_vectorizer.vocabulary_size}")
+            print(f"  - Kích thước ma trận TF-IDF: {tfidf_matrix.shape}")
+            print(f"  - Số lượng ID địa điểm: {len(location_ids)}")
 
             # Kiểm tra sự nhất quán cơ bản
-            if self.tfidf_matrix.shape[0] != len(self.location_ids):
-                raise ValueError("Số dòng ma trận TF-IDF không khớp với số lượng ID địa điểm.")
-            if self.tfidf_matrix.shape[1] != len(self.vectorizer.vocabulary_):
-                 raise ValueError("Số cột ma trận TF-IDF không khớp với kích thước từ vựng của vectorizer.")
+            self._validate_artifacts(tfidf_matrix, location_ids)
+
+            # Chuyển sang dạng cột (CSC) một lần: mỗi cột là posting list của một term
+            postings = tfidf_matrix.tocsc()
+            postings.eliminate_zeros()
+            postings.sort_indices()
+            self._state = _IndexState(tfidf_matrix, postings, location_ids)
+            self.artifact_source = 'pkl'
+            self.base_model_version = hashlib.sha256(repr(self._artifacts_signature).encode('utf-8')).hexdigest()[:16]
+            self.model_version = self.base_model_version
 
         except FileNotFoundError as fnf_err:
             print(f"TFIDFEngine Lỗi: {fnf_err}")
             print("Vui lòng chạy script 'build_tfidf_model.py' để tạo các file cần thiết.")
             # Trong ứng dụng thực tế, bạn có thể muốn raise lỗi này để dừng ứng dụng
             # hoặc xử lý một cách mềm dẻo hơn.
-            self.vectorizer = None # Đặt lại để biết là chưa load được
+            self.query_vectorizer = self._vectorizer = None # Đặt lại để biết là chưa load được
         except Exception as e:
             print(f"TFIDFEngine Lỗi khi tải file .pkl: {e}")
-            self.vectorizer = None # Đặt lại
+            self.query_vectorizer = self._vectorizer = None # Đặt lại
+
+    def _load_sharded_searcher(self):
+        """Dùng index shard (nếu bật SEARCH_SHARD_PROCESSES) khi nó được build cùng index TF-IDF vừa tải."""
+        if SEARCH_SHARD_PROCESSES <= 0 or not index_store.index_exists(TFIDF_SHARDS_DIR):
+            return
+        from app.search_logic.sharded_index import ShardedSearcher # Tránh import vòng (sharded_index dùng hàm của module này)
+
+        try:
+            searcher = ShardedSearcher(TFIDF_SHARDS_DIR, SEARCH_SHARD_PROCESSES)
+            if (searcher.manifest.get('tfidf_model_version') != self.base_model_version
+                    or searcher.num_rows != self._state.num_base_rows):
+                print("TFIDFEngine Cảnh báo: Index shard không khớp model TF-IDF hiện tại, bỏ qua "
+                      "(chạy lại build_tfidf_model.py --shards N).")
+                return
+            self.sharded_searcher = searcher
+            self._sharded_base_matrix = self._state.tfidf_matrix
+            print(f"TFIDFEngine: Dùng index {searcher.num_shards} shard trên {searcher.num_processes} tiến trình.")
+        except Exception as e:
+            print(f"TFIDFEngine Lỗi khi tải index shard: {e}")
+
+    def close(self):
+        """Dừng process pool của index shard (nếu có); pool được tạo lại ở lần tìm kiếm sau."""
+        if self.sharded_searcher is not None:
+            self.sharded_searcher.close()
 
     def is_ready(self) -> bool:
         """Kiểm tra xem engine đã sẵn sàng (đã load model thành công) chưa."""
-        return self.vectorizer is not None and \
-               self.tfidf_matrix is not None and \
-               self.location_ids is not None
+        return self.query_vectorizer is not None and self._state is not None
+
+    def has_semantic_index(self) -> bool:
+        return self.is_ready() and self.semantic_index is not None
+
+    def build_filter(self, allowed_ids=None, excluded_ids=None) -> RowFilter:
+        """
+        Tạo (hoặc lấy từ cache) RowFilter cho ảnh chụp index hiện tại.
+        Trả về None nếu không có điều kiện lọc nào.
+        """
+        allowed_ids = frozenset(allowed_ids) if allowed_ids is not None else None
+        excluded_ids = frozenset(excluded_ids) if excluded_ids else None
+        if allowed_ids is None and excluded_ids is None:
+            return None
+        state = self._state
+        # id(state) là duy nhất trong khi RowFilter trong cache còn giữ tham chiếu tới state
+        key = (id(state), allowed_ids, excluded_ids)
+        row_filter = self._filter_cache.get(key)
+        if row_filter is None or row_filter.state is not state:
+            row_filter = RowFilter(state, allowed_ids, excluded_ids)
+            self._filter_cache.put(key, row_filter)
+        return row_filter
+
+    def _bind_filter(self, state: _IndexState, row_filter: RowFilter) -> RowFilter:
+        """RowFilter tương ứng với state (tạo lại nếu index đã thay đổi từ lúc tạo bộ lọc)."""
+        if row_filter is None or row_filter.state is state:
+            return row_filter
+        return RowFilter(state, row_filter.allowed_ids, row_filter.excluded_ids)
+
+    def _score_query_vector(self, state: _IndexState, term_indices: np.ndarray, term_weights: np.ndarray,
+                            row_filter: RowFilter = None):
+        """
+        Tính điểm của vector truy vấn (term_indices, term_weights từ query_vectorizer.transform) trên
+        segment gốc và segment delta của state, bỏ các dòng đã bị xóa và các dòng không thuộc row_filter.
+        Trả về (rows, scores) theo chỉ số toàn cục.
+        """
+        if row_filter is not None:
+            # Bộ lọc chọn lọc cao: tính trực tiếp trên các dòng được phép rẻ hơn duyệt posting list
+            posting_cost = int((state.postings.indptr[term_indices + 1] - state.postings.indptr[term_indices]).sum())
+            row_cost = row_filter.count * state.tfidf_matrix.nnz / max(1, state.num_base_rows)
+            if row_cost < posting_cost:
+                return self._score_rows_directly(state, term_indices, term_weights, row_filter.rows)
+
+        candidate_rows, candidate_scores = _score_postings(state.postings, term_indices, term_weights)
+        if state.delta_postings is not None:
+            delta_rows, delta_scores = _score_postings(state.delta_postings, term_indices, term_weights)
+            candidate_rows = np.concatenate([candidate_rows, delta_rows + state.num_base_rows])
+            candidate_scores = np.concatenate([candidate_scores, delta_scores])
+        if row_filter is not None:
+            allowed = row_filter.mask[candidate_rows] # Mask đã loại các dòng bị xóa
+            return candidate_rows[allowed], candidate_scores[allowed]
+        return state.drop_deleted(candidate_rows, candidate_scores)
+
+    def _score_rows_directly(self, state: _IndexState, term_indices: np.ndarray, term_weights: np.ndarray,
+                             rows: np.ndarray):
+        """Tích vô hướng giữa vector truy vấn và các dòng rows (chỉ số toàn cục, tăng dần)."""
+        query = np.zeros(state.tfidf_matrix.shape[1], dtype=term_weights.dtype)
+        query[term_indices] = term_weights
+        base_rows = rows[rows < state.num_base_rows]
+        if isinstance(state.tfidf_matrix, CompactMatrix):
+            scores = [state.tfidf_matrix.dot_rows(base_rows, query)]
+        else:
+            scores = [state.tfidf_matrix[base_rows] @ query]
+        if state.delta_matrix is not None:
+            delta_rows = rows[base_rows.size:] - state.num_base_rows
+            scores.append(state.delta_matrix[delta_rows] @ query)
+        return rows, np.concatenate(scores)
+
+    def resolve_query_terms(self, processed_query_text: str) -> str:
+        """
+        Chuỗi token của truy vấn sau khi phân giải các token ngoài từ vựng (gõ không dấu, gõ sai, từ ghép
+        bị tách) thành term của từ vựng (xem TermResolver). Giữ nguyên nếu không có index phân giải.
+        """
+        if self.term_resolver is None or not processed_query_text:
+            return processed_query_text
+        tokens = self.query_vectorizer.analyze(processed_query_text)
+        resolved = self.term_resolver.resolve_tokens(tokens, self._query_terms or self.query_vectorizer.vocabulary)
+        return processed_query_text if resolved is tokens else " ".join(resolved)
+
+    def has_synonym_expansion(self) -> bool:
+        return self.synonym_expansion is not None
 
-    def calculate_similarity(self, processed_query_text: str, num_results: int = 5) -> list:
+    def vectorize_query(self, processed_query_text: str, synonym_weight: float = None):
+        """
+        Vector TF-IDF (indices, weights) của truy vấn đã tiền xử lý, sau bước phân giải term và mở rộng từ
+        đồng nghĩa trên vector tần suất (xem SynonymExpansion). synonym_weight: trọng số từ đồng nghĩa
+        (mặc định SYNONYM_EXPANSION_WEIGHT, 0 = không mở rộng).
+        """
+        processed_query_text = self.resolve_query_terms(processed_query_text)
+        expansion = self.synonym_expansion
+        weight = SYNONYM_EXPANSION_WEIGHT if synonym_weight is None else synonym_weight
+        if expansion is None or weight <= 0:
+            return self.query_vectorizer.transform(processed_query_text)
+        indices, counts = self.query_vectorizer.term_counts(processed_query_text, expansion.extra_vocabulary)
+        indices, counts = expansion.expand(indices, counts, weight)
+        if not indices.size:
+            return indices, counts
+        return indices, self.query_vectorizer.weight_counts(indices, counts)
+
+    def snapshot(self) -> _IndexState:
+        """Ảnh chụp index hiện tại; dùng chung cho mọi bước của một truy vấn (score_candidates, location_id_at...)."""
+        return self._state
+
+    def score_candidates(self, processed_query_text: str, state: _IndexState = None, row_filter: RowFilter = None,
+                         synonym_weight: float = None):
+        """
+        Điểm cosine của mọi địa điểm có ít nhất một term chung với truy vấn (chưa chọn top-k),
+        dạng (rows, scores) theo chỉ số toàn cục của state. Dùng cho HybridRanker.
+        """
+        state = state or self._state
+        if not self.is_ready() or not processed_query_text:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        term_indices, term_weights = self.vectorize_query(processed_query_text, synonym_weight)
+        rows, scores = self._score_query_vector(state, term_indices, term_weights, self._bind_filter(state, row_filter))
+        positive = scores > 0
+        return rows[positive], scores[positive]
+
+    def calculate_similarity(self, processed_query_text: str, num_results: int = 5,
+                             row_filter: RowFilter = None, synonym_weight: float = None) -> list:
         """
         Tính toán độ tương đồng và trả về top N địa điểm phù hợp nhất.
         Input:
             processed_query_text: Chuỗi truy vấn đã được tiền xử lý và tách từ.
             num_results: Số lượng kết quả trả về.
+            row_filter: (Tùy chọn) chỉ xét các địa điểm thuộc bộ lọc (xem build_filter).
+            synonym_weight: (Tùy chọn) trọng số từ đồng nghĩa khi mở rộng truy vấn (xem vectorize_query).
         Output:
             List các tuple (location_id, score), đã sắp xếp theo score giảm dần.
             Trả về list rỗng nếu có lỗi hoặc không tìm thấy.
         """
         if not self.is_ready():
-            print("TFIDFEngine chưa sẵn sàng. Model chưa được tải.")
+            logger.warning("TFIDFEngine chưa sẵn sàng. Model chưa được tải.")
             return []
         if not processed_query_text:
             return []
 
         try:
-            # 1. Biến đổi truy vấn thành vector TF-IDF
-            # self.vectorizer.transform nhận vào một iterable (ví dụ list)
-            query_vector = self.vectorizer.transform([processed_query_text])
-
-            # 2. Tính toán độ tương đồng cosine
-            # Kết quả là một ma trận (1, số_lượng_địa_điểm), lấy dòng đầu tiên
-            similarity_scores = cosine_similarity(query_vector, self.tfidf_matrix)[0]
-
-            # 3. Lấy ra num_results địa điểm phù hợp nhất
-            # argsort trả về chỉ số của các phần tử nếu được sắp xếp tăng dần
-            # [::-1] để đảo ngược thành giảm dần
-            # [:num_results] để lấy N phần tử đầu tiên
-            # Đảm bảo num_results không lớn hơn số lượng địa điểm
-            actual_num_results = min(num_results, len(self.location_ids))
-            top_indices = np.argsort(similarity_scores)[::-1][:actual_num_results]
+            state = self._state # Dùng một ảnh chụp index cho cả truy vấn
 
-            results = []
-            for i in top_indices:
-                location_id = self.location_ids[i]
-                score = float(similarity_scores[i]) # Chuyển sang float cơ bản của Python
+            # 1. Biến đổi truy vấn thành vector TF-IDF (các cột có trong từ vựng và trọng số)
+            with metrics.span('vectorize'):
+                term_indices, term_weights = self.vectorize_query(processed_query_text, synonym_weight)
+
+            # 2. Tính điểm trên posting list của các term có trong truy vấn
+            # Các dòng của ma trận và vector truy vấn đều đã chuẩn hóa L2 nên
+            # tích vô hướng chính là độ tương đồng cosine.
+            # Có index shard (và không lọc): mỗi shard tính top-k song song, trộn lại bằng heap
+            if row_filter is None and self._can_scatter(state):
+                top_rows, top_scores = self._scatter_gather(state, term_indices, term_weights, num_results)
+            else:
+                with metrics.span('scoring'):
+                    candidate_rows, candidate_scores = self._score_query_vector(
+                        state, term_indices, term_weights, self._bind_filter(state, row_filter)
+                    )
+                metrics.observe(metrics.candidates, candidate_rows.size)
+
+                # 3. Lấy ra num_results địa điểm phù hợp nhất bằng partial selection
                 # Chỉ lấy kết quả có điểm > 0 (hoặc một ngưỡng nào đó nếu muốn)
-                if score > 0: # Có thể đặt ngưỡng cao hơn, ví dụ 0.01
-                    results.append((location_id, score))
+                with metrics.span('top_k'):
+                    positive = candidate_scores > 0
+                    top_rows, top_scores = _select_top_k(
+                        candidate_rows[positive], candidate_scores[positive], num_results
+                    )
+
+            results = []
+            for i, score in zip(top_rows, top_scores):
+                location_id = state.location_id_at(i)
+                results.append((location_id, float(score))) # Chuyển sang float cơ bản của Python
             
             return results
 
-        except Exception as e:
-            print(f"TFIDFEngine Lỗi khi tính toán độ tương đồng: {e}")
+        except Exception:
+            metrics.inc(metrics.errors_total, stage='tfidf')
+            logger.exception("TFIDFEngine Lỗi khi tính toán độ tương đồng")
+            return []
+
+    def _can_scatter(self, state: _IndexState) -> bool:
+        return self.sharded_searcher is not None and state.tfidf_matrix is self._sharded_base_matrix
+
+    def _scatter_gather(self, state: _IndexState, term_indices: np.ndarray, term_weights: np.ndarray, k: int):
+        """
+        Top-k qua index shard: segment gốc được tính trên các tiến trình shard (bỏ dòng đã xóa),
+        segment delta tính tại chỗ rồi trộn cùng. Kết quả giống hệt cách tính trên một index.
+        Nếu process pool lỗi thì tính tại chỗ.
+        """
+        with metrics.span('delta_scoring'):
+            extra = []
+            delta_candidates = 0
+            if state.delta_postings is not None:
+                delta_rows, delta_scores = _score_postings(state.delta_postings, term_indices, term_weights)
+                delta_rows += state.num_base_rows
+                delta_rows, delta_scores = state.drop_deleted(delta_rows, delta_scores)
+                positive = delta_scores > 0
+                delta_candidates = int(positive.sum())
+                extra.append(_select_top_k(delta_rows[positive], delta_scores[positive], k))
+        try:
+            with metrics.span('scatter_gather'):
+                rows, scores, candidates = self.sharded_searcher.search(
+                    term_indices, term_weights, k, tombstones=state.tombstones, extra=extra
+                )
+        except Exception:
+            metrics.inc(metrics.errors_total, stage='shards')
+            logger.exception("TFIDFEngine Lỗi khi tìm kiếm trên index shard, tính tại chỗ")
+            candidate_rows, candidate_scores = self._score_query_vector(state, term_indices, term_weights)
+            positive = candidate_scores > 0
+            return _select_top_k(candidate_rows[positive], candidate_scores[positive], k)
+        metrics.observe(metrics.candidates, candidates + delta_candidates)
+        return rows, scores
+
+    def _semantic_view(self, state: _IndexState, row_filter: RowFilter = None) -> _SemanticView:
+        if row_filter is None:
+            key = (id(state), None, None)
+        else:
+            key = (id(state), row_filter.allowed_ids, row_filter.excluded_ids)
+        view = self._semantic_view_cache.get(key)
+        if view is None or view.state is not state:
+            view = _SemanticView(state, self.semantic_index, self._changed_ids, row_filter)
+            self._semantic_view_cache.put(key, view)
+        return view
+
+    def calculate_semantic_similarity(self, processed_query_text: str, num_results: int = 5,
+                                      row_filter: RowFilter = None, n_probe: int = None,
+                                      synonym_weight: float = None) -> list:
+        """
+        Tìm kiếm ngữ nghĩa: độ tương đồng cosine trong không gian LSA, top-k gần đúng bằng IVF
+        (duyệt n_probe cụm, mặc định SEMANTIC_NPROBE). Địa điểm thêm/sửa sau khi build index
+        ngữ nghĩa được chiếu và tính điểm chính xác. Cùng dạng kết quả với calculate_similarity;
+        trả về list rỗng nếu không có index ngữ nghĩa (xem has_semantic_index).
+        """
+        if not self.has_semantic_index() or not processed_query_text:
+            return []
+        try:
+            state = self._state
+            index = self.semantic_index
+            with metrics.span('vectorize'):
+                term_indices, term_weights = self.vectorize_query(processed_query_text, synonym_weight)
+                query = index.project(term_indices, term_weights)
+            if query is None:
+                return []
+
+            with metrics.span('semantic_search'):
+                view = self._semantic_view(state, self._bind_filter(state, row_filter))
+                semantic_rows, scores = index.search(query, num_results, n_probe or SEMANTIC_NPROBE, view.valid)
+                rows = view.row_of[semantic_rows]
+                if view.extra_rows.size:
+                    rows = np.concatenate([rows, view.extra_rows])
+                    scores = np.concatenate([scores, view.extra_vectors @ query])
+                positive = scores > 0
+                top_rows, top_scores = _select_top_k(rows[positive], scores[positive], num_results)
+
+            return [(state.location_id_at(row), float(score)) for row, score in zip(top_rows.tolist(), top_scores.tolist())]
+
+        except Exception:
+            metrics.inc(metrics.errors_total, stage='semantic')
+            logger.exception("TFIDFEngine Lỗi khi tìm kiếm ngữ nghĩa")
             return []
 
+    def calculate_similarity_batch(self, processed_query_texts: list, num_results: int = 5,
+                                   row_filter: RowFilter = None, synonym_weight: float = None) -> list:
+        """
+        Phiên bản theo lô của calculate_similarity, dùng cho các job offline
+        (chạy lại log truy vấn, tính trước gợi ý...).
+        Input:
+            processed_query_texts: List các chuỗi truy vấn đã tiền xử lý và tách từ.
+            num_results: Số lượng kết quả trả về cho mỗi truy vấn.
+            row_filter: (Tùy chọn) bộ lọc áp dụng cho mọi truy vấn trong lô.
+            synonym_weight: (Tùy chọn) trọng số từ đồng nghĩa cho mọi truy vấn trong lô.
+        Output:
+            List cùng độ dài với processed_query_texts; phần tử thứ i là list các tuple
+            (location_id, score) của truy vấn thứ i, giống kết quả của calculate_similarity.
+        """
+        if not processed_query_texts:
+            return []
+        if not self.is_ready():
+            logger.warning("TFIDFEngine chưa sẵn sàng. Model chưa được tải.")
+            return [[] for _ in processed_query_texts]
+
+        try:
+            state = self._state
+
+            # 1. Vector hóa toàn bộ truy vấn thành một ma trận (số_truy_vấn, từ_vựng)
+            with metrics.span('vectorize_batch'):
+                query_matrix = self.query_vectorizer.stack_vectors(
+                    [self.vectorize_query(text, synonym_weight) for text in processed_query_texts]
+                )
+
+            # 2. Ma trận điểm cả lô: (số_truy_vấn, số_lượng_địa_điểm)
+            # state.postings.T là ma trận (từ_vựng, số_lượng_địa_điểm) dạng CSR, không cần copy;
+            # index dạng gọn được tính thẳng trên posting list, không giải lượng tử cả index
+            with metrics.span('scoring_batch'):
+                if isinstance(state.postings, CompactMatrix):
+                    score_matrix = _score_postings_batch(state.postings, query_matrix)
+                else:
+                    score_matrix = query_matrix @ state.postings.T
+                if state.delta_postings is not None:
+                    score_matrix = hstack([score_matrix, query_matrix @ state.delta_postings.T])
+                score_matrix = score_matrix.tocsr()
+
+            # 3. Chọn top-k cho từng truy vấn (bỏ các dòng đã bị xóa hoặc không thuộc bộ lọc)
+            with metrics.span('top_k_batch'):
+                row_filter = self._bind_filter(state, row_filter)
+                excluded_rows = ~row_filter.mask if row_filter is not None else state.tombstones
+                query_positions, top_rows, top_scores = _select_top_k_per_row(
+                    score_matrix, num_results, excluded_rows=excluded_rows
+                )
+
+            results = [[] for _ in processed_query_texts]
+            for position, i, score in zip(query_positions.tolist(), top_rows.tolist(), top_scores.tolist()):
+                results[position].append((state.location_id_at(i), score))
+            return results
+
+        except Exception:
+            metrics.inc(metrics.errors_total, stage='tfidf_batch')
+            logger.exception("TFIDFEngine Lỗi khi tính toán độ tương đồng theo lô")
+            return [[] for _ in processed_query_texts]
+
+    # --- Cập nhật index từng địa điểm (không cần build lại toàn bộ) ---
+
+    def upsert_location(self, location_id, processed_text: str) -> bool:
+        """
+        Thêm mới hoặc cập nhật một địa điểm. processed_text là mô tả đã tách từ giống lúc build
+        (xem preprocessor.preprocess_document). Mô tả được vector hóa bằng từ vựng và IDF hiện tại
+        rồi đưa vào segment delta; bản cũ (nếu có) bị đánh dấu tombstone.
+        Trả về True nếu thành công.
+        """
+        if not self.is_ready():
+            print("TFIDFEngine chưa sẵn sàng. Model chưa được tải.")
+            return False
+
+        query_vectorizer = self.query_vectorizer
+        vector = query_vectorizer.transform_matrix([processed_text or ""])
+        tokens = query_vectorizer.analyze(processed_text or "")
+        oov_tokens = sum(1 for token in tokens if token not in query_vectorizer.vocabulary)
+
+        with self._update_lock:
+            state = self._ensure_mutable_state(self._state)
+            delta_ids = list(state.delta_ids)
+            delta_row_by_id = dict(state.delta_row_by_id)
+            tombstones = state.tombstones.copy()
+
+            old_row = state.live_row_of(location_id)
+            if old_row is not None and old_row >= state.num_base_rows:
+                # Đã có trong delta: thay dòng đó bằng vector mới
+                delta_matrix = _replace_csr_row(state.delta_matrix, old_row - state.num_base_rows, vector)
+            else:
+                if old_row is not None:
+                    tombstones[old_row] = True
+                delta_ids.append(location_id)
+                delta_matrix = vector if state.delta_matrix is None else vstack([state.delta_matrix, vector], format='csr')
+                delta_row_by_id[location_id] = state.num_base_rows + len(delta_ids) - 1
+                tombstones = np.append(tombstones, False)
+
+            self._delta_tokens += len(tokens)
+            self._delta_oov_tokens += oov_tokens
+            self._changed_ids = self._changed_ids | {location_id}
+            self._publish(_IndexState(
+                state.tfidf_matrix, state.postings, state.location_ids,
+                delta_ids, delta_matrix, tombstones,
+                state.base_row_by_id, delta_row_by_id
+            ))
+        self._maybe_start_merge()
+        return True
+
+    def delete_location(self, location_id) -> bool:
+        """Xóa một địa điểm khỏi kết quả tìm kiếm (đánh dấu tombstone). Trả về False nếu không có."""
+        if not self.is_ready():
+            return False
+        with self._update_lock:
+            state = self._ensure_mutable_state(self._state)
+            row = state.live_row_of(location_id)
+            if row is None:
+                return False
+            tombstones = state.tombstones.copy()
+            tombstones[row] = True
+            delta_row_by_id = dict(state.delta_row_by_id)
+            delta_row_by_id.pop(location_id, None)
+            self._publish(_IndexState(
+                state.tfidf_matrix, state.postings, state.location_ids,
+                state.delta_ids, state.delta_matrix, tombstones,
+                state.base_row_by_id, delta_row_by_id
+            ))
+        self._maybe_start_merge()
+        return True
+
+    def _ensure_mutable_state(self, state: _IndexState) -> _IndexState:
+        """Tạo mảng tombstone ở lần thay đổi đầu tiên (không tốn chi phí lúc khởi động)."""
+        if state.tombstones is not None:
+            return state
+        return _IndexState(
+            state.tfidf_matrix, state.postings, state.location_ids,
+            state.delta_ids, state.delta_matrix, np.zeros(state.num_base_rows, dtype=bool),
+            state._base_row_map(), state.delta_row_by_id
+        )
+
+    def _publish(self, state: _IndexState):
+        """Thay ảnh chụp index và đổi model_version để cache kết quả cũ không còn được dùng."""
+        self._generation += 1
+        self._state = state
+        self.model_version = f"{self.base_model_version}+{self._generation}"
+
+    def index_drift(self) -> float:
+        """Tỉ lệ (số dòng delta + số dòng gốc đã xóa) / số dòng gốc."""
+        state = self._state
+        if state is None or not state.has_updates:
+            return 0.0
+        deleted_base = int(state.tombstones[:state.num_base_rows].sum())
+        return (len(state.delta_ids) + deleted_base) / max(1, state.num_base_rows)
+
+    def oov_ratio(self) -> float:
+        """Tỉ lệ token ngoài từ vựng trong các mô tả đã thêm/sửa từ lần build gần nhất."""
+        return self._delta_oov_tokens / self._delta_tokens if self._delta_tokens else 0.0
+
+    def needs_refit(self) -> bool:
+        """
+        Từ vựng/IDF hiện tại đã không còn đại diện cho dữ liệu (nhiều token mới ngoài từ vựng):
+        cần chạy lại build_tfidf_model.py, việc gộp delta không giải quyết được.
+        """
+        return self.oov_ratio() > INDEX_REFIT_OOV_THRESHOLD
+
+    def _maybe_start_merge(self):
+        """Gộp delta vào segment gốc trên thread nền khi độ lệch vượt INDEX_MERGE_THRESHOLD."""
+        if self.index_drift() <= INDEX_MERGE_THRESHOLD:
+            return
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(target=self.merge_updates, name="tfidf-merge", daemon=True)
+        self._merge_thread.start()
+
+    def merge_updates(self):
+        """
+        Gộp segment delta vào segment gốc và bỏ hẳn các dòng đã xóa (vẫn dùng từ vựng/IDF hiện tại).
+        Truy vấn vẫn chạy trên ảnh chụp cũ cho tới khi ảnh chụp mới được gán.
+        Với index dạng gọn (float32/int8), segment gốc mới là float64 đã giải lượng tử.
+        """
+        with self._update_lock:
+            state = self._state
+            if state is None or not state.has_updates:
+                return
+            alive = ~state.tombstones
+            base_alive = np.flatnonzero(alive[:state.num_base_rows])
+            delta_alive = np.flatnonzero(alive[state.num_base_rows:])
+
+            parts = [state.tfidf_matrix[base_alive]]
+            if delta_alive.size:
+                parts.append(state.delta_matrix[delta_alive])
+            tfidf_matrix = vstack(parts, format='csr')
+            location_ids = [state.location_ids[i] for i in base_alive] + [state.delta_ids[j] for j in delta_alive]
+            postings = tfidf_matrix.tocsc()
+            postings.sort_indices()
+
+            self._publish(_IndexState(tfidf_matrix, postings, location_ids))
+            print(f"TFIDFEngine: Đã gộp delta vào index ({len(location_ids)} địa điểm).")
+
+    def index_stats(self) -> dict:
+        """Thông tin về segment gốc, delta và tombstone."""
+        state = self._state
+        if state is None:
+            return {}
+        return {
+            'model_version': self.model_version,
+            'base_rows': state.num_base_rows,
+            'storage': state.tfidf_matrix.storage if isinstance(state.tfidf_matrix, CompactMatrix) else 'float64',
+            'delta_rows': len(state.delta_ids),
+            'deleted_rows': state.num_deleted,
+            'drift': round(self.index_drift(), 4),
+            'oov_ratio': round(self.oov_ratio(), 4),
+            'needs_refit': self.needs_refit(),
+            'shards': self.sharded_searcher.num_shards if self._can_scatter(state) else 0,
+            'term_resolution': self.term_resolver is not None,
+            'synonym_expansion': self.synonym_expansion is not None,
+        }
+
 # (Tùy chọn) Tạo một instance để có thể import và sử dụng từ các module khác
 # Việc này giúp model chỉ được load một lần khi module này được import lần đầu
-# tfidf_engine_instance = TFIDFEngine()
\ No newline at end of file
+# tfidf_engine_instance = TFIDFEngine()
@@ -0,0 +1,93 @@
+# backend/app/search_logic/utils.py
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 'đ' không phải chữ có dấu kết hợp (NFD không tách được) nên được đổi riêng
+_ACCENT_FREE_LETTERS = str.maketrans({'đ': 'd', 'Đ': 'D'})
+
+
+def strip_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'bãi biển Đà Nẵng' -> 'bai bien Da Nang' (kết quả ở dạng NFC)."""
+    decomposed = unicodedata.normalize('NFD', text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return unicodedata.normalize('NFC', stripped).translate(_ACCENT_FREE_LETTERS)
+
+
+class LRUCache:
+    """
+    Cache LRU có giới hạn kích thước và (tùy chọn) thời gian sống TTL cho từng mục.
+    An toàn khi dùng từ nhiều thread. Có bộ đếm hit/miss/eviction để theo dõi hiệu quả.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = None):
+        self.max_size = max(0, int(max_size))
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self._items = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0 # Bị đẩy ra do đầy cache
+        self.expirations = 0 # Hết hạn TTL
+        self.invalidations = 0 # Số lần xóa toàn bộ cache (vd: khi model thay đổi)
+
+    def get(self, key, default=None):
+        """Lấy giá trị theo key; trả về default nếu không có hoặc đã hết hạn."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._items[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Thêm/cập nhật một mục, đẩy mục ít dùng nhất ra nếu cache đầy."""
+        if self.max_size == 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Xóa một mục và trả về giá trị của nó (không tính vào hit/miss)."""
+        with self._lock:
+            item = self._items.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        """Xóa toàn bộ cache (tính là một lần invalidation)."""
+        with self._lock:
+            self._items.clear()
+            self.invalidations += 1
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self) -> dict:
+        """Các bộ đếm hiện tại của cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
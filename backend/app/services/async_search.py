@@ -0,0 +1,109 @@
+# backend/app/services/async_search.py
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.search_logic.preprocessor import normalize_text
+from app.services.search_service import (
+    search_locations_by_tfidf, search_locations_hybrid, search_locations_semantic
+)
+
+# Chế độ tìm kiếm -> hàm của search_service
+SEARCH_MODES = {
+    'tfidf': search_locations_by_tfidf,
+    'hybrid': search_locations_hybrid,
+    'semantic': search_locations_semantic,
+}
+
+
+class SearchOverloadedError(Exception):
+    """Số truy vấn đang chờ xử lý đã đạt giới hạn; nơi gọi nên trả 503 cho client."""
+
+
+class AsyncSearchExecutor:
+    """
+    Chạy search_locations_by_tfidf (tách từ, tính điểm TF-IDF, lấy chi tiết) trên một
+    thread pool có giới hạn để event loop asyncio không bao giờ bị chặn, kể cả khi phải
+    truy vấn database.
+    - Gộp truy vấn trùng: các request giống nhau (sau chuẩn hóa) đang xử lý cùng lúc chỉ
+      được tính một lần, các request sau chờ chung kết quả.
+    - Chống quá tải: khi số truy vấn đang chờ/chạy đạt max_pending thì từ chối ngay
+      (SearchOverloadedError) để độ trễ luôn có giới hạn.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-worker")
+        self._in_flight = {} # key -> asyncio.Future
+        self.submitted = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._in_flight)
+
+    async def search(self, query_text: str, num_results: int = 5, tags: list = None, mode: str = 'tfidf',
+                     synonym_weight: float = None) -> list:
+        """
+        Tìm kiếm không chặn event loop. mode: 'tfidf', 'hybrid' hoặc 'semantic' (xem SEARCH_MODES);
+        synonym_weight: trọng số từ đồng nghĩa (None = mặc định của service).
+        Raise SearchOverloadedError khi quá tải.
+        """
+        search_function = SEARCH_MODES[mode]
+        tags = tuple(sorted(set(tags))) if tags else None
+        key = (normalize_text(query_text), num_results, tags, mode, synonym_weight)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise SearchOverloadedError(
+                    f"Đang có {len(self._in_flight)} truy vấn chờ xử lý (giới hạn {self.max_pending})."
+                )
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._executor,
+                functools.partial(search_function, query_text, num_results, tags=list(tags) if tags else None,
+                                  synonym_weight=synonym_weight)
+            )
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.submitted += 1
+
+        # shield: một client hủy request không làm hủy kết quả mà các client khác đang chờ
+        results = await asyncio.shield(future)
+        return [detail.copy() for detail in results]
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Chạy function(*args, **kwargs) trên thread pool của executor (không gộp truy vấn trùng), cùng
+        giới hạn max_pending với search(). Dùng cho các thao tác không gộp được như trang kết quả theo cursor.
+        """
+        if len(self._in_flight) >= self.max_pending:
+            self.rejected += 1
+            raise SearchOverloadedError(
+                f"Đang có {len(self._in_flight)} truy vấn chờ xử lý (giới hạn {self.max_pending})."
+            )
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+        key = object() # Key riêng: chỉ để tính vào số truy vấn đang chờ
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        self.submitted += 1
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
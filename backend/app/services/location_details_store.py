@@ -0,0 +1,303 @@
+# backend/app/services/location_details_store.py
+import threading
+import time
+
+import mysql.connector
+
+from app.core.database import db_pool
+
+# Mã lỗi MySQL khi cột không tồn tại (ER_BAD_FIELD_ERROR)
+_ER_BAD_FIELD_ERROR = 1054
+
+
+class LocationDetailsStore:
+    """
+    Lưu (ten, mo_ta) của toàn bộ bảng dia_danh trong bộ nhớ để đường tìm kiếm không phải
+    truy vấn database. Dữ liệu là tuple _snapshot = (details, row_by_id):
+    - details: list các tuple (ten, mo_ta), dòng i ứng với location_ids[i] của TFIDFEngine
+      (các địa điểm không có trong model được thêm vào cuối).
+    - row_by_id: dict id_dia_diem -> dòng.
+    Snapshot không bị sửa sau khi công bố: cả tải lại toàn bộ lẫn cập nhật từng phần đều dựng bản mới rồi
+    gán một lần, luồng đọc chỉ đọc _snapshot một lần nên details và row_by_id luôn cùng một phiên bản.
+
+    Làm mới định kỳ trên thread nền:
+    - Nếu bảng có cột updated_at: đọc lại các dòng có updated_at >= mốc lần trước (>= vì DATETIME chỉ
+      lưu tới giây, hai lần ghi trong cùng một giây có cùng updated_at), chỉ công bố các dòng thật sự
+      khác; mốc mới là updated_at lớn nhất trong các dòng đã đọc. Chưa có mốc (mọi updated_at là NULL
+      lúc tải) thì tải lại toàn bộ khi có giá trị updated_at hoặc số dòng đổi.
+    - Nếu không: so sánh CHECKSUM TABLE, khác thì tải lại toàn bộ.
+    Số dòng giảm (có địa điểm bị xóa) hoặc số dòng khác store sau khi cập nhật (dòng mới không có
+    updated_at) cũng dẫn tới tải lại toàn bộ.
+    Ngoài ra search_service căn lại store theo engine mới khi model được tải lại (realign, refresh) và tải
+    ngay các địa điểm vừa thêm/sửa trong index (refresh_ids).
+    """
+
+    def __init__(self, location_ids: list = None, updated_at_column: str = 'updated_at',
+                 refresh_interval: float = 60.0, on_refresh=None):
+        """on_refresh: (tùy chọn) hàm gọi sau mỗi lần tải/làm mới trên thread nền (vd làm mới tag cùng chu kỳ)."""
+        self._location_ids = list(location_ids or [])
+        self.updated_at_column = updated_at_column
+        self.refresh_interval = refresh_interval
+        self.on_refresh = on_refresh
+        self._snapshot = ([], {})
+        self._use_updated_at = True
+        self._last_updated_at = None
+        self._last_count = None
+        self._last_checksum = None
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.loaded = False
+        self.last_refresh_time = None
+        self.full_loads = 0
+        self.incremental_updates = 0
+
+    # --- Đọc ---
+
+    def get(self, location_id):
+        """Trả về dict chi tiết của một địa điểm, hoặc None nếu không có."""
+        return self._lookup(self._snapshot, location_id)
+
+    def get_many(self, location_ids: list) -> dict:
+        """Trả về dict {id_dia_diem: dict chi tiết} cho các ID có trong store (O(số ID))."""
+        snapshot = self._snapshot
+        details = {}
+        for location_id in location_ids:
+            detail = self._lookup(snapshot, location_id)
+            if detail is not None:
+                details[location_id] = detail
+        return details
+
+    @staticmethod
+    def _lookup(snapshot: tuple, location_id):
+        details, row_by_id = snapshot
+        row = row_by_id.get(location_id)
+        if row is None:
+            return None
+        ten, mo_ta = details[row]
+        return {'id_dia_diem': location_id, 'ten': ten, 'mo_ta': mo_ta}
+
+    def __len__(self):
+        return len(self._snapshot[1])
+
+    # --- Tải dữ liệu ---
+
+    def load(self) -> bool:
+        """Tải toàn bộ bảng dia_danh. Trả về True nếu thành công."""
+        try:
+            with db_pool.connection() as conn:
+                self._detect_change_strategy(conn)
+                # Đọc mốc trước dữ liệu: dòng ghi sau đó có updated_at >= mốc nên lần làm mới sau đọc được
+                version = self._read_version(conn)
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT id_dia_diem, ten, mo_ta FROM dia_danh")
+                    rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+        except mysql.connector.Error as err:
+            print(f"LocationDetailsStore Lỗi khi tải chi tiết địa điểm: {err}")
+            return False
+
+        by_id = {location_id: (ten, mo_ta) for location_id, ten, mo_ta in rows}
+        # Sắp xếp theo thứ tự dòng của model, các ID còn lại thêm vào cuối
+        ordered_ids = [location_id for location_id in self._location_ids if location_id in by_id]
+        known_ids = set(ordered_ids)
+        ordered_ids.extend(location_id for location_id in by_id if location_id not in known_ids)
+
+        details = [by_id[location_id] for location_id in ordered_ids]
+        row_by_id = {location_id: row for row, location_id in enumerate(ordered_ids)}
+        with self._write_lock:
+            self._snapshot = (details, row_by_id)
+            self._set_version(version)
+            self.loaded = True
+            self.last_refresh_time = time.time()
+            self.full_loads += 1
+        print(f"LocationDetailsStore: Đã tải {len(details)} địa điểm vào bộ nhớ.")
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Kiểm tra bảng dia_danh có thay đổi không và cập nhật store.
+        Trả về True nếu store có thay đổi.
+        """
+        if not self.loaded:
+            return self.load()
+        try:
+            with db_pool.connection() as conn:
+                version = self._read_version(conn)
+                if self._use_updated_at:
+                    count, max_updated_at = version
+                    if self._last_updated_at is None or max_updated_at is None or count < self._last_count:
+                        # Chưa có mốc updated_at để so, hoặc có dòng bị xóa
+                        needs_full_load = max_updated_at is not None or count != self._last_count
+                    else:
+                        changed = self._apply_incremental(conn, count)
+                        if len(self) == count:
+                            return changed
+                        needs_full_load = True # Có dòng mới không có updated_at
+                else:
+                    needs_full_load = version != self._last_checksum
+        except mysql.connector.Error as err:
+            print(f"LocationDetailsStore Lỗi khi kiểm tra thay đổi: {err}")
+            return False
+
+        if needs_full_load:
+            return self.load()
+        return False
+
+    def _apply_incremental(self, conn, count: int) -> bool:
+        """
+        Tải các dòng có updated_at >= mốc lần trước và cập nhật các dòng có nội dung khác store.
+        Trả về True nếu store có thay đổi.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT id_dia_diem, ten, mo_ta, {self.updated_at_column} FROM dia_danh "
+                f"WHERE {self.updated_at_column} >= %s",
+                (self._last_updated_at,)
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        with self._write_lock:
+            changed = self._merge_rows([row[:3] for row in rows])
+            if changed:
+                self.incremental_updates += 1
+            # Chỉ đẩy mốc tới updated_at lớn nhất đã thực sự đọc được
+            self._set_version((count, max([self._last_updated_at] + [row[3] for row in rows])))
+            self.last_refresh_time = time.time()
+        if changed:
+            print(f"LocationDetailsStore: Đã cập nhật {len(changed)} địa điểm thay đổi.")
+        return bool(changed)
+
+    def refresh_ids(self, location_ids: list) -> int:
+        """
+        Tải lại chi tiết của các ID từ database (vd địa điểm vừa được thêm/sửa trong index), không chờ
+        lần làm mới định kỳ. Trả về số địa điểm có thay đổi.
+        """
+        if not location_ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(location_ids))
+        try:
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(
+                        f"SELECT id_dia_diem, ten, mo_ta FROM dia_danh WHERE id_dia_diem IN ({placeholders})",
+                        tuple(location_ids)
+                    )
+                    rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+        except mysql.connector.Error as err:
+            print(f"LocationDetailsStore Lỗi khi tải chi tiết địa điểm: {err}")
+            return 0
+        with self._write_lock:
+            return len(self._merge_rows(rows))
+
+    def realign(self, location_ids: list):
+        """Sắp xếp lại các dòng theo location_ids của engine mới (không truy vấn database)."""
+        with self._write_lock:
+            details, row_by_id = self._snapshot
+            ordered_ids = [location_id for location_id in location_ids if location_id in row_by_id]
+            known_ids = set(ordered_ids)
+            ordered_ids.extend(location_id for location_id in row_by_id if location_id not in known_ids)
+            self._snapshot = (
+                [details[row_by_id[location_id]] for location_id in ordered_ids],
+                {location_id: row for row, location_id in enumerate(ordered_ids)},
+            )
+            self._location_ids = list(location_ids)
+
+    def _merge_rows(self, rows) -> list:
+        """
+        Công bố các dòng (id_dia_diem, ten, mo_ta) có nội dung khác store; gọi khi đang giữ _write_lock.
+        Trả về list (id_dia_diem, (ten, mo_ta)) đã thay đổi.
+        """
+        details, row_by_id = self._snapshot
+        changed = [(location_id, (ten, mo_ta)) for location_id, ten, mo_ta in rows
+                   if location_id not in row_by_id or details[row_by_id[location_id]] != (ten, mo_ta)]
+        if changed:
+            # Sửa trên bản sao rồi công bố snapshot mới, không đụng vào snapshot luồng đọc đang dùng
+            details, row_by_id = list(details), dict(row_by_id)
+            for location_id, detail in changed:
+                row = row_by_id.get(location_id)
+                if row is None:
+                    row_by_id[location_id] = len(details)
+                    details.append(detail)
+                else:
+                    details[row] = detail
+            self._snapshot = (details, row_by_id)
+        return changed
+
+    def _detect_change_strategy(self, conn):
+        """Dùng updated_at nếu bảng có cột này, nếu không thì dùng CHECKSUM TABLE."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"SELECT {self.updated_at_column} FROM dia_danh LIMIT 0")
+            cursor.fetchall()
+            self._use_updated_at = True
+        except mysql.connector.Error as err:
+            if err.errno != _ER_BAD_FIELD_ERROR:
+                raise
+            self._use_updated_at = False
+        finally:
+            cursor.close()
+
+    def _read_version(self, conn):
+        """(số dòng, max updated_at) hoặc checksum của bảng, tùy chiến lược."""
+        cursor = conn.cursor()
+        try:
+            if self._use_updated_at:
+                cursor.execute(f"SELECT COUNT(*), MAX({self.updated_at_column}) FROM dia_danh")
+                count, max_updated_at = cursor.fetchone()
+                return (count, max_updated_at)
+            cursor.execute("CHECKSUM TABLE dia_danh")
+            return cursor.fetchone()[1]
+        finally:
+            cursor.close()
+
+    def _set_version(self, version):
+        if self._use_updated_at:
+            self._last_count, self._last_updated_at = version
+        else:
+            self._last_checksum = version
+
+    # --- Thread nền ---
+
+    def start(self):
+        """Tải dữ liệu và làm mới định kỳ trên một thread nền (daemon)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="location-details-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        self.load()
+        self._notify_refresh()
+        while not self._stop_event.wait(self.refresh_interval):
+            self.refresh()
+            self._notify_refresh()
+
+    def _notify_refresh(self):
+        if self.on_refresh is None:
+            return
+        try:
+            self.on_refresh()
+        except Exception as e:
+            print(f"LocationDetailsStore Lỗi khi chạy on_refresh: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'loaded': self.loaded,
+            'size': len(self),
+            'change_strategy': 'updated_at' if self._use_updated_at else 'checksum',
+            'full_loads': self.full_loads,
+            'incremental_updates': self.incremental_updates,
+            'last_refresh_time': self.last_refresh_time,
+        }
@@ -1,58 +1,374 @@
 # backend/app/services/search_service.py
+import logging
+import os
+import shlex
+import subprocess
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING
+
 import mysql.connector
 
-# Import các module/lớp đã tạo
-from app.search_logic.preprocessor import preprocess_query
-from app.search_logic.tfidf_engine import TFIDFEngine
-from app.core.database import get_db_connection # Hàm lấy kết nối DB
+# Import các module/lớp đã tạo.
+# tfidf_engine, tag_engine (scipy) và location_details_store chỉ được import khi tải engine
+# (xem get_tfidf_engine) để import module này, và khởi động server, nhanh.
+from app.search_logic.preprocessor import preprocess_query, preprocess_document
+from app.search_logic.ranker import HybridRanker, ScoreSignal
+from app.search_logic.utils import LRUCache
+from app.services.search_sessions import SearchSessionStore, decode_cursor, encode_cursor
+from app.core.database import db_pool, get_db_pool_stats # Pool kết nối DB
+from app.core import metrics
+from app.core.config import (
+    SEARCH_CACHE_MAX_SIZE, SEARCH_CACHE_TTL_SECONDS, MODEL_RELOAD_CHECK_INTERVAL, DETAIL_QUERY_BATCH_SIZE,
+    DETAILS_STORE_ENABLED, DETAILS_REFRESH_INTERVAL, DIA_DANH_UPDATED_AT_COLUMN, MODEL_REBUILD_COMMAND,
+    TFIDF_WEIGHT, TAG_WEIGHT, SUGGESTION_INDEX_DIR, SEARCH_SESSION_MAX, SEARCH_SESSION_TTL_SECONDS, SEARCH_SESSION_MAX_RESULTS
+)
+
+if TYPE_CHECKING:
+    from app.search_logic.tfidf_engine import TFIDFEngine
+
+# TFIDFEngine đang phục vụ, tạo ở lần gọi get_tfidf_engine() đầu tiên
+# (thường từ thread warm-up lúc server khởi động, xem app.services.warmup).
+tfidf_engine_instance = None
+_engine_init_lock = threading.Lock()
+
+# Cache kết quả tìm kiếm: key = (tần suất token được tính điểm, num_results, trọng số từ đồng nghĩa).
+# Cache gắn với model_version của engine; khi model thay đổi, toàn bộ cache bị xóa.
+_result_cache = LRUCache(max_size=SEARCH_CACHE_MAX_SIZE, ttl_seconds=SEARCH_CACHE_TTL_SECONDS)
+_result_cache_model_version = None
+# Phiên phân trang (search_locations_paginated): danh sách xếp hạng đã tính, giữ tới khi hết TTL
+_search_sessions = SearchSessionStore(SEARCH_SESSION_MAX, SEARCH_SESSION_TTL_SECONDS)
+_model_check_lock = threading.Lock()
+_last_model_check = time.monotonic()
+_rebuild_process = None # Tiến trình build lại model đang chạy (MODEL_REBUILD_COMMAND)
+_model_reload_thread = None # Thread nền kiểm tra và tải lại model (xem _reload_model)
+
+logger = logging.getLogger(__name__)
+
+# Chi tiết (ten, mo_ta) của toàn bộ dia_danh trong bộ nhớ, tạo cùng engine và làm mới trên thread nền.
+# Khi store chưa tải xong (hoặc bị tắt), chi tiết được lấy trực tiếp từ database.
+location_details_store = None
+# Khởi động thread nền (làm mới store) ngay khi tải engine. Tiến trình master của run.py (prefork)
+# tắt việc này: thread không tồn tại trong tiến trình con sau fork, mỗi worker tự gọi start_background_tasks().
+_start_background_tasks_on_load = True
+
+# Quan hệ dia_danh_tag trong bộ nhớ, tải ở lần dùng đầu tiên (xem get_tag_engine):
+# (TagEngine, khóa căn dòng theo ảnh chụp index, xem _state_alignment)
+_tag_engine = None
+_tag_engine_lock = threading.Lock()
+_tag_engine_last_attempt = None
+
+# Index gợi ý type-ahead (xem get_suggestion_index): (index, thời điểm sửa manifest), tải ở lần dùng đầu tiên
+_suggestion_index = None
+_suggestion_index_lock = threading.Lock()
+_last_suggestion_check = None
+
+hybrid_ranker = HybridRanker({'tfidf': TFIDF_WEIGHT, 'tag': TAG_WEIGHT})
+
+
+def get_tfidf_engine() -> "TFIDFEngine":
+    """
+    Engine đang phục vụ. Lần gọi đầu tiên import tfidf_engine (scipy), tải model và khởi động
+    location_details_store; các thread gọi cùng lúc chờ lần tải đó xong rồi dùng chung engine.
+    """
+    engine = tfidf_engine_instance
+    if engine is not None:
+        return engine
+    with _engine_init_lock:
+        if tfidf_engine_instance is None:
+            _initialize_engine()
+        return tfidf_engine_instance
+
+
+def set_background_tasks_on_load(enabled: bool):
+    """Bật/tắt việc khởi động thread nền khi engine được tải (xem start_background_tasks)."""
+    global _start_background_tasks_on_load
+    _start_background_tasks_on_load = enabled
+
+
+def start_background_tasks():
+    """Khởi động thread làm mới location_details_store (nếu đã tạo engine và store đang bật)."""
+    store = location_details_store
+    if DETAILS_STORE_ENABLED and store is not None:
+        store.start()
+
+
+def _initialize_engine():
+    global tfidf_engine_instance, location_details_store, _result_cache_model_version, _last_model_check
+    from app.search_logic.tfidf_engine import TFIDFEngine
+    from app.services.location_details_store import LocationDetailsStore
+
+    print("Khởi tạo TFIDFEngine từ search_service...")
+    engine = TFIDFEngine()
+    store = LocationDetailsStore(
+        engine.location_ids,
+        updated_at_column=DIA_DANH_UPDATED_AT_COLUMN,
+        refresh_interval=DETAILS_REFRESH_INTERVAL,
+        on_refresh=_refresh_tag_engine
+    )
+    location_details_store = store
+    _result_cache_model_version = engine.model_version
+    _last_model_check = time.monotonic()
+    tfidf_engine_instance = engine
+    if _start_background_tasks_on_load:
+        start_background_tasks()
+
+
+def _refresh_model_if_changed():
+    """
+    Định kỳ (MODEL_RELOAD_CHECK_INTERVAL giây) khởi động thread nền kiểm tra file model trên đĩa và tải lại
+    engine nếu model đã được build lại (xem _reload_model). Luồng xử lý request không tải model, chỉ so
+    model_version: cache kết quả bị xóa khi model_version đổi.
+    """
+    global _result_cache_model_version, _last_model_check, _model_reload_thread
+
+    engine = get_tfidf_engine()
+    now = time.monotonic()
+    if now - _last_model_check >= MODEL_RELOAD_CHECK_INTERVAL and _model_check_lock.acquire(blocking=False):
+        try:
+            _last_model_check = now
+            if _model_reload_thread is None or not _model_reload_thread.is_alive():
+                _model_reload_thread = threading.Thread(target=_reload_model, args=(engine,),
+                                                        name="model-reload", daemon=True)
+                _model_reload_thread.start()
+        finally:
+            _model_check_lock.release()
+
+    engine = tfidf_engine_instance
+    if engine.model_version != _result_cache_model_version:
+        _result_cache.clear()
+        _result_cache_model_version = engine.model_version
+
+
+def _reload_model(engine: "TFIDFEngine"):
+    """
+    (Thread nền) Nếu file model trên đĩa khác bản engine đã tải: tải engine mới, căn location_details_store
+    theo nó rồi mới thay thế engine đang phục vụ (gán một lần); truy vấn đang chạy vẫn dùng engine cũ.
+    """
+    global tfidf_engine_instance
+    if not engine.has_artifacts_changed():
+        return
+    from app.search_logic.tfidf_engine import TFIDFEngine
+
+    print("Service: Phát hiện model trên đĩa đã thay đổi, đang tải lại TFIDFEngine...")
+    new_engine = TFIDFEngine()
+    if not new_engine.is_ready():
+        print("Service: Không tải được model mới, tiếp tục dùng model cũ.")
+        return
+    _sync_details_store(new_engine)
+    get_tag_engine(new_engine) # Căn TagEngine trước khi thay, không để request đầu tiên làm việc này
+    tfidf_engine_instance = new_engine
+    engine.close()
+
+
+def _sync_details_store(engine: "TFIDFEngine"):
+    """Căn location_details_store theo engine mới tải và đọc các thay đổi của dia_danh (model mới có thể
+    đã được build từ dữ liệu mới hơn store)."""
+    store = location_details_store
+    if store is None or not store.loaded:
+        return
+    store.realign(engine.location_ids)
+    store.refresh()
+
+
+def _state_row_ids(state) -> list:
+    """ID địa điểm theo chỉ số dòng toàn cục của ảnh chụp index (dòng gốc rồi dòng delta)."""
+    return state.location_ids + state.delta_ids if state.delta_ids else state.location_ids
+
+
+def _state_alignment(state) -> tuple:
+    """Khóa căn dòng của TagEngine: delta chỉ thêm dòng ở cuối cho tới lần gộp/tải lại (location_ids mới)."""
+    return (state.location_ids, len(state.delta_ids))
+
+
+def _is_aligned(alignment: tuple, state) -> bool:
+    return alignment[0] is state.location_ids and alignment[1] == len(state.delta_ids)
+
+
+def get_tag_engine(engine: "TFIDFEngine" = None, state=None):
+    """
+    TagEngine căn theo các dòng (gốc + delta) của ảnh chụp index state (mặc định ảnh chụp hiện tại
+    của engine đang phục vụ). Tải từ database ở lần gọi đầu tiên; nếu lỗi thì thử lại sau
+    DETAILS_REFRESH_INTERVAL giây và trả về None trong lúc chờ. Khi engine được tải lại/gộp delta hoặc
+    có địa điểm mới trong delta, TagEngine được căn lại mà không truy vấn lại database; dữ liệu tag
+    được làm mới cùng chu kỳ với location_details_store (xem _refresh_tag_engine).
+    """
+    global _tag_engine, _tag_engine_last_attempt
+    state = state or (engine or get_tfidf_engine()).snapshot()
+    current = _tag_engine
+    if current is not None and _is_aligned(current[1], state):
+        return current[0]
+
+    with _tag_engine_lock:
+        if _tag_engine is None:
+            now = time.monotonic()
+            if _tag_engine_last_attempt is not None and now - _tag_engine_last_attempt < DETAILS_REFRESH_INTERVAL:
+                return None
+            _tag_engine_last_attempt = now
+            from app.search_logic.tag_engine import TagEngine
+
+            tag_engine = TagEngine(_state_row_ids(state))
+            if not tag_engine.load():
+                return None
+            _tag_engine = (tag_engine, _state_alignment(state))
+        elif not _is_aligned(_tag_engine[1], state):
+            _tag_engine = (_tag_engine[0].realign(_state_row_ids(state)), _state_alignment(state))
+        return _tag_engine[0]
+
+
+def _refresh_tag_engine():
+    """Đọc lại tag/dia_danh_tag (nếu TagEngine đã được tải) và thay TagEngine khi dữ liệu đã đổi."""
+    global _tag_engine
+    current = _tag_engine
+    if current is None:
+        return
+    fresh = current[0].reload()
+    if fresh is None:
+        return
+    with _tag_engine_lock:
+        tag_engine, alignment = _tag_engine
+        if tag_engine is not current[0]:
+            # Đã được căn lại trong lúc đọc database
+            fresh = fresh.realign(tag_engine.location_ids)
+        _tag_engine = (fresh, alignment)
+
+
+def _suggestion_manifest_mtime():
+    try:
+        return os.path.getmtime(os.path.join(SUGGESTION_INDEX_DIR, 'manifest.json'))
+    except OSError:
+        return None
+
+
+def get_suggestion_index():
+    """
+    Index gợi ý type-ahead (SuggestionIndex) đọc vào bộ nhớ, None nếu chưa build. Cứ MODEL_RELOAD_CHECK_INTERVAL
+    giây kiểm tra manifest trên đĩa một lần và tải lại khi model được build lại.
+    """
+    global _suggestion_index, _last_suggestion_check
+    now = time.monotonic()
+    current = _suggestion_index
+    if _last_suggestion_check is not None and now - _last_suggestion_check < MODEL_RELOAD_CHECK_INTERVAL:
+        return current[0] if current is not None else None
+    with _suggestion_index_lock:
+        if _last_suggestion_check is not None and now - _last_suggestion_check < MODEL_RELOAD_CHECK_INTERVAL:
+            return _suggestion_index[0] if _suggestion_index is not None else None
+        _last_suggestion_check = now
+        mtime = _suggestion_manifest_mtime()
+        if mtime is None:
+            _suggestion_index = None
+        elif _suggestion_index is None or _suggestion_index[1] != mtime:
+            from app.search_logic.suggestion_index import SuggestionIndex
+            try:
+                index = SuggestionIndex.load(SUGGESTION_INDEX_DIR)
+                print(f"Service: Đã tải index gợi ý ({index.size} mục) từ {SUGGESTION_INDEX_DIR}")
+                _suggestion_index = (index, mtime)
+            except (OSError, ValueError, KeyError) as e:
+                metrics.inc(metrics.errors_total, stage='suggestions')
+                logger.error("Service Lỗi khi tải index gợi ý: %s", e)
+        return _suggestion_index[0] if _suggestion_index is not None else None
+
+
+def suggest_completions(prefix: str, limit: int = 8) -> list:
+    """
+    Gợi ý hoàn thành cho chuỗi đang gõ (từ vựng, khóa đồng nghĩa, tên địa điểm), không phân biệt dấu.
+    Không tách từ hay tính TF-IDF nên đủ nhanh để gọi ở mỗi lần gõ phím. List rỗng nếu chưa build index gợi ý.
+    """
+    index = get_suggestion_index()
+    if index is None:
+        return []
+    metrics.inc(metrics.queries_total, kind='suggest')
+    return index.suggest(prefix, limit)
+
+
+def _result_cache_key(model_version: str, query_text: str, num_results: int, row_filter=None,
+                      synonym_weight: float = None) -> tuple:
+    """
+    Key cache: số lần xuất hiện của từng token trong chuỗi thực sự được tính điểm (xem tfidf_query_text),
+    không phụ thuộc thứ tự, cùng num_results và trọng số từ đồng nghĩa. Hai truy vấn chỉ dùng chung key khi
+    có cùng vector tần suất, kể cả khi engine tự mở rộng từ đồng nghĩa ("biển" và "biển đại dương" có cùng
+    tập từ mở rộng nhưng khác vector). Kèm model_version để kết quả tính bằng model cũ không bao giờ được
+    trả về cho model mới, và điều kiện lọc (nếu có).
+    """
+    term_counts = tuple(sorted(Counter(query_text.split()).items()))
+    key = (model_version, term_counts, num_results, synonym_weight)
+    if row_filter is not None:
+        key += row_filter.spec
+    return key
+
+
+def tfidf_query_text(engine: "TFIDFEngine", processed_data: dict, synonym_weight: float = None) -> str:
+    """
+    Chuỗi token đưa vào engine. Engine có ma trận mở rộng từ đồng nghĩa: token gốc, engine tự mở rộng
+    trên vector truy vấn với synonym_weight. Không có: chuỗi đã thêm từ đồng nghĩa của preprocess_query
+    (trọng số như từ gốc), hoặc token gốc nếu synonym_weight = 0.
+    """
+    if engine.has_synonym_expansion() or synonym_weight == 0:
+        return processed_data['query_tokens']
+    return processed_data['tokens_for_tfidf']
+
+
+def build_search_filter(engine: "TFIDFEngine", tags: list = None, allowed_ids=None, excluded_ids=None):
+    """
+    Bộ lọc ứng viên cho engine (None nếu không có điều kiện nào):
+    - tags: chỉ giữ địa điểm có ít nhất một trong các tag này.
+    - allowed_ids: chỉ giữ các ID này (giao với điều kiện tag nếu có cả hai).
+    - excluded_ids: bỏ các ID này (vd: địa điểm bị ẩn).
+    Mask được cache trong engine/TagEngine nên các truy vấn dùng cùng điều kiện không phải tạo lại.
+    """
+    if tags:
+        tag_engine = get_tag_engine(engine)
+        # Chưa tải được tag: không có địa điểm nào thỏa điều kiện tag
+        tagged_ids = tag_engine.location_ids_with_tags(tags) if tag_engine is not None else frozenset()
+        allowed_ids = tagged_ids if allowed_ids is None else tagged_ids & frozenset(allowed_ids)
+    return engine.build_filter(allowed_ids, excluded_ids)
+
+
+def get_search_cache_stats() -> dict:
+    """Thống kê cache kết quả tìm kiếm (hit/miss/eviction...) kèm model_version đang dùng."""
+    stats = _result_cache.stats()
+    stats['model_version'] = _result_cache_model_version
+    return stats
+
+
+# Câu lệnh lấy chi tiết với số placeholder cố định (DETAIL_QUERY_BATCH_SIZE).
+# Luôn dùng cùng một object chuỗi để prepared cursor của mỗi kết nối chỉ prepare một lần.
+_DETAIL_QUERY = (
+    "SELECT id_dia_diem, ten, mo_ta FROM dia_danh WHERE id_dia_diem IN ("
+    + ", ".join(["%s"] * DETAIL_QUERY_BATCH_SIZE) + ")"
+)
 
-# Khởi tạo TFIDFEngine một lần khi module service này được import.
-# Điều này sẽ kích hoạt việc tải các file .pkl.
-# Đây là một pattern phổ biến để đảm bảo model chỉ được load một lần.
-print("Khởi tạo TFIDFEngine từ search_service...")
-tfidf_engine_instance = TFIDFEngine() # Tạo instance của TFIDFEngine
 
 def _fetch_location_details_by_ids(location_ids: list) -> list:
     """
     Truy vấn database để lấy tên và mô tả (mo_ta) cho danh sách các ID địa điểm.
-    Trả về một list các dictionary, mỗi dict chứa thông tin của một địa điểm.
-    Thứ tự trong list trả về có thể không giống thứ tự của location_ids đầu vào.
+    Trả về một list các dictionary, mỗi dict chứa thông tin của một địa điểm,
+    theo thứ tự của location_ids (bỏ qua ID không tìm thấy).
+    Dùng kết nối từ pool và prepared statement có số tham số cố định: ID được chia thành
+    các lô DETAIL_QUERY_BATCH_SIZE phần tử, lô cuối được lặp lại ID cuối cho đủ số tham số.
     """
     if not location_ids:
         return []
 
-    conn = None
+    unique_ids = list(dict.fromkeys(location_ids))
     location_details_map = {} # Dùng map để dễ truy cập theo ID
     try:
-        conn = get_db_connection()
-        if conn is None:
-            print("Service: Không thể kết nối đến database.")
-            return []
-        
-        cursor = conn.cursor(dictionary=True) # Trả về kết quả dạng dict
-
-        # Tạo chuỗi placeholder %s cho IN clause một cách an toàn
-        placeholders = ', '.join(['%s'] * len(location_ids))
-        query = f"SELECT id_dia_diem, ten, mo_ta FROM dia_danh WHERE id_dia_diem IN ({placeholders})"
-        
-        cursor.execute(query, tuple(location_ids))
-        results = cursor.fetchall()
-
-        for row in results:
-            location_details_map[row['id_dia_diem']] = {
-                'id_dia_diem': row['id_dia_diem'],
-                'ten': row['ten'],
-                'mo_ta': row['mo_ta']
-            }
-        
+        with db_pool.connection() as conn:
+            cursor = db_pool.prepared_cursor(conn)
+            for start in range(0, len(unique_ids), DETAIL_QUERY_BATCH_SIZE):
+                batch = unique_ids[start:start + DETAIL_QUERY_BATCH_SIZE]
+                params = tuple(batch) + (batch[-1],) * (DETAIL_QUERY_BATCH_SIZE - len(batch))
+                cursor.execute(_DETAIL_QUERY, params)
+                for id_dia_diem, ten, mo_ta in cursor.fetchall():
+                    location_details_map[id_dia_diem] = {
+                        'id_dia_diem': id_dia_diem,
+                        'ten': ten,
+                        'mo_ta': mo_ta
+                    }
     except mysql.connector.Error as err:
-        print(f"Service Lỗi khi truy vấn chi tiết địa điểm: {err}")
-    finally:
-        if conn and conn.is_connected():
-            if 'cursor' in locals() and cursor is not None:
-                cursor.close()
-            conn.close()
-            # print("Service: Đã đóng kết nối DB sau khi lấy chi tiết.")
+        metrics.inc(metrics.errors_total, stage='details_db')
+        logger.error("Service Lỗi khi truy vấn chi tiết địa điểm: %s", err)
 
     # Sắp xếp lại kết quả theo thứ tự của location_ids đầu vào
     # và chỉ bao gồm những ID tìm thấy chi tiết
@@ -63,60 +379,438 @@ def _fetch_location_details_by_ids(location_ids: list) -> list:
     return ordered_results
 
 
-def search_locations_by_tfidf(user_query_text: str, num_results: int = 5) -> list:
+def _get_location_details_map(location_ids: list) -> dict:
+    """
+    Chi tiết của các địa điểm dạng dict {id_dia_diem: dict chi tiết}.
+    Lấy từ location_details_store; chỉ truy vấn database cho các ID store chưa có.
+    """
+    store = location_details_store
+    details_map = store.get_many(location_ids) if store is not None and store.loaded else {}
+    missing_ids = [loc_id for loc_id in location_ids if loc_id not in details_map]
+    if missing_ids:
+        for detail in _fetch_location_details_by_ids(missing_ids):
+            details_map[detail['id_dia_diem']] = detail
+    return details_map
+
+
+def _attach_scores(top_matches_with_scores: list, location_details_map: dict) -> list:
+    """
+    Ghép điểm TF-IDF vào thông tin chi tiết, giữ nguyên thứ tự của top_matches_with_scores.
+    location_details_map: dict {id_dia_diem: dict chi tiết}. Bỏ qua ID không có chi tiết.
+    """
+    results = []
+    for loc_id, score in top_matches_with_scores:
+        detail = location_details_map.get(loc_id)
+        if detail is not None:
+            detail_with_score = detail.copy()
+            detail_with_score['tfidf_score'] = round(score, 4)
+            results.append(detail_with_score)
+    return results
+
+
+def search_locations_by_tfidf(user_query_text: str, num_results: int = 5, tags: list = None,
+                              allowed_ids=None, excluded_ids=None, synonym_weight: float = None) -> list:
     """
     Hàm chính điều phối việc tìm kiếm địa điểm chỉ dựa trên TF-IDF.
     Trả về danh sách các địa điểm (dạng dict) đã có chi tiết.
+    tags/allowed_ids/excluded_ids: giới hạn tập ứng viên (xem build_search_filter); bộ lọc
+    được áp dụng trước khi chọn top-k nên vẫn trả đủ num_results kết quả nếu có.
+    synonym_weight: trọng số từ đồng nghĩa so với từ gốc (mặc định SYNONYM_EXPANSION_WEIGHT, 0 = không mở rộng).
+    Thời gian từng bước được ghi vào app.core.metrics (và slow-query log nếu chậm).
     """
-    print(f"Service: Nhận truy vấn: '{user_query_text}'")
+    metrics.inc(metrics.queries_total, kind='tfidf')
+    with metrics.trace('search', query=user_query_text, num_results=num_results, tags=tags):
+        results = _search_locations_by_tfidf(user_query_text, num_results, tags, allowed_ids, excluded_ids,
+                                             synonym_weight)
+    if not results:
+        metrics.inc(metrics.empty_results_total, kind='tfidf')
+    return results
+
+
+def _search_locations_by_tfidf(user_query_text: str, num_results: int, tags: list,
+                               allowed_ids, excluded_ids, synonym_weight: float = None) -> list:
+    logger.debug("Service: Nhận truy vấn: '%s'", user_query_text)
 
     # 1. Tiền xử lý truy vấn
-    processed_data = preprocess_query(user_query_text) # Đây là dictionary
-    processed_query_for_tfidf = processed_data['tokens_for_tfidf']
-    # keywords_for_tags = processed_data['keywords_for_tags'] # Sẽ dùng sau cho Tag Engine
+    with metrics.span('preprocess'):
+        processed_data = preprocess_query(user_query_text) # Đây là dictionary
 
-    if not processed_query_for_tfidf: # Kiểm tra chuỗi token cho TF-IDF
-        print("Service: Truy vấn rỗng sau khi tiền xử lý cho TF-IDF.")
+    if not processed_data['tokens_for_tfidf']: # Kiểm tra chuỗi token cho TF-IDF
+        logger.debug("Service: Truy vấn rỗng sau khi tiền xử lý cho TF-IDF.")
         return []
-    # Dòng print này đã có trong preprocessor rồi, có thể bỏ ở đây
-    # print(f"Service: Truy vấn đã xử lý cho TF-IDF: '{processed_query_for_tfidf}'")
+
+    _refresh_model_if_changed()
+    engine = get_tfidf_engine() # Giữ tham chiếu cố định trong suốt truy vấn (engine có thể được tải lại)
+    row_filter = build_search_filter(engine, tags, allowed_ids, excluded_ids) if engine.is_ready() else None
+    query_text = tfidf_query_text(engine, processed_data, synonym_weight)
+    cache_key = _result_cache_key(engine.model_version, query_text, num_results, row_filter, synonym_weight)
+    cached_results = _result_cache.get(cache_key)
+    if cached_results is not None:
+        # Trả về bản sao để nơi gọi có sửa kết quả cũng không ảnh hưởng cache
+        return [detail.copy() for detail in cached_results]
 
     # 2. Tính toán độ tương đồng và lấy top ID + score bằng TFIDFEngine
-    if not tfidf_engine_instance.is_ready():
-        print("Service: TFIDFEngine chưa sẵn sàng. Kiểm tra lỗi load model.")
+    if not engine.is_ready():
+        logger.warning("Service: TFIDFEngine chưa sẵn sàng. Kiểm tra lỗi load model.")
         return []
 
-    top_matches_with_scores = tfidf_engine_instance.calculate_similarity(
-        processed_query_for_tfidf, # Truyền chuỗi token đã xử lý
-        num_results
+    top_matches_with_scores = engine.calculate_similarity(
+        query_text, # Truyền chuỗi token đã xử lý
+        num_results,
+        row_filter=row_filter,
+        synonym_weight=synonym_weight
     )
 
     if not top_matches_with_scores:
-        print("Service: Không tìm thấy kết quả nào từ TFIDFEngine.")
+        logger.debug("Service: Không tìm thấy kết quả nào từ TFIDFEngine.")
+        _result_cache.put(cache_key, [])
         return []
 
-    print(f"Service: Top kết quả (ID, Score) từ TF-IDF: {top_matches_with_scores}")
+    logger.debug("Service: Top kết quả (ID, Score) từ TF-IDF: %s", top_matches_with_scores)
 
     top_ids = [match[0] for match in top_matches_with_scores]
 
-    # 3. Lấy thông tin chi tiết (tên, mô tả ngắn) từ database
-    location_details_list = _fetch_location_details_by_ids(top_ids)
+    # 3. Lấy thông tin chi tiết (tên, mô tả ngắn): từ bộ nhớ, database chỉ khi thiếu
+    with metrics.span('details_fetch'):
+        location_details_map = _get_location_details_map(top_ids)
 
-    # 4. Kết hợp điểm số TF-IDF vào thông tin chi tiết
-    # ... (phần này giữ nguyên như cũ) ...
-    results_with_scores = []
-    for detail in location_details_list:
-        score = next((s for id, s in top_matches_with_scores if id == detail['id_dia_diem']), None)
-        if score is not None:
-            detail_with_score = detail.copy() 
-            detail_with_score['tfidf_score'] = round(score, 4) 
-            results_with_scores.append(detail_with_score)
+    # 4. Kết hợp điểm số TF-IDF vào thông tin chi tiết, giữ thứ tự xếp hạng
+    final_results_ordered = _attach_scores(top_matches_with_scores, location_details_map)
+
+    logger.debug("Service: Kết quả cuối cùng trả về: %d địa điểm", len(final_results_ordered))
+    # Chỉ cache khi lấy đủ chi tiết (tránh cache kết quả thiếu do lỗi database)
+    if len(final_results_ordered) == len(top_matches_with_scores):
+        _result_cache.put(cache_key, [detail.copy() for detail in final_results_ordered])
+    return final_results_ordered
+
+
+def search_locations_hybrid(user_query_text: str, num_results: int = 5, tags: list = None,
+                            allowed_ids=None, excluded_ids=None, synonym_weight: float = None) -> list:
+    """
+    Tìm kiếm kết hợp điểm TF-IDF và điểm khớp tag (trọng số TFIDF_WEIGHT, TAG_WEIGHT).
+    Mỗi kết quả có thêm 'score' (điểm tổng hợp), 'tfidf_score' và 'tag_score'.
+    Nếu chưa tải được tag thì chỉ xếp hạng theo TF-IDF. Bộ lọc và synonym_weight (chỉ áp dụng cho
+    điểm TF-IDF) giống search_locations_by_tfidf.
+    """
+    metrics.inc(metrics.queries_total, kind='hybrid')
+    with metrics.trace('search_hybrid', query=user_query_text, num_results=num_results, tags=tags):
+        results = _search_locations_hybrid(user_query_text, num_results, tags, allowed_ids, excluded_ids,
+                                           synonym_weight)
+    if not results:
+        metrics.inc(metrics.empty_results_total, kind='hybrid')
+    return results
+
+
+def _search_locations_hybrid(user_query_text: str, num_results: int, tags: list,
+                             allowed_ids, excluded_ids, synonym_weight: float = None) -> list:
+    with metrics.span('preprocess'):
+        processed_data = preprocess_query(user_query_text)
+    if not processed_data['tokens_for_tfidf']:
+        return []
+
+    _refresh_model_if_changed()
+    engine = get_tfidf_engine()
+    if not engine.is_ready():
+        logger.warning("Service: TFIDFEngine chưa sẵn sàng. Kiểm tra lỗi load model.")
+        return []
+    row_filter = build_search_filter(engine, tags, allowed_ids, excluded_ids)
+    query_text = tfidf_query_text(engine, processed_data, synonym_weight)
+    # Điểm tag tính trên keywords_for_tags nên key gồm cả tập keyword đó
+    cache_key = ('hybrid', tuple(sorted(set(processed_data['keywords_for_tags'])))) + _result_cache_key(
+        engine.model_version, query_text, num_results, row_filter, synonym_weight
+    )
+    cached_results = _result_cache.get(cache_key)
+    if cached_results is not None:
+        return [detail.copy() for detail in cached_results]
+
+    # 1. Điểm của từng tín hiệu trên cùng một ảnh chụp index (ảnh chụp của bộ lọc nếu có)
+    state = row_filter.state if row_filter is not None else engine.snapshot()
+    with metrics.span('scoring'):
+        tfidf_rows, tfidf_scores = engine.score_candidates(query_text, state, row_filter, synonym_weight)
+    metrics.observe(metrics.candidates, tfidf_rows.size)
+    signals = [ScoreSignal('tfidf', tfidf_rows, tfidf_scores)]
+    tag_engine = get_tag_engine(engine, state)
+    if tag_engine is not None:
+        with metrics.span('tag_scoring'):
+            tag_rows, tag_scores = tag_engine.score_rows(processed_data['keywords_for_tags'])
+            if row_filter is not None:
+                allowed = row_filter.mask[tag_rows]
+                tag_rows, tag_scores = tag_rows[allowed], tag_scores[allowed]
+            else:
+                tag_rows, tag_scores = state.drop_deleted(tag_rows, tag_scores)
+        signals.append(ScoreSignal('tag', tag_rows, tag_scores))
+
+    # 2. Kết hợp và lấy top-k (dừng sớm khi không ứng viên nào còn lại có thể vào top-k)
+    with metrics.span('rank'):
+        ranked = hybrid_ranker.rank(signals, num_results)
+    top_ids = [state.location_id_at(item['row']) for item in ranked]
+
+    # 3. Ghép chi tiết địa điểm
+    with metrics.span('details_fetch'):
+        location_details_map = _get_location_details_map(top_ids)
+    results = []
+    for location_id, item in zip(top_ids, ranked):
+        detail = location_details_map.get(location_id)
+        if detail is None:
+            continue
+        detail = detail.copy()
+        detail['score'] = round(item['score'], 4)
+        detail['tfidf_score'] = round(item['signals'].get('tfidf', 0.0), 4)
+        detail['tag_score'] = round(item['signals'].get('tag', 0.0), 4)
+        results.append(detail)
+
+    if len(results) == len(ranked):
+        _result_cache.put(cache_key, [detail.copy() for detail in results])
+    return results
+
+
+def search_locations_semantic(user_query_text: str, num_results: int = 5, tags: list = None,
+                              allowed_ids=None, excluded_ids=None, n_probe: int = None,
+                              synonym_weight: float = None) -> list:
+    """
+    Tìm kiếm ngữ nghĩa: độ tương đồng trong không gian LSA, top-k gần đúng bằng index IVF
+    (xem semantic_index; n_probe mặc định SEMANTIC_NPROBE). Mỗi kết quả có thêm 'semantic_score'.
+    Nếu chưa build index ngữ nghĩa thì dùng search_locations_by_tfidf. Bộ lọc và synonym_weight giống
+    search_locations_by_tfidf.
+    """
+    metrics.inc(metrics.queries_total, kind='semantic')
+    with metrics.trace('search_semantic', query=user_query_text, num_results=num_results, tags=tags):
+        results = _search_locations_semantic(user_query_text, num_results, tags, allowed_ids, excluded_ids, n_probe,
+                                             synonym_weight)
+    if not results:
+        metrics.inc(metrics.empty_results_total, kind='semantic')
+    return results
+
+
+def _search_locations_semantic(user_query_text: str, num_results: int, tags: list,
+                               allowed_ids, excluded_ids, n_probe: int, synonym_weight: float = None) -> list:
+    with metrics.span('preprocess'):
+        processed_data = preprocess_query(user_query_text)
+    if not processed_data['tokens_for_tfidf']:
+        return []
+
+    _refresh_model_if_changed()
+    engine = get_tfidf_engine()
+    if not engine.is_ready():
+        logger.warning("Service: TFIDFEngine chưa sẵn sàng. Kiểm tra lỗi load model.")
+        return []
+    if not engine.has_semantic_index():
+        logger.warning("Service: Chưa có index ngữ nghĩa (build_tfidf_model.py --semantic), dùng TF-IDF.")
+        return _search_locations_by_tfidf(user_query_text, num_results, tags, allowed_ids, excluded_ids,
+                                          synonym_weight)
+    row_filter = build_search_filter(engine, tags, allowed_ids, excluded_ids)
+    query_text = tfidf_query_text(engine, processed_data, synonym_weight)
+    cache_key = ('semantic', n_probe) + _result_cache_key(engine.model_version, query_text, num_results,
+                                                          row_filter, synonym_weight)
+    cached_results = _result_cache.get(cache_key)
+    if cached_results is not None:
+        return [detail.copy() for detail in cached_results]
+
+    top_matches_with_scores = engine.calculate_semantic_similarity(
+        query_text, num_results, row_filter=row_filter, n_probe=n_probe, synonym_weight=synonym_weight
+    )
+    if not top_matches_with_scores:
+        _result_cache.put(cache_key, [])
+        return []
+
+    with metrics.span('details_fetch'):
+        location_details_map = _get_location_details_map([match[0] for match in top_matches_with_scores])
+    results = []
+    for location_id, score in top_matches_with_scores:
+        detail = location_details_map.get(location_id)
+        if detail is not None:
+            detail = detail.copy()
+            detail['semantic_score'] = round(score, 4)
+            results.append(detail)
+
+    if len(results) == len(top_matches_with_scores):
+        _result_cache.put(cache_key, [detail.copy() for detail in results])
+    return results
+
+
+def search_locations_paginated(user_query_text: str = None, page_size: int = 10, cursor: str = None,
+                               tags: list = None, allowed_ids=None, excluded_ids=None,
+                               synonym_weight: float = None) -> dict:
+    """
+    Tìm kiếm TF-IDF có phân trang. Trang đầu (không có cursor) tính danh sách xếp hạng tối đa
+    SEARCH_SESSION_MAX_RESULTS địa điểm một lần và lưu thành phiên; các trang sau (cursor = next_cursor
+    của trang trước) chỉ cắt danh sách đó và lấy chi tiết cho các địa điểm của trang.
+    Trả về dict: query, offset, total (số kết quả của phiên), count, results (cùng dạng với
+    search_locations_by_tfidf) và next_cursor (None ở trang cuối).
+    Raise InvalidCursorError nếu cursor sai định dạng, SearchSessionExpiredError nếu phiên đã hết hạn.
+    Bộ lọc (tags/allowed_ids/excluded_ids) và synonym_weight chỉ dùng ở trang đầu, phiên giữ nguyên tập
+    kết quả đã xếp hạng.
+    """
+    metrics.inc(metrics.queries_total, kind='paged')
+    with metrics.trace('search_paged', query=user_query_text, num_results=page_size, tags=tags):
+        page = _search_locations_paginated(user_query_text, page_size, cursor, tags, allowed_ids, excluded_ids,
+                                           synonym_weight)
+    if not page['results']:
+        metrics.inc(metrics.empty_results_total, kind='paged')
+    return page
+
+
+def _search_locations_paginated(user_query_text: str, page_size: int, cursor: str, tags: list,
+                                allowed_ids, excluded_ids, synonym_weight: float = None) -> dict:
+    if cursor:
+        session_id, offset = decode_cursor(cursor)
+        session = _search_sessions.get(session_id)
+    else:
+        offset = 0
+        session = _open_search_session(user_query_text, tags, allowed_ids, excluded_ids, synonym_weight)
+    if session is None:
+        return {'query': user_query_text, 'offset': 0, 'total': 0, 'count': 0, 'results': [], 'next_cursor': None}
+
+    matches = session.page(offset, page_size)
+    with metrics.span('details_fetch'):
+        location_details_map = _get_location_details_map([match[0] for match in matches])
+    results = _attach_scores(matches, location_details_map)
+    next_offset = offset + len(matches)
+    return {
+        'query': session.query,
+        'offset': offset,
+        'total': session.total,
+        'count': len(results),
+        'results': results,
+        'next_cursor': encode_cursor(session.session_id, next_offset) if next_offset < session.total else None,
+    }
+
+
+def _open_search_session(user_query_text: str, tags: list, allowed_ids, excluded_ids, synonym_weight: float = None):
+    """Phiên xếp hạng của truy vấn (dùng lại phiên còn hạn của cùng truy vấn); None nếu không tìm được."""
+    with metrics.span('preprocess'):
+        processed_data = preprocess_query(user_query_text or '')
+    if not processed_data['tokens_for_tfidf']:
+        return None
+
+    _refresh_model_if_changed()
+    engine = get_tfidf_engine()
+    if not engine.is_ready():
+        logger.warning("Service: TFIDFEngine chưa sẵn sàng. Kiểm tra lỗi load model.")
+        return None
+    row_filter = build_search_filter(engine, tags, allowed_ids, excluded_ids)
+    query_text = tfidf_query_text(engine, processed_data, synonym_weight)
+    query_key = _result_cache_key(engine.model_version, query_text, SEARCH_SESSION_MAX_RESULTS, row_filter,
+                                  synonym_weight)
+    session = _search_sessions.find(query_key)
+    if session is not None:
+        return session
+
+    matches = engine.calculate_similarity(
+        query_text, SEARCH_SESSION_MAX_RESULTS, row_filter=row_filter, synonym_weight=synonym_weight
+    )
+    return _search_sessions.create(query_key, user_query_text, engine.model_version, matches)
+
+
+def get_search_session_stats() -> dict:
+    """Thống kê cache phiên phân trang."""
+    return _search_sessions.stats()
+
+
+def search_locations_by_tfidf_batch(user_query_texts: list, num_results: int = 5, tags: list = None,
+                                    allowed_ids=None, excluded_ids=None, synonym_weight: float = None) -> list:
+    """
+    Tìm kiếm theo lô cho nhiều truy vấn (dùng cho các job offline).
+    Toàn bộ truy vấn được vector hóa và tính điểm trong một lần gọi TFIDFEngine,
+    chi tiết địa điểm của tất cả kết quả được lấy trong một lần truy vấn database.
+    Trả về list cùng độ dài với user_query_texts; phần tử thứ i có cùng dạng với
+    kết quả của search_locations_by_tfidf cho truy vấn thứ i (cùng bộ lọc và synonym_weight cho cả lô).
+    """
+    if not user_query_texts:
+        return []
+
+    _refresh_model_if_changed()
+    engine = get_tfidf_engine()
+    if not engine.is_ready():
+        logger.warning("Service: TFIDFEngine chưa sẵn sàng. Kiểm tra lỗi load model.")
+        return [[] for _ in user_query_texts]
+    metrics.inc(metrics.queries_total, len(user_query_texts), kind='batch')
+
+    # 1. Tiền xử lý từng truy vấn
+    with metrics.span('preprocess_batch'):
+        processed_queries = [
+            tfidf_query_text(engine, preprocess_query(text), synonym_weight) for text in user_query_texts
+        ]
+
+    # 2. Tính điểm cho cả lô
+    row_filter = build_search_filter(engine, tags, allowed_ids, excluded_ids)
+    all_top_matches = engine.calculate_similarity_batch(
+        processed_queries, num_results, row_filter=row_filter, synonym_weight=synonym_weight
+    )
+
+    # 3. Lấy chi tiết cho hợp các ID (từ bộ nhớ; các ID còn thiếu lấy trong một lần truy vấn database)
+    unique_ids = list(dict.fromkeys(loc_id for matches in all_top_matches for loc_id, _ in matches))
+    with metrics.span('details_fetch_batch'):
+        location_details_map = _get_location_details_map(unique_ids)
+
+    # 4. Ghép điểm vào chi tiết cho từng truy vấn
+    batch_results = [_attach_scores(matches, location_details_map) for matches in all_top_matches]
+    metrics.inc(metrics.empty_results_total, sum(1 for results in batch_results if not results), kind='batch')
+    logger.debug("Service: Đã xử lý lô %d truy vấn, %d địa điểm khác nhau.", len(user_query_texts), len(unique_ids))
+    return batch_results
+
+
+def _start_rebuild_if_needed(engine: "TFIDFEngine"):
+    """
+    Khi từ vựng/IDF đã lệch nhiều so với dữ liệu (engine.needs_refit()), chạy MODEL_REBUILD_COMMAND
+    trên tiến trình nền. Model mới được tải lại tự động trên thread nền (xem _refresh_model_if_changed).
+    """
+    global _rebuild_process
+    if not engine.needs_refit():
+        return
+    if not MODEL_REBUILD_COMMAND:
+        logger.warning("Service Cảnh báo: Tỉ lệ token ngoài từ vựng %.2f%%, nên chạy lại build_tfidf_model.py.", engine.oov_ratio() * 100)
+        return
+    with _model_check_lock:
+        if _rebuild_process is not None and _rebuild_process.poll() is None:
+            return
+        print(f"Service: Đang build lại model nền: {MODEL_REBUILD_COMMAND}")
+        _rebuild_process = subprocess.Popen(shlex.split(MODEL_REBUILD_COMMAND))
+
+
+def upsert_location(location_id, description: str) -> bool:
+    """
+    Thêm mới hoặc cập nhật một địa điểm trong index đang phục vụ (không cần build lại toàn bộ).
+    description là mô tả dùng để huấn luyện TF-IDF (cột mo_ta_chi_tiet). Kết quả tìm kiếm
+    phản ánh thay đổi ngay ở truy vấn tiếp theo.
+    """
+    engine = get_tfidf_engine()
+    if not engine.upsert_location(location_id, preprocess_document(description)):
+        return False
+    store = location_details_store
+    if store is not None and store.loaded:
+        store.refresh_ids([location_id]) # Kết quả của địa điểm mới không phải lấy chi tiết từ database
+    if _tag_engine is not None:
+        _refresh_tag_engine() # Tag của địa điểm mới có thể vừa được ghi vào dia_danh_tag
+        get_tag_engine(engine)
+    _refresh_model_if_changed() # model_version đã đổi: xóa cache kết quả
+    _start_rebuild_if_needed(engine)
+    return True
+
+
+def delete_location(location_id) -> bool:
+    """Xóa một địa điểm khỏi index đang phục vụ. Trả về False nếu địa điểm không có trong index."""
+    if not get_tfidf_engine().delete_location(location_id):
+        return False
+    _refresh_model_if_changed()
+    return True
+
+
+def get_index_stats() -> dict:
+    """Thông tin segment gốc/delta/tombstone của index đang phục vụ (rỗng khi engine chưa được tải)."""
+    engine = tfidf_engine_instance
+    return engine.index_stats() if engine is not None else {}
+
+
+def get_details_store_stats() -> dict:
+    """Thống kê location_details_store (chưa tạo khi engine chưa được tải)."""
+    store = location_details_store
+    return store.stats() if store is not None else {'loaded': False, 'size': 0}
 
-    final_results_ordered = []
-    for loc_id, score in top_matches_with_scores:
-        found_detail = next((res for res in results_with_scores if res['id_dia_diem'] == loc_id), None)
-        if found_detail:
-            final_results_ordered.append(found_detail)
 
-    print(f"Service: Kết quả cuối cùng trả về: {len(final_results_ordered)} địa điểm")
-    return final_results_ordered
\ No newline at end of file
+# Số liệu xuất qua /metrics dưới dạng gauge (đọc lúc xuất, không tốn chi phí trên đường tìm kiếm)
+metrics.registry.register_collector('search_result_cache', get_search_cache_stats)
+metrics.registry.register_collector('search_sessions', get_search_session_stats)
+metrics.registry.register_collector('search_index', get_index_stats)
+metrics.registry.register_collector('location_details_store', get_details_store_stats)
+metrics.registry.register_collector('db_pool', get_db_pool_stats)
@@ -0,0 +1,97 @@
+# backend/app/services/search_sessions.py
+# Phiên phân trang kết quả tìm kiếm: danh sách xếp hạng của một truy vấn (tối đa SEARCH_SESSION_MAX_RESULTS
+# địa điểm) được tính một lần và giữ trong bộ nhớ dạng mảng gọn (ID + điểm float32), các trang sau
+# chỉ cắt mảng và lấy chi tiết cho đúng trang đó.
+# Client nhận một cursor mờ (base64 của "session_id:offset") cho trang tiếp theo. Phiên là ảnh chụp
+# tại lúc tìm kiếm: model thay đổi sau đó không làm thay đổi thứ tự các trang của phiên đang mở.
+import base64
+import binascii
+import secrets
+import time
+
+import numpy as np
+
+from app.search_logic.utils import LRUCache
+
+
+class SearchSessionExpiredError(Exception):
+    """Phiên của cursor đã hết hạn hoặc bị đẩy khỏi cache; client cần tìm kiếm lại từ trang đầu."""
+
+
+class InvalidCursorError(ValueError):
+    """Cursor không đúng định dạng (không phải do server tạo ra)."""
+
+
+class SearchSession:
+    """Danh sách xếp hạng của một truy vấn: location_ids và scores (float32) theo điểm giảm dần."""
+
+    __slots__ = ('session_id', 'query', 'model_version', 'location_ids', 'scores', 'created_at')
+
+    def __init__(self, session_id: str, query: str, model_version: str, matches: list):
+        self.session_id = session_id
+        self.query = query
+        self.model_version = model_version
+        self.location_ids = np.array([location_id for location_id, _ in matches])
+        self.scores = np.array([score for _, score in matches], dtype=np.float32)
+        self.created_at = time.time()
+
+    @property
+    def total(self) -> int:
+        return self.scores.size
+
+    def page(self, offset: int, page_size: int) -> list:
+        """Các (location_id, score) của trang bắt đầu từ offset, dạng kiểu cơ bản của Python."""
+        end = offset + page_size
+        return list(zip(self.location_ids[offset:end].tolist(), self.scores[offset:end].tolist()))
+
+
+class SearchSessionStore:
+    """
+    Cache LRU (kích thước + TTL) các SearchSession theo session_id, kèm chỉ mục query_key -> session_id
+    để cùng một truy vấn (cùng model_version, bộ lọc) mở lại trang đầu dùng chung phiên đã có.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self._sessions = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self._session_ids = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+
+    def create(self, query_key: tuple, query: str, model_version: str, matches: list) -> SearchSession:
+        session = SearchSession(secrets.token_urlsafe(12), query, model_version, matches)
+        self._sessions.put(session.session_id, session)
+        self._session_ids.put(query_key, session.session_id)
+        return session
+
+    def find(self, query_key: tuple) -> SearchSession:
+        """Phiên còn hạn của query_key (None nếu chưa có hoặc đã hết hạn)."""
+        session_id = self._session_ids.get(query_key)
+        return self._sessions.get(session_id) if session_id is not None else None
+
+    def get(self, session_id: str) -> SearchSession:
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise SearchSessionExpiredError("Phiên tìm kiếm đã hết hạn, hãy tìm kiếm lại.")
+        return session
+
+    def clear(self):
+        self._sessions.clear()
+        self._session_ids.clear()
+
+    def stats(self) -> dict:
+        return self._sessions.stats()
+
+
+def encode_cursor(session_id: str, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{session_id}:{offset}".encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(session_id, offset) của cursor; raise InvalidCursorError nếu cursor không hợp lệ."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        session_id, offset = raw.rsplit(':', 1)
+        offset = int(offset)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError("Cursor không hợp lệ.") from None
+    if not session_id or offset < 0:
+        raise InvalidCursorError("Cursor không hợp lệ.")
+    return session_id, offset
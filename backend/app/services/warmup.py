@@ -0,0 +1,217 @@
+# backend/app/services/warmup.py
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from app.core import metrics
+from app.core.config import STARTUP_WARMUP, WARMUP_QUERIES_PATH, WARMUP_RETRY_SECONDS, WARMUP_RETRY_MAX_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Truy vấn mẫu dùng khi không có WARMUP_QUERIES_PATH: đủ để underthesea tải model tách từ
+# và để các trang của index (memory-map), từ vựng, posting list được đọc vào bộ nhớ
+DEFAULT_WARMUP_QUERIES = (
+    "bãi biển đẹp",
+    "du lịch bụi giá rẻ",
+    "chùa cổ linh thiêng",
+    "thác nước trong rừng",
+    "leo núi ngắm bình minh",
+    "khu vui chơi cho trẻ em",
+    "ẩm thực đường phố",
+    "di tích lịch sử",
+)
+
+# Các module nặng được import trên thread warm-up (đo thời gian từng module)
+HEAVY_MODULES = ('scipy.sparse', 'underthesea', 'app.search_logic.tfidf_engine')
+
+
+class StartupState:
+    """
+    Trạng thái khởi động của service cho readiness probe (/api/ready):
+    'pending' -> 'warming' -> 'ready' hoặc 'failed'; 'skipped' khi tắt warm-up (STARTUP_WARMUP=off).
+    'failed' -> 'warming' khi tới thời điểm thử lại (retry_at, xem retry_if_due).
+    timings: thời gian (giây) import và từng bước warm-up.
+    """
+
+    def __init__(self):
+        self.status = 'pending'
+        self.error = None
+        self.timings = {}
+        self.started_at = None
+        self.finished_at = None
+        self.failures = 0 # Số lần warm-up thất bại liên tiếp
+        self.retry_at = None # time.monotonic() sớm nhất được thử lại sau khi thất bại
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ('ready', 'skipped')
+
+    def record(self, stage: str, seconds: float):
+        self.timings[stage] = round(seconds, 4)
+
+    @contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def schedule_retry(self, base: float = WARMUP_RETRY_SECONDS, maximum: float = WARMUP_RETRY_MAX_SECONDS):
+        """Ghi nhận một lần thất bại và hẹn lần thử lại: base giây, gấp đôi sau mỗi lần thất bại, tối đa maximum."""
+        self.failures += 1
+        self.retry_at = time.monotonic() + min(maximum, base * 2 ** (self.failures - 1))
+
+    def reset_after_fork(self):
+        """
+        Gọi trong process con sau fork (os.register_at_fork): thread warm-up của process cha không tồn tại
+        trong process con và lock có thể đang bị giữ, nên tạo lock mới; trạng thái 'failed' (hoặc 'warming'
+        dở dang) về lại 'pending' để mỗi worker tự warm-up lại thay vì thừa hưởng lỗi của master.
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        if self.status in ('warming', 'failed'):
+            self.status = 'pending'
+            self.retry_at = None
+
+    def stats(self) -> dict:
+        return {
+            'status': self.status,
+            'ready': self.ready,
+            'error': self.error,
+            'failures': self.failures,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'timings_seconds': dict(self.timings),
+        }
+
+    def metric_values(self) -> dict:
+        """Gauge cho /metrics: startup_ready và startup_<bước>_seconds."""
+        values = {f"{stage}_seconds": seconds for stage, seconds in self.timings.items()}
+        values['ready'] = self.ready
+        values['failures'] = self.failures
+        return values
+
+
+startup_state = StartupState()
+
+
+def load_warmup_queries(path: str = WARMUP_QUERIES_PATH) -> list:
+    """Truy vấn mẫu từ file (mỗi dòng một truy vấn, bỏ dòng trống và dòng '#'), mặc định DEFAULT_WARMUP_QUERIES."""
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                queries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+            if queries:
+                return queries
+        except OSError as e:
+            logger.warning("Warm-up: Không đọc được file truy vấn mẫu %s: %s", path, e)
+    return list(DEFAULT_WARMUP_QUERIES)
+
+
+def warm_up(queries: list = None, state: StartupState = startup_state) -> bool:
+    """
+    Import các module nặng, tải model TF-IDF (search_service.get_tfidf_engine), rồi chạy các
+    truy vấn mẫu qua preprocess_query và engine.calculate_similarity để tokenizer và index
+    đã "nóng" trước truy vấn thật. Không truy vấn database và không ghi vào cache kết quả.
+    Trả về True nếu engine sẵn sàng.
+    """
+    from app.services import search_service
+    from app.search_logic.preprocessor import preprocess_query
+
+    state.status = 'warming'
+    state.started_at = time.time()
+    start = time.perf_counter()
+    try:
+        for module_name in HEAVY_MODULES:
+            with state.timed('import_' + module_name.replace('.', '_')):
+                importlib.import_module(module_name)
+
+        with state.timed('load_engine'):
+            engine = search_service.get_tfidf_engine()
+        if not engine.is_ready():
+            raise RuntimeError("TFIDFEngine chưa sẵn sàng, kiểm tra lỗi tải model.")
+        with state.timed('load_suggestions'):
+            search_service.get_suggestion_index()
+
+        queries = list(queries) if queries is not None else load_warmup_queries()
+        if queries:
+            # Lần tách từ đầu tiên tải model của underthesea
+            with state.timed('load_tokenizer'):
+                preprocess_query(queries[0])
+        with state.timed('warmup_queries'):
+            for query in queries:
+                tokens = search_service.tfidf_query_text(engine, preprocess_query(query))
+                if tokens:
+                    engine.calculate_similarity(tokens, 5)
+    except Exception as e:
+        state.error = str(e)
+        state.schedule_retry()
+        state.status = 'failed'
+        metrics.inc(metrics.errors_total, stage='warmup')
+        logger.exception("Warm-up thất bại (lần %d), thử lại sau %.0fs",
+                         state.failures, state.retry_at - time.monotonic())
+        return False
+    finally:
+        state.record('warmup_total', time.perf_counter() - start)
+        state.finished_at = time.time()
+
+    state.error = None
+    state.failures = 0
+    state.retry_at = None
+    state.status = 'ready'
+    logger.info("Warm-up xong sau %.2fs (%d truy vấn mẫu): %s",
+                state.timings['warmup_total'], len(queries), state.timings)
+    return True
+
+
+def start(mode: str = STARTUP_WARMUP, state: StartupState = startup_state):
+    """
+    Bắt đầu warm-up theo mode (xem STARTUP_WARMUP): 'background' chạy trên thread nền,
+    'blocking' chạy ngay và chỉ trả về khi xong, 'off' bỏ qua (service được coi là sẵn sàng).
+    Gọi nhiều lần chỉ warm-up một lần.
+    """
+    with state._lock:
+        if state.status != 'pending':
+            return
+        if mode == 'off':
+            state.status = 'skipped'
+            return
+        state.status = 'warming'
+        if mode != 'blocking':
+            _start_thread(state)
+            return
+    warm_up(state=state)
+
+
+def retry_if_due(state: StartupState = startup_state) -> bool:
+    """
+    Thử lại warm-up trên thread nền nếu lần trước thất bại và đã tới retry_at ('failed' -> 'warming').
+    Gọi từ /api/ready nên không chặn request; trả về True nếu đã khởi động một lần thử lại.
+    """
+    if state.status != 'failed':
+        return False
+    with state._lock:
+        if state.status != 'failed' or time.monotonic() < state.retry_at:
+            return False
+        state.status = 'warming'
+        _start_thread(state)
+    logger.info("Thử lại warm-up (sau %d lần thất bại)", state.failures)
+    return True
+
+
+def _start_thread(state: StartupState):
+    state._thread = threading.Thread(target=warm_up, kwargs={'state': state},
+                                     name="search-warmup", daemon=True)
+    state._thread.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=startup_state.reset_after_fork)
+
+metrics.registry.register_collector('startup', startup_state.metric_values)
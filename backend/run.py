@@ -0,0 +1,64 @@
+# backend/run.py
+# Chạy API server.
+#   python run.py                  # một tiến trình (uvicorn), model tải trên thread warm-up
+#   python run.py --workers 4      # prefork: master tải model/tokenizer một lần, fork 4 worker dùng chung
+#                                  # bộ nhớ đó (copy-on-write) trên cùng socket, giám sát và khởi động lại worker
+# Có thể đặt số worker bằng biến môi trường API_WORKERS.
+import argparse
+import gc
+import logging
+
+import uvicorn
+
+from app.core.config import (
+    API_HOST, API_PORT, API_WORKERS, WORKER_MEMORY_REPORT_INTERVAL, WORKER_SHUTDOWN_TIMEOUT
+)
+
+
+def run_prefork(host: str, port: int, num_workers: int) -> int:
+    # Tắt GC trong lúc tải để không để lại "lỗ" trong các trang nhớ sẽ được dùng chung (xem PreforkServer)
+    gc.disable()
+
+    from app.core.prefork import PreforkServer, create_listen_socket
+    from app.main import app
+    from app.services import search_service, warmup
+
+    # Thread nền (làm mới store chi tiết) không tồn tại sau fork: mỗi worker tự khởi động
+    search_service.set_background_tasks_on_load(False)
+    warmup.start('blocking')
+    if not warmup.startup_state.ready:
+        print(f"Cảnh báo: warm-up trong master thất bại ({warmup.startup_state.error}), "
+              "mỗi worker sẽ tự warm-up lại khi khởi động.")
+    print(f"Master: đã tải model, thời gian: {warmup.startup_state.timings}")
+    # Process pool của index shard (nếu warm-up đã tạo) không được dùng chung qua fork: mỗi worker tự tạo
+    if search_service.tfidf_engine_instance is not None:
+        search_service.tfidf_engine_instance.close()
+
+    sock = create_listen_socket(host, port)
+    print(f"Master: lắng nghe trên {host}:{port}, fork {num_workers} worker")
+
+    def serve(worker_id: int):
+        search_service.start_background_tasks()
+        server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+        server.run(sockets=[sock])
+
+    server = PreforkServer(
+        num_workers, serve,
+        shutdown_timeout=WORKER_SHUTDOWN_TIMEOUT,
+        memory_report_interval=WORKER_MEMORY_REPORT_INTERVAL,
+    )
+    return server.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy DATN Search API.")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--workers', type=int, default=API_WORKERS,
+                        help="Số tiến trình worker (> 1: prefork, dùng chung model đã tải trong master)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        raise SystemExit(run_prefork(args.host, args.port, args.workers))
+    uvicorn.run("app.main:app", host=args.host, port=args.port)
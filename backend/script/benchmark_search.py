@@ -0,0 +1,354 @@
+# backend/script/benchmark_search.py
+# Bộ benchmark tìm kiếm có thể lặp lại:
+# 1. Sinh bảng dia_danh giả lập (tiếng Việt) với số dòng tùy chọn vào một file SQLite (thay cho MySQL).
+# 2. Build model bằng đúng pipeline của build_tfidf_model.py (tách từ song song, fit TF-IDF, lưu index).
+# 3. Đo từng bước của một truy vấn: preprocess_query, vector hóa truy vấn (QueryVectorizer), tính điểm, chọn top-k,
+#    lấy chi tiết từ SQLite, và toàn bộ (end-to-end); báo cáo throughput và p50/p95/p99.
+# 4. Ghi kết quả ra JSON (--output) và so sánh với một lần chạy trước (--compare).
+#
+# Ví dụ (chạy từ thư mục backend/):
+#   python script/benchmark_search.py --rows 10000 --queries 2000 --output bench_10k.json
+#   python script/benchmark_search.py --rows 10000 --queries 2000 --compare bench_10k.json
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# --- Cấu hình mặc định ---
+DEFAULT_ROWS = 10000
+DEFAULT_QUERIES = 1000
+DEFAULT_SEED = 42
+DEFAULT_NUM_RESULTS = 5
+WARMUP_QUERIES = 50
+STAGES = ['preprocess_query', 'vectorizer.transform', 'scoring', 'top_k', 'details_fetch', 'end_to_end']
+
+# --- Từ vựng để sinh dữ liệu giả lập ---
+PLACE_TYPES = [
+    "bãi biển", "chùa", "đền", "bảo tàng", "khu du lịch", "làng nghề", "chợ nổi", "hang động", "thác nước",
+    "vườn quốc gia", "đảo", "hồ", "núi", "khu di tích", "phố cổ", "nhà thờ", "công viên", "đồi chè",
+    "resort", "homestay", "địa đạo", "tượng đài", "cao nguyên", "rừng ngập mặn", "cầu", "thành cổ",
+]
+ADJECTIVES = [
+    "đẹp", "yên tĩnh", "hoang sơ", "cổ kính", "nổi tiếng", "linh thiêng", "thơ mộng", "hùng vĩ", "sầm uất",
+    "xanh mát", "trong lành", "rộng lớn", "độc đáo", "lâu đời", "sang trọng", "bình dân", "lãng mạn",
+    "mát mẻ", "huyền bí", "tráng lệ", "nhộn nhịp", "thanh bình", "hấp dẫn", "kỳ vĩ",
+]
+PROVINCES = [
+    "hà nội", "hải phòng", "quảng ninh", "ninh bình", "lào cai", "hà giang", "sơn la", "thanh hóa", "nghệ an",
+    "huế", "đà nẵng", "quảng nam", "quảng ngãi", "bình định", "phú yên", "khánh hòa", "ninh thuận",
+    "bình thuận", "lâm đồng", "đắk lắk", "gia lai", "kon tum", "đồng nai", "bà rịa vũng tàu", "hồ chí minh",
+    "tây ninh", "cần thơ", "an giang", "kiên giang", "cà mau", "bến tre", "tiền giang", "vĩnh long",
+]
+ACTIVITIES = [
+    "tắm biển", "lặn ngắm san hô", "leo núi", "cắm trại", "chụp ảnh", "thưởng thức hải sản", "tham quan",
+    "đi thuyền", "câu cá", "dạo phố", "mua sắm đặc sản", "tìm hiểu lịch sử", "trải nghiệm văn hóa",
+    "nghỉ dưỡng", "đạp xe", "ngắm hoàng hôn", "săn mây", "khám phá hang động", "dự lễ hội", "thắp hương",
+    "đi bộ đường rừng", "chèo thuyền kayak", "ăn ẩm thực đường phố", "xem múa rối nước",
+]
+FEATURES = [
+    "bãi cát trắng", "nước biển trong xanh", "kiến trúc cổ", "rừng nguyên sinh", "ruộng bậc thang",
+    "cảnh quan thiên nhiên", "di sản văn hóa", "món ăn đặc sản", "không khí trong lành", "dòng sông hiền hòa",
+    "những ngọn đồi", "vườn hoa", "làng chài", "phong cảnh hữu tình", "hệ sinh thái đa dạng",
+    "công trình lịch sử", "lễ hội truyền thống", "chợ đêm", "khu trưng bày", "tượng phật", "mái ngói rêu phong",
+]
+AUDIENCES = ["gia đình", "cặp đôi", "nhóm bạn", "học sinh", "người cao tuổi", "du khách nước ngoài", "dân phượt"]
+CONNECTORS = ["nằm ở", "thuộc tỉnh", "cách trung tâm", "gần", "nổi bật với", "có", "là nơi", "được biết đến với"]
+# Âm tiết để tạo tên riêng, giúp từ vựng tăng theo kích thước corpus như dữ liệu thật
+NAME_SYLLABLES = [
+    "an", "bình", "cát", "đông", "giang", "hà", "hải", "hòa", "hưng", "khánh", "lạc", "lâm", "long", "minh",
+    "mỹ", "nam", "ngọc", "phong", "phú", "phước", "quang", "sơn", "tân", "thạch", "thanh", "thành", "thiên",
+    "thủy", "tiên", "trà", "trung", "tường", "vân", "việt", "vĩnh", "xuân", "yên", "bảo", "cẩm", "đức",
+]
+QUERY_TEMPLATES = [
+    "{type} {adj} ở {province}", "nơi {activity} {adj}", "{type} để {activity}", "{feature} {province}",
+    "địa điểm {adj} cho {audience}", "{type} {adj}", "muốn đi {type} có {feature}", "{activity} ở {province}",
+]
+
+
+def zipf_choice(rng, items, size, exponent=1.1):
+    """Chọn ngẫu nhiên theo phân phối Zipf (phần tử đầu xuất hiện nhiều hơn), giống phân bố từ thật."""
+    weights = 1.0 / np.arange(1, len(items) + 1) ** exponent
+    indices = rng.choice(len(items), size=size, p=weights / weights.sum())
+    return [items[i] for i in indices]
+
+
+def generate_name(rng):
+    return " ".join(rng.choice(NAME_SYLLABLES, size=2)).title()
+
+
+def generate_description(rng, name, place_type, province):
+    """Mô tả chi tiết khoảng 40-80 từ ghép từ các cụm có sẵn."""
+    sentences = [f"{place_type} {name} {rng.choice(CONNECTORS)} {province}"]
+    for _ in range(int(rng.integers(3, 7))):
+        sentences.append(
+            f"{' '.join(zipf_choice(rng, FEATURES, 2))} {rng.choice(ADJECTIVES)}, "
+            f"du khách có thể {rng.choice(ACTIVITIES)} và {rng.choice(ACTIVITIES)}, "
+            f"phù hợp cho {rng.choice(AUDIENCES)}"
+        )
+    return ". ".join(sentences) + "."
+
+
+def generate_corpus(db_path, num_rows, seed, batch_size=5000):
+    """Tạo bảng dia_danh giả lập (id_dia_diem, ten, mo_ta, mo_ta_chi_tiet) trong file SQLite."""
+    rng = np.random.default_rng(seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE dia_danh (id_dia_diem TEXT PRIMARY KEY, ten TEXT, mo_ta TEXT, mo_ta_chi_tiet TEXT)")
+    width = max(3, len(str(num_rows)))
+    for start in range(0, num_rows, batch_size):
+        rows = []
+        for i in range(start, min(start + batch_size, num_rows)):
+            name = generate_name(rng)
+            place_type = zipf_choice(rng, PLACE_TYPES, 1)[0]
+            province = zipf_choice(rng, PROVINCES, 1)[0]
+            ten = f"{place_type} {name}".capitalize()
+            mo_ta = f"{ten} - {rng.choice(ADJECTIVES)} tại {province}"
+            rows.append((f"DD{i + 1:0{width}d}", ten, mo_ta, generate_description(rng, name, place_type, province)))
+        conn.executemany("INSERT INTO dia_danh VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def generate_queries(num_queries, seed):
+    """Truy vấn giả lập; lấy mẫu có lặp lại theo Zipf để giống lưu lượng thật (nhiều truy vấn phổ biến)."""
+    rng = np.random.default_rng(seed + 1)
+    unique = []
+    for _ in range(max(1, num_queries // 4)):
+        template = QUERY_TEMPLATES[int(rng.integers(len(QUERY_TEMPLATES)))]
+        unique.append(template.format(
+            type=rng.choice(PLACE_TYPES), adj=rng.choice(ADJECTIVES), province=rng.choice(PROVINCES),
+            activity=rng.choice(ACTIVITIES), feature=rng.choice(FEATURES), audience=rng.choice(AUDIENCES),
+        ))
+    return zipf_choice(rng, unique, num_queries, exponent=0.8)
+
+
+def sqlite_chunks(conn, chunk_size, timings):
+    """Giống build_tfidf_model.stream_rows nhưng đọc từ SQLite."""
+    cursor = conn.execute(
+        "SELECT id_dia_diem, mo_ta_chi_tiet FROM dia_danh "
+        "WHERE mo_ta_chi_tiet IS NOT NULL AND mo_ta_chi_tiet != '' ORDER BY rowid"
+    )
+    while True:
+        start = time.perf_counter()
+        rows = cursor.fetchmany(chunk_size)
+        timings.add('fetch', time.perf_counter() - start)
+        if not rows:
+            break
+        yield [row[0] for row in rows], [row[1] for row in rows]
+
+
+def build_artifacts(db_path, output_dir, workers, chunk_size):
+    """Build model từ SQLite bằng các hàm của build_tfidf_model.py. Trả về thời gian từng bước (giây)."""
+    import build_tfidf_model
+
+    timings = build_tfidf_model.StageTimings()
+    conn = sqlite3.connect(db_path)
+    try:
+        documents = build_tfidf_model.tokenize_stream(sqlite_chunks(conn, chunk_size, timings), workers, timings)
+        vectorizer, tfidf_matrix, location_ids = build_tfidf_model.build_model(documents, timings)
+    finally:
+        conn.close()
+    build_tfidf_model.save_artifacts(output_dir, vectorizer, tfidf_matrix, location_ids, timings)
+    return dict(timings.seconds)
+
+
+class StageRecorder:
+    """Lưu thời gian (ns) của từng lần chạy mỗi bước."""
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def add(self, stage, nanoseconds):
+        self.samples[stage].append(nanoseconds)
+
+    def summary(self) -> dict:
+        result = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ms = np.asarray(samples, dtype=np.float64) / 1e6
+            result[stage] = {
+                'count': int(ms.size),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'p99_ms': float(np.percentile(ms, 99)),
+                'max_ms': float(ms.max()),
+                'throughput_per_s': float(ms.size / (ms.sum() / 1000)) if ms.sum() > 0 else None,
+            }
+        return result
+
+
+class SQLiteDetailsFetcher:
+    """Lấy chi tiết địa điểm giống search_service._fetch_location_details_by_ids nhưng trên SQLite."""
+
+    def __init__(self, db_path, batch_size):
+        self.batch_size = batch_size
+        self.query = (
+            "SELECT id_dia_diem, ten, mo_ta FROM dia_danh WHERE id_dia_diem IN ("
+            + ", ".join(["?"] * batch_size) + ")"
+        )
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+
+    def fetch(self, location_ids):
+        details = {}
+        unique_ids = list(dict.fromkeys(location_ids))
+        for start in range(0, len(unique_ids), self.batch_size):
+            batch = unique_ids[start:start + self.batch_size]
+            params = tuple(batch) + (batch[-1],) * (self.batch_size - len(batch))
+            for id_dia_diem, ten, mo_ta in self.conn.execute(self.query, params):
+                details[id_dia_diem] = {'id_dia_diem': id_dia_diem, 'ten': ten, 'mo_ta': mo_ta}
+        return [details[loc_id] for loc_id in location_ids if loc_id in details]
+
+
+def run_queries(engine, fetcher, queries, num_results, recorder=None):
+    """Chạy các truy vấn qua từng bước của đường tìm kiếm, ghi thời gian vào recorder (nếu có)."""
+    from app.search_logic.preprocessor import preprocess_query
+    from app.search_logic.tfidf_engine import _select_top_k
+
+    clock = time.perf_counter_ns
+    empty_results = 0
+    for query in queries:
+        t0 = clock()
+        processed = preprocess_query(query)['tokens_for_tfidf']
+        t1 = clock()
+        state = engine.snapshot()
+        term_indices, term_weights = engine.query_vectorizer.transform(processed)
+        t2 = clock()
+        rows, scores = engine._score_query_vector(state, term_indices, term_weights)
+        t3 = clock()
+        positive = scores > 0
+        top_rows, top_scores = _select_top_k(rows[positive], scores[positive], num_results)
+        top_ids = [state.location_id_at(row) for row in top_rows.tolist()]
+        t4 = clock()
+        details = fetcher.fetch(top_ids)
+        t5 = clock()
+        if not details:
+            empty_results += 1
+        if recorder is not None:
+            for stage, start, end in zip(STAGES, (t0, t1, t2, t3, t4), (t1, t2, t3, t4, t5)):
+                recorder.add(stage, end - start)
+            recorder.add('end_to_end', t5 - t0)
+    return empty_results
+
+
+def print_report(report, baseline=None):
+    print(f"\nCorpus: {report['corpus']['rows']} dòng, từ vựng {report['corpus']['vocabulary_size']}, "
+          f"nnz {report['corpus']['nnz']}, {report['queries']['count']} truy vấn "
+          f"({report['queries']['unique']} khác nhau), top-{report['queries']['num_results']}")
+    header = f"{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'ops/s':>12}"
+    if baseline:
+        header += f"{'Δp50':>9}{'Δp99':>9}"
+    print(header)
+    for stage, stats in report['stages'].items():
+        line = (f"{stage:<22}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+                f"{stats['mean_ms']:>10.3f}{stats['throughput_per_s'] or 0:>12.0f}")
+        base = (baseline or {}).get('stages', {}).get(stage)
+        if base:
+            for key in ('p50_ms', 'p99_ms'):
+                change = (stats[key] - base[key]) / base[key] if base[key] else 0.0
+                line += f"{change:>+9.1%}"
+        print(line)
+    if report.get('build_seconds'):
+        print("\nBuild (giây): " + ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in report['build_seconds'].items()))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark đường tìm kiếm TF-IDF trên corpus dia_danh giả lập.")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help="Số dòng dia_danh giả lập (10k - 1M)")
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help="Số truy vấn đo")
+    parser.add_argument('--num-results', type=int, default=DEFAULT_NUM_RESULTS, help="Số kết quả mỗi truy vấn")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Seed sinh corpus và truy vấn")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Số tiến trình tách từ khi build")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Số dòng mỗi khối khi build")
+    parser.add_argument('--work-dir', default=None,
+                        help="Thư mục chứa corpus SQLite và model (mặc định: thư mục tạm theo rows/seed)")
+    parser.add_argument('--rebuild', action='store_true', help="Sinh lại corpus và build lại model dù đã có")
+    parser.add_argument('--output', help="Ghi kết quả ra file JSON")
+    parser.add_argument('--compare', help="File JSON của lần chạy trước để so sánh")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), 'datn_benchmark', f"{args.rows}_{args.seed}")
+    model_dir = os.path.join(work_dir, 'models')
+    db_path = os.path.join(work_dir, 'dia_danh.sqlite')
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Phải đặt trước khi import app: config đọc MODEL_DIR lúc import
+    os.environ['MODEL_DIR'] = model_dir
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    sys.path.append(project_root)
+
+    build_seconds = None
+    if args.rebuild or not os.path.exists(os.path.join(model_dir, 'tfidf_index', 'manifest.json')):
+        print(f"Sinh corpus {args.rows} dòng vào {db_path}...")
+        start = time.perf_counter()
+        generate_corpus(db_path, args.rows, args.seed)
+        build_seconds = {'generate_corpus': time.perf_counter() - start}
+        build_seconds.update(build_artifacts(db_path, model_dir, args.workers, args.chunk_size))
+    else:
+        print(f"Dùng lại corpus và model trong {work_dir} (thêm --rebuild để build lại).")
+
+    from app.core.config import DETAIL_QUERY_BATCH_SIZE
+    from app.search_logic.preprocessor import _tokenize
+    from app.search_logic.tfidf_engine import TFIDFEngine
+
+    engine = TFIDFEngine()
+    if not engine.is_ready():
+        print("TFIDFEngine chưa sẵn sàng, dừng benchmark.")
+        sys.exit(1)
+    fetcher = SQLiteDetailsFetcher(db_path, DETAIL_QUERY_BATCH_SIZE)
+
+    queries = generate_queries(args.queries, args.seed)
+    # Làm nóng (tải model underthesea, page cache của index) rồi xóa cache tách từ để đo từ đầu
+    run_queries(engine, fetcher, generate_queries(WARMUP_QUERIES, args.seed + 100), args.num_results)
+    _tokenize.cache_clear()
+
+    recorder = StageRecorder()
+    empty_results = run_queries(engine, fetcher, queries, args.num_results, recorder)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'corpus': {
+            'rows': engine.tfidf_matrix.shape[0],
+            'vocabulary_size': engine.query_vectorizer.vocabulary_size,
+            'nnz': int(engine.tfidf_matrix.nnz),
+            'seed': args.seed,
+            'artifact_source': engine.artifact_source,
+            'model_version': engine.model_version,
+        },
+        'queries': {
+            'count': len(queries),
+            'unique': len(set(queries)),
+            'num_results': args.num_results,
+            'empty_results': empty_results,
+        },
+        'build_seconds': build_seconds,
+        'stages': recorder.summary(),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi kết quả vào {args.output}")
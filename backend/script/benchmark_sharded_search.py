@@ -0,0 +1,133 @@
+# backend/script/benchmark_sharded_search.py
+# Đo tìm kiếm scatter-gather trên index chia shard so với tính điểm trong một tiến trình:
+# 1. Dùng lại corpus dia_danh giả lập và model của benchmark_search.py (sinh và build nếu chưa có).
+# 2. Với mỗi số shard N: chia index thành N shard, chạy ShardedSearcher với N tiến trình.
+# 3. Kiểm tra kết quả giống hệt tìm kiếm trên một index (cùng ID, cùng điểm, cùng thứ tự) và báo cáo
+#    độ trễ mỗi truy vấn (mean/p50/p95) và speedup so với một tiến trình.
+# Truy vấn được tách từ và vector hóa trước, nên chỉ đo phần tính điểm + chọn top-k (+ IPC khi chia shard).
+# Speedup chỉ gần tuyến tính khi máy có ít nhất N lõi và corpus đủ lớn để chi phí tính điểm lớn hơn IPC.
+#
+# Ví dụ (chạy từ thư mục backend/):
+#   python script/benchmark_sharded_search.py --rows 200000 --queries 500 --shards 1,2,4,8
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import benchmark_search
+
+DEFAULT_ROWS = 100000
+DEFAULT_QUERIES = 300
+DEFAULT_SHARDS = "1,2,4"
+WARMUP_QUERIES = 20
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tìm kiếm scatter-gather trên index chia shard.")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help="Số dòng dia_danh giả lập")
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES, help="Số truy vấn đo")
+    parser.add_argument('--shards', default=DEFAULT_SHARDS, help="Các số shard cần đo, cách nhau bởi dấu phẩy")
+    parser.add_argument('--num-results', type=int, default=benchmark_search.DEFAULT_NUM_RESULTS)
+    parser.add_argument('--seed', type=int, default=benchmark_search.DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Số tiến trình tách từ khi build")
+    parser.add_argument('--work-dir', default=None,
+                        help="Thư mục corpus/model (mặc định dùng chung với benchmark_search.py)")
+    return parser.parse_args(argv)
+
+
+def summarize(samples_ns: list) -> dict:
+    ms = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+    }
+
+
+def time_queries(search, vectors: list) -> tuple:
+    """Chạy search(indices, weights) cho mọi truy vấn; trả về (kết quả, thời gian từng truy vấn ns)."""
+    results, samples = [], []
+    for indices, weights in vectors:
+        start = time.perf_counter_ns()
+        results.append(search(indices, weights))
+        samples.append(time.perf_counter_ns() - start)
+    return results, samples
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    shard_counts = [int(value) for value in args.shards.split(',') if value.strip()]
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), 'datn_benchmark', f"{args.rows}_{args.seed}")
+    model_dir = os.path.join(work_dir, 'models')
+    db_path = os.path.join(work_dir, 'dia_danh.sqlite')
+    os.makedirs(work_dir, exist_ok=True)
+
+    # Phải đặt trước khi import app: config đọc MODEL_DIR lúc import
+    os.environ['MODEL_DIR'] = model_dir
+    os.environ['SEARCH_SHARD_PROCESSES'] = '0' # Engine tham chiếu luôn tính trong một tiến trình
+    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    sys.path.append(project_root)
+
+    if not os.path.exists(os.path.join(model_dir, 'tfidf_index', 'manifest.json')):
+        print(f"Sinh corpus {args.rows} dòng vào {db_path} và build model...")
+        benchmark_search.generate_corpus(db_path, args.rows, args.seed)
+        benchmark_search.build_artifacts(db_path, model_dir, args.workers, 500)
+
+    from app.search_logic import index_store
+    from app.search_logic.preprocessor import preprocess_query
+    from app.search_logic.sharded_index import ShardedSearcher, save_sharded_index
+    from app.search_logic.tfidf_engine import TFIDFEngine, _select_top_k
+
+    engine = TFIDFEngine()
+    if not engine.is_ready():
+        print("TFIDFEngine chưa sẵn sàng, dừng benchmark.")
+        sys.exit(1)
+    state = engine.snapshot()
+    k = args.num_results
+
+    print("Tách từ và vector hóa truy vấn...")
+    queries = benchmark_search.generate_queries(args.queries + WARMUP_QUERIES, args.seed)
+    vectors = [engine.query_vectorizer.transform(preprocess_query(query)['tokens_for_tfidf']) for query in queries]
+    warmup_vectors, vectors = vectors[:WARMUP_QUERIES], vectors[WARMUP_QUERIES:]
+
+    def search_single(indices, weights):
+        rows, scores = engine._score_query_vector(state, indices, weights)
+        positive = scores > 0
+        return _select_top_k(rows[positive], scores[positive], k)
+
+    time_queries(search_single, warmup_vectors)
+    expected, samples = time_queries(search_single, vectors)
+    baseline = summarize(samples)
+    print(f"\nCorpus: {state.num_base_rows} địa điểm, nnz {state.tfidf_matrix.nnz}, "
+          f"{len(vectors)} truy vấn, top-{k}, {os.cpu_count()} CPU")
+    print(f"{'cấu hình':<22}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>10}{'khác biệt':>11}")
+    print(f"{'1 tiến trình':<22}{baseline['mean_ms']:>10.3f}{baseline['p50_ms']:>10.3f}"
+          f"{baseline['p95_ms']:>10.3f}{1.0:>10.2f}{'-':>11}")
+
+    artifacts = index_store.load_index(os.path.join(model_dir, 'tfidf_index'), mmap=True)
+    vectorizer = index_store.build_vectorizer(artifacts['manifest'], artifacts['vocabulary'], artifacts['idf'])
+    for num_shards in shard_counts:
+        shards_dir = os.path.join(work_dir, f"tfidf_shards_{num_shards}")
+        save_sharded_index(shards_dir, vectorizer, artifacts['tfidf_matrix'], artifacts['location_ids'],
+                           num_shards, artifacts['manifest']['model_version'])
+        searcher = ShardedSearcher(shards_dir, num_shards)
+        searcher.warm_up()
+        try:
+            def search_sharded(indices, weights):
+                rows, scores, _ = searcher.search(indices, weights, k)
+                return rows, scores
+
+            time_queries(search_sharded, warmup_vectors)
+            actual, samples = time_queries(search_sharded, vectors)
+        finally:
+            searcher.close()
+        mismatches = sum(
+            1 for (expected_rows, expected_scores), (rows, scores) in zip(expected, actual)
+            if not (np.array_equal(expected_rows, rows) and np.array_equal(expected_scores, scores))
+        )
+        result = summarize(samples)
+        print(f"{f'{num_shards} shard x {num_shards} tiến trình':<22}{result['mean_ms']:>10.3f}{result['p50_ms']:>10.3f}"
+              f"{result['p95_ms']:>10.3f}{baseline['mean_ms'] / result['mean_ms']:>10.2f}{mismatches:>11}")
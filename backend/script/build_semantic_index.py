@@ -0,0 +1,63 @@
+# backend/script/build_semantic_index.py
+# Build index ngữ nghĩa (LSA + IVF) từ index TF-IDF memory-map hiện có, không cần kết nối database,
+# rồi đo recall@k của tìm kiếm IVF so với tìm kiếm chính xác trên cùng vector LSA với nhiều giá trị
+# n_probe (số cụm được duyệt), kèm thời gian mỗi truy vấn của hai cách.
+#   python script/build_semantic_index.py [--components 128] [--lists 0] [--k 10] [--output-dir ...]
+import sys
+import os
+import argparse
+import time
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import TFIDF_INDEX_DIR, SEMANTIC_INDEX_DIR, SEMANTIC_NPROBE
+from app.search_logic import index_store
+from app.search_logic.compact_matrix import to_scipy
+from app.search_logic.semantic_index import SemanticIndex, measure_recall, sample_query_vectors
+
+N_PROBE_SWEEP = (1, 2, 4, 8, 16, 32)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build index ngữ nghĩa LSA + IVF từ index TF-IDF hiện có.")
+    parser.add_argument('--output-dir', default=SEMANTIC_INDEX_DIR)
+    parser.add_argument('--components', type=int, default=128, help="Số chiều LSA")
+    parser.add_argument('--lists', type=int, default=0, help="Số cụm IVF (0 = ~sqrt(số địa điểm))")
+    parser.add_argument('--k', type=int, default=10, help="k của recall@k")
+    parser.add_argument('--queries', type=int, default=200, help="Số truy vấn mẫu để đo recall")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not index_store.index_exists(TFIDF_INDEX_DIR):
+        print(f"Không tìm thấy index TF-IDF tại {TFIDF_INDEX_DIR}. Hãy chạy build_tfidf_model.py "
+              "hoặc export_mmap_index.py trước.")
+        sys.exit(1)
+
+    artifacts = index_store.load_index(TFIDF_INDEX_DIR, mmap=True)
+    tfidf_matrix = to_scipy(artifacts['tfidf_matrix'])
+    print(f"Index TF-IDF: {tfidf_matrix.shape}, model_version={artifacts['manifest']['model_version']}")
+
+    start = time.perf_counter()
+    index = SemanticIndex.build(tfidf_matrix, artifacts['location_ids'],
+                                n_components=args.components, n_lists=args.lists or None)
+    print(f"Build: {index.dimensions} chiều (explained variance {index.manifest['explained_variance']}), "
+          f"{index.n_lists} cụm, {time.perf_counter() - start:.2f}s")
+
+    queries = sample_query_vectors(index, tfidf_matrix, num_queries=args.queries)
+    print(f"\nrecall@{args.k} trên {len(queries)} truy vấn mẫu (so với tìm kiếm chính xác):")
+    print(f"{'n_probe':>8}{'recall':>10}{'IVF ms':>10}{'exact ms':>10}")
+    recall = []
+    for n_probe in sorted(set(N_PROBE_SWEEP) | {SEMANTIC_NPROBE}):
+        if n_probe > index.n_lists:
+            continue
+        item = measure_recall(index, queries, args.k, n_probe)
+        recall.append(item)
+        marker = "  <- SEMANTIC_NPROBE" if n_probe == SEMANTIC_NPROBE else ""
+        print(f"{n_probe:>8}{item['recall']:>10.4f}{item['ivf_ms']:>10.3f}{item['exact_ms']:>10.3f}{marker}")
+
+    index.save(args.output_dir, artifacts['manifest']['model_version'], extra={'recall': recall})
+    print(f"\nĐã lưu index ngữ nghĩa vào {args.output_dir}")
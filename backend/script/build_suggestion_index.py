@@ -0,0 +1,88 @@
+# backend/script/build_suggestion_index.py
+# Build index gợi ý type-ahead từ index TF-IDF memory-map hiện có (từ vựng, số văn bản chứa term),
+# synonyms.json và tên địa điểm trong database, rồi đo độ trễ gợi ý trên các tiền tố mẫu (có dấu,
+# không dấu, gõ dở) và in vài ví dụ.
+#   python script/build_suggestion_index.py [--output-dir ...] [--prefixes 2000] [--k 8]
+import sys
+import os
+import argparse
+import time
+
+import numpy as np
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import TFIDF_INDEX_DIR, SUGGESTION_INDEX_DIR
+from app.core.database import db_pool
+from app.search_logic import index_store
+from app.search_logic.preprocessor import synonyms_dict
+from app.search_logic.suggestion_index import SuggestionIndex, document_frequency
+from app.search_logic.utils import strip_accents
+
+EXAMPLES = ("b", "bai b", "bãi biể", "phuot", "chùa", "ha lo", "nui cao y")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build index gợi ý type-ahead từ index TF-IDF hiện có.")
+    parser.add_argument('--output-dir', default=SUGGESTION_INDEX_DIR)
+    parser.add_argument('--prefixes', type=int, default=2000, help="Số tiền tố mẫu để đo độ trễ")
+    parser.add_argument('--k', type=int, default=8, help="Số gợi ý mỗi tiền tố")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def fetch_location_names() -> list:
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id_dia_diem, ten FROM dia_danh WHERE ten IS NOT NULL AND ten != ''")
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+def sample_prefixes(index: SuggestionIndex, num_prefixes: int, seed: int) -> list:
+    """Tiền tố 1-6 ký tự của các mục ngẫu nhiên, một nửa được bỏ dấu."""
+    rng = np.random.default_rng(seed)
+    prefixes = []
+    for i in range(num_prefixes):
+        text = str(index.texts[int(rng.integers(index.size))]).lower()
+        prefix = text[:int(rng.integers(1, 7))]
+        prefixes.append(strip_accents(prefix) if i % 2 else prefix)
+    return prefixes
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not index_store.index_exists(TFIDF_INDEX_DIR):
+        print(f"Không tìm thấy index TF-IDF tại {TFIDF_INDEX_DIR}. Hãy chạy build_tfidf_model.py trước.")
+        sys.exit(1)
+
+    artifacts = index_store.load_index(TFIDF_INDEX_DIR, mmap=True)
+    location_names = fetch_location_names()
+    start = time.perf_counter()
+    index = SuggestionIndex.build(artifacts['vocabulary'], document_frequency(artifacts['postings']),
+                                  synonyms_dict, location_names)
+    manifest = index.save(args.output_dir, artifacts['manifest']['model_version'])
+    print(f"Build: {manifest['entries']}, {manifest['keys']} khóa, {time.perf_counter() - start:.2f}s "
+          f"-> {args.output_dir}")
+
+    index = SuggestionIndex.load(args.output_dir)
+    prefixes = sample_prefixes(index, args.prefixes, args.seed)
+    for prefix in prefixes[:50]:
+        index.suggest(prefix, args.k)
+    samples = []
+    for prefix in prefixes:
+        started = time.perf_counter_ns()
+        index.suggest(prefix, args.k)
+        samples.append(time.perf_counter_ns() - started)
+    us = np.asarray(samples, dtype=np.float64) / 1e3
+    print(f"\nĐộ trễ gợi ý top-{args.k} trên {len(prefixes)} tiền tố: mean {us.mean():.1f} µs, "
+          f"p50 {np.percentile(us, 50):.1f} µs, p99 {np.percentile(us, 99):.1f} µs, max {us.max():.1f} µs")
+
+    print("\nVí dụ:")
+    for prefix in EXAMPLES:
+        texts = [f"{item['text']} ({item['kind']})" for item in index.suggest(prefix, 5)]
+        print(f"  '{prefix}': {', '.join(texts) or '-'}")
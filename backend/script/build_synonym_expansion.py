@@ -0,0 +1,105 @@
+# backend/script/build_synonym_expansion.py
+# Biên dịch synonyms.json theo từ vựng của index TF-IDF memory-map hiện có thành ma trận mở rộng từ đồng
+# nghĩa, rồi trên các truy vấn mẫu: so vector mở rộng với trọng số 1 với cách cũ (thêm từ đồng nghĩa vào
+# chuỗi token, độ tương đồng cosine), in các term được mở rộng và đo thời gian vector hóa truy vấn.
+#   python script/build_synonym_expansion.py [--output-dir ...] [--weights 0.25 0.5 1] [--repeats 2000]
+import sys
+import os
+import argparse
+import time
+
+import numpy as np
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import TFIDF_INDEX_DIR, SYNONYM_EXPANSION_DIR
+from app.search_logic import index_store
+from app.search_logic.preprocessor import preprocess_query, synonyms_dict
+from app.search_logic.synonym_expansion import SynonymExpansion
+
+TEST_QUERIES = [
+    "tôi muốn đến một nơi có biển thật đẹp",
+    "bãi biển yên tĩnh",
+    "khách sạn sang trọng gần thành phố",
+    "địa điểm có lịch sử và văn hóa",
+    "chỗ nào view đẹp để check-in",
+    "đi phượt núi rừng",
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build ma trận mở rộng từ đồng nghĩa từ index TF-IDF hiện có.")
+    parser.add_argument('--output-dir', default=SYNONYM_EXPANSION_DIR)
+    parser.add_argument('--weights', type=float, nargs='+', default=[0.25, 0.5, 1.0],
+                        help="Trọng số từ đồng nghĩa để so sánh")
+    parser.add_argument('--repeats', type=int, default=2000, help="Số lần lặp khi đo thời gian")
+    return parser.parse_args(argv)
+
+
+def expanded_vector(query_vectorizer, expansion: SynonymExpansion, text: str, weight: float):
+    indices, counts = query_vectorizer.term_counts(text, expansion.extra_vocabulary)
+    indices, counts = expansion.expand(indices, counts, weight)
+    if not indices.size:
+        return indices, counts
+    return indices, query_vectorizer.weight_counts(indices, counts)
+
+
+def cosine(a, b) -> float:
+    common, a_positions, b_positions = np.intersect1d(a[0], b[0], return_indices=True)
+    return float(a[1][a_positions] @ b[1][b_positions]) if common.size else 0.0
+
+
+def time_us(function, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not index_store.index_exists(TFIDF_INDEX_DIR):
+        print(f"Không tìm thấy index TF-IDF tại {TFIDF_INDEX_DIR}. Hãy chạy build_tfidf_model.py trước.")
+        sys.exit(1)
+
+    artifacts = index_store.load_index(TFIDF_INDEX_DIR, mmap=True)
+    vocabulary = artifacts['vocabulary']
+    start = time.perf_counter()
+    manifest = SynonymExpansion.build(vocabulary, synonyms_dict).save(
+        args.output_dir, artifacts['manifest']['model_version']
+    )
+    print(f"Build: {manifest['keys']} khóa -> {manifest['sources']} nguồn ({manifest['extra_sources']} khóa ngoài "
+          f"từ vựng), {manifest['entries']} phần tử, {time.perf_counter() - start:.3f}s -> {args.output_dir}")
+    if manifest['skipped_keys']:
+        print(f"Khóa không có từ đồng nghĩa nào trong từ vựng: {', '.join(manifest['skipped_keys'])}")
+
+    expansion = SynonymExpansion.load(args.output_dir)
+    query_vectorizer = index_store.build_query_vectorizer(artifacts['manifest'], vocabulary, artifacts['idf'])
+    terms = {column: term for term, column in vocabulary.items()}
+    for query in TEST_QUERIES:
+        processed = preprocess_query(query)
+        original = query_vectorizer.transform(processed['query_tokens'])
+        legacy = query_vectorizer.transform(processed['tokens_for_tfidf'])
+        vectors = {weight: expanded_vector(query_vectorizer, expansion, processed['query_tokens'], weight)
+                   for weight in args.weights}
+        print(f"\n'{query}'")
+        print(f"  token: {processed['query_tokens']}")
+        print(f"  cosine với cách cũ: " + ", ".join(
+            f"w={weight}: {cosine(vector, legacy):.4f}" for weight, vector in vectors.items()
+        ))
+        indices, weights = vectors[args.weights[len(args.weights) // 2]]
+        added = [(terms[column], weight) for column, weight in zip(indices.tolist(), weights.tolist())
+                 if column not in set(original[0].tolist())]
+        print(f"  term mở rộng (w={args.weights[len(args.weights) // 2]}): "
+              + (", ".join(f"{term} {weight:.3f}" for term, weight in sorted(added, key=lambda item: -item[1])) or "-"))
+
+    processed = [preprocess_query(query) for query in TEST_QUERIES]
+    legacy_us = time_us(lambda: [query_vectorizer.transform(p['tokens_for_tfidf']) for p in processed], args.repeats)
+    plain_us = time_us(lambda: [query_vectorizer.transform(p['query_tokens']) for p in processed], args.repeats)
+    expanded_us = time_us(lambda: [expanded_vector(query_vectorizer, expansion, p['query_tokens'], 0.5)
+                                   for p in processed], args.repeats)
+    n = len(processed)
+    print(f"\nThời gian vector hóa mỗi truy vấn: chuỗi đã thêm từ đồng nghĩa {legacy_us / n:.1f} µs, "
+          f"token gốc {plain_us / n:.1f} µs, token gốc + ma trận mở rộng {expanded_us / n:.1f} µs")
@@ -0,0 +1,115 @@
+# backend/script/build_term_resolver.py
+# Build index phân giải term từ index TF-IDF memory-map hiện có, rồi đo độ chính xác và độ trễ phân giải
+# trên các biến thể sinh từ term của từ vựng: bỏ dấu, và bỏ dấu + một lỗi gõ (xóa/thêm/thay/đảo ký tự).
+# Biến thể được tính là đúng khi phân giải về term gốc hoặc một term cùng dạng bỏ dấu / cùng khoảng cách.
+#   python script/build_term_resolver.py [--output-dir ...] [--samples 2000]
+import sys
+import os
+import argparse
+import time
+
+import numpy as np
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import TFIDF_INDEX_DIR, TERM_RESOLVER_DIR
+from app.search_logic import index_store
+from app.search_logic.suggestion_index import document_frequency
+from app.search_logic.term_resolver import TermResolver, FUZZY_MIN_LENGTH, edit_distance
+from app.search_logic.utils import strip_accents
+
+EXAMPLES = ("bai_bien", "bai bien", "da nang", "yen_tinh", "kien_truc", "kien truc co", "bian", "chuaa")
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build index phân giải term từ index TF-IDF hiện có.")
+    parser.add_argument('--output-dir', default=TERM_RESOLVER_DIR)
+    parser.add_argument('--samples', type=int, default=2000, help="Số term mẫu cho mỗi loại biến thể")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def make_typo(word: str, rng) -> str:
+    """Một lỗi gõ ngẫu nhiên (không rơi vào dấu '_' của từ ghép)."""
+    position = int(rng.integers(len(word)))
+    while word[position] == '_':
+        position = int(rng.integers(len(word)))
+    letter = ALPHABET[int(rng.integers(len(ALPHABET)))]
+    kind = int(rng.integers(4))
+    if kind == 0:
+        return word[:position] + word[position + 1:]
+    if kind == 1:
+        return word[:position] + letter + word[position:]
+    if kind == 2:
+        return word[:position] + letter + word[position + 1:]
+    if position + 1 < len(word) and word[position + 1] != '_':
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:position] + letter + word[position:]
+
+
+def sample_variants(resolver: TermResolver, vocabulary: dict, num_samples: int, seed: int) -> dict:
+    """{loại: [(biến thể, term gốc)]} chỉ gồm biến thể không có trong từ vựng."""
+    rng = np.random.default_rng(seed)
+    terms = [str(term) for term in resolver.terms if len(strip_accents(str(term))) >= FUZZY_MIN_LENGTH]
+    variants = {'accent': [], 'typo': []}
+    for term in (terms[int(i)] for i in rng.permutation(len(terms))):
+        plain = strip_accents(term)
+        if plain not in vocabulary and len(variants['accent']) < num_samples:
+            variants['accent'].append((plain, term))
+        typo = make_typo(plain, rng)
+        if typo not in vocabulary and len(variants['typo']) < num_samples:
+            variants['typo'].append((typo, term))
+        if min(len(samples) for samples in variants.values()) >= num_samples:
+            break
+    return variants
+
+
+def is_acceptable(variant: str, expected: str, resolved: str) -> bool:
+    """Đúng term gốc, hoặc một term khác gần biến thể không kém term gốc (không thể phân biệt được)."""
+    if resolved is None:
+        return False
+    if resolved == expected:
+        return True
+    limit = edit_distance(variant, strip_accents(expected), 2)
+    return edit_distance(variant, strip_accents(resolved), 2) <= limit
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not index_store.index_exists(TFIDF_INDEX_DIR):
+        print(f"Không tìm thấy index TF-IDF tại {TFIDF_INDEX_DIR}. Hãy chạy build_tfidf_model.py trước.")
+        sys.exit(1)
+
+    artifacts = index_store.load_index(TFIDF_INDEX_DIR, mmap=True)
+    vocabulary = artifacts['vocabulary']
+    start = time.perf_counter()
+    resolver = TermResolver.build(vocabulary, document_frequency(artifacts['postings']))
+    manifest = resolver.save(args.output_dir, artifacts['manifest']['model_version'])
+    size_mb = sum(os.path.getsize(os.path.join(args.output_dir, info['file']))
+                  for info in manifest['files'].values()) / 2**20
+    print(f"Build: {manifest['vocabulary_size']} term, {manifest['deletion_keys']} khóa xóa ký tự, "
+          f"{size_mb:.1f} MB, {time.perf_counter() - start:.2f}s -> {args.output_dir}")
+
+    resolver = TermResolver.load(args.output_dir, mmap=True)
+    for kind, samples in sample_variants(resolver, vocabulary, args.samples, args.seed).items():
+        exact = acceptable = 0
+        latencies = []
+        for variant, expected in samples:
+            started = time.perf_counter_ns()
+            term, _ = resolver.resolve(variant) # lần đầu, chưa có trong cache
+            latencies.append(time.perf_counter_ns() - started)
+            exact += term == expected
+            acceptable += is_acceptable(variant, expected, term)
+        us = np.asarray(latencies, dtype=np.float64) / 1e3
+        print(f"\n{kind}: {len(samples)} biến thể, đúng term gốc {exact / len(samples):.1%}, "
+              f"chấp nhận được {acceptable / len(samples):.1%}")
+        print(f"  độ trễ: mean {us.mean():.1f} µs, p50 {np.percentile(us, 50):.1f} µs, "
+              f"p99 {np.percentile(us, 99):.1f} µs")
+
+    print("\nVí dụ:")
+    for text in EXAMPLES:
+        tokens = text.split()
+        print(f"  '{text}' -> {' '.join(resolver.resolve_tokens(tokens, vocabulary))}")
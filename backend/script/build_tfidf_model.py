@@ -1,29 +1,56 @@
 import mysql.connector
-import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from underthesea import word_tokenize
 import joblib # Hoặc dùng pickle
+import numpy as np
+import argparse
 import os
+import sys
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+# Thêm thư mục `backend` vào PYTHONPATH để dùng chung cấu hình và định dạng index với `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import DB_CONFIG, MODEL_DIR, SEMANTIC_NPROBE
+from app.search_logic.compact_matrix import STORAGE_TYPES
+from app.search_logic.index_store import save_index
+from app.search_logic.semantic_index import SemanticIndex, measure_recall, sample_query_vectors
+from app.search_logic.sharded_index import save_sharded_index
+from app.search_logic.suggestion_index import SuggestionIndex
+from app.search_logic.synonym_expansion import SynonymExpansion
+from app.search_logic.term_resolver import TermResolver
+from app.search_logic.preprocessor import preprocess_document, synonyms_dict
 
 # --- Cấu hình ---
-# !!! QUAN TRỌNG: Thay đổi thông tin kết nối DB cho phù hợp
-# !!! KHÔNG nên hardcode trực tiếp trong code production, dùng biến môi trường!
-db_config = {
-    'host': 'localhost',
-    'user': 'root', # Thay username
-    'password': '11082002', # Thay password
-    'database': 'datn' # Thay tên database nếu khác
-}
+# Thông tin kết nối DB lấy từ app.core.config (biến môi trường DB_HOST, DB_USER, DB_PASSWORD, DB_NAME...)
 
 # Cột chứa mô tả để huấn luyện TF-IDF ('mo_ta_chi_tiet' hoặc 'mo_ta')
 DESCRIPTION_COLUMN = 'mo_ta_chi_tiet'
 
-# Thư mục lưu trữ model và vectorizer
-OUTPUT_DIR = 'C:/Users/datsa/OneDrive/Desktop/NewDATN/backend/data/models' 
-VECTORIZER_PATH = os.path.join(OUTPUT_DIR, 'tfidf_vectorizer.pkl')
-MATRIX_PATH = os.path.join(OUTPUT_DIR, 'tfidf_matrix.pkl')
-IDS_PATH = os.path.join(OUTPUT_DIR, 'location_ids.pkl')
+# Thư mục lưu trữ model và vectorizer mặc định (đổi bằng --output-dir hoặc biến môi trường MODEL_DIR)
+OUTPUT_DIR = os.getenv('MODEL_DIR', MODEL_DIR)
+VECTORIZER_FILENAME = 'tfidf_vectorizer.pkl'
+MATRIX_FILENAME = 'tfidf_matrix.pkl'
+IDS_FILENAME = 'location_ids.pkl'
+# Index dạng memory-map (không dùng pickle) cho TFIDFEngine, các file .pkl vẫn được giữ làm dự phòng
+INDEX_DIRNAME = 'tfidf_index'
+# Index ngữ nghĩa LSA + IVF (tùy chọn, --semantic), build từ ma trận TF-IDF ở trên
+SEMANTIC_INDEX_DIRNAME = 'semantic_index'
+# Index chia shard (tùy chọn, --shards N) cho tìm kiếm scatter-gather nhiều tiến trình
+SHARDS_DIRNAME = 'tfidf_shards'
+# Index gợi ý type-ahead (từ vựng, khóa đồng nghĩa, tên địa điểm)
+SUGGESTION_INDEX_DIRNAME = 'suggestion_index'
+# Index phân giải token ngoài từ vựng của truy vấn (bỏ dấu, xóa ký tự)
+TERM_RESOLVER_DIRNAME = 'term_resolver'
+# Ma trận mở rộng từ đồng nghĩa (synonyms.json biên dịch theo từ vựng)
+SYNONYM_EXPANSION_DIRNAME = 'synonym_expansion'
+RECALL_K = 10
+
+# Số dòng đọc từ database mỗi lần và giao cho một tiến trình tách từ
+DEFAULT_CHUNK_SIZE = 200
 
 # Cấu hình TfidfVectorizer (Tùy chọn - có thể điều chỉnh)
 tfidf_params = {
@@ -35,107 +62,290 @@ tfidf_params = {
 
 # --- Hàm xử lý ---
 
+class StageTimings:
+    """Ghi lại thời gian của từng bước build để báo cáo."""
+
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def report(self):
+        print("\nStage timings:")
+        for stage, seconds in self.seconds.items():
+            print(f"  - {stage:<28} {seconds:8.2f} s")
+
+
 def connect_db():
     """Kết nối tới cơ sở dữ liệu MySQL."""
     print("Connecting to database...")
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = mysql.connector.connect(**DB_CONFIG)
         print("Connection successful!")
         return conn
     except mysql.connector.Error as err:
         print(f"Error connecting to database: {err}")
         return None
 
-def fetch_data(conn):
-    """Lấy dữ liệu id_dia_diem và mô tả từ database."""
-    if not conn:
-        return None
-    print(f"Fetching data (id_dia_diem, {DESCRIPTION_COLUMN}) from dia_danh table...")
+def stream_rows(conn, chunk_size, timings):
+    """
+    Đọc (id_dia_diem, mô tả) từ dia_danh theo từng khối chunk_size dòng bằng cursor không buffer
+    (server gửi dần kết quả), không tải cả bảng vào bộ nhớ. Yield (list id, list mô tả).
+    """
+    print(f"Streaming data (id_dia_diem, {DESCRIPTION_COLUMN}) from dia_danh table...")
+    cursor = conn.cursor(buffered=False)
     try:
-        query = f"""
+        cursor.execute(f"""
             SELECT id_dia_diem, {DESCRIPTION_COLUMN}
             FROM dia_danh
             WHERE {DESCRIPTION_COLUMN} IS NOT NULL AND {DESCRIPTION_COLUMN} != ''
-        """
-        df = pd.read_sql(query, conn)
-        print(f"Fetched {len(df)} records.")
-        return df
-    except Exception as e:
-        print(f"Error fetching data: {e}")
-        return None
+        """)
+        while True:
+            start = time.perf_counter()
+            rows = cursor.fetchmany(chunk_size)
+            timings.add('fetch', time.perf_counter() - start)
+            if not rows:
+                break
+            yield [row[0] for row in rows], [row[1] for row in rows]
     finally:
-        if conn.is_connected():
-            conn.close()
-            print("Database connection closed.")
+        cursor.close()
+
+def fetch_location_names(conn):
+    """(id_dia_diem, ten) của mọi địa điểm có tên, cho index gợi ý."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id_dia_diem, ten FROM dia_danh WHERE ten IS NOT NULL AND ten != ''")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
 
 def preprocess_text(text):
-    """Tiền xử lý văn bản: lowercase và tách từ tiếng Việt."""
-    if pd.isna(text):
-        return ""
-    text = str(text).lower()
-    # Có thể thêm các bước làm sạch khác ở đây (xóa HTML, dấu câu đặc biệt...)
-    tokenized_text = word_tokenize(text, format="text")
-    return tokenized_text
+    """
+    Tiền xử lý văn bản: chuẩn hóa Unicode, lowercase và tách từ tiếng Việt.
+    Dùng chung preprocess_document với TFIDFEngine.upsert_location để vector của địa điểm
+    cập nhật lẻ giống hệt lúc build.
+    """
+    # Có thể thêm các bước làm sạch khác trong preprocess_document (xóa HTML, dấu câu đặc biệt...)
+    return preprocess_document(text)
 
-# --- Luồng chính ---
-if __name__ == "__main__":
-    start_time = time.time()
+def tokenize_chunk(texts):
+    """Tách từ một khối mô tả (chạy trong tiến trình con)."""
+    return [preprocess_text(text) for text in texts]
 
-    # 1. Kết nối và lấy dữ liệu
-    connection = connect_db()
-    data_df = fetch_data(connection)
+def tokenize_stream(chunks, workers, timings):
+    """
+    Tách từ các khối (ids, texts) song song trên workers tiến trình và yield (id, văn bản đã tách từ)
+    theo đúng thứ tự ban đầu. Chỉ giữ tối đa 2 * workers khối đang xử lý để bộ nhớ không tăng theo
+    kích thước bảng.
+    """
+    if workers <= 1:
+        for ids, texts in chunks:
+            with timings.measure('tokenize'):
+                tokenized = tokenize_chunk(texts)
+            yield from zip(ids, tokenized)
+        return
 
-    if data_df is None or data_df.empty:
-        print("No data fetched. Exiting.")
-        exit()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        window = deque()
+        for ids, texts in chunks:
+            window.append((ids, executor.submit(tokenize_chunk, texts)))
+            if len(window) >= 2 * workers:
+                ids, future = window.popleft()
+                with timings.measure('tokenize (wait)'):
+                    tokenized = future.result()
+                yield from zip(ids, tokenized)
+        while window:
+            ids, future = window.popleft()
+            with timings.measure('tokenize (wait)'):
+                tokenized = future.result()
+            yield from zip(ids, tokenized)
 
-    # 2. Tiền xử lý mô tả
-    print("Preprocessing descriptions...")
-    # Đảm bảo cột mô tả là kiểu string
-    data_df[DESCRIPTION_COLUMN] = data_df[DESCRIPTION_COLUMN].astype(str)
-    # Áp dụng tiền xử lý
-    data_df['processed_description'] = data_df[DESCRIPTION_COLUMN].apply(preprocess_text)
-    print("Preprocessing completed.")
+def build_model(documents, timings):
+    """
+    Fit TfidfVectorizer và tạo ma trận TF-IDF trong một lượt duyệt documents
+    (iterable các cặp (id, văn bản đã tách từ)). Trả về (vectorizer, tfidf_matrix, location_ids).
+    """
+    location_ids = []
 
-    # Chuẩn bị dữ liệu cho TF-IDF
-    descriptions = data_df['processed_description'].tolist()
-    location_ids = data_df['id_dia_diem'].tolist()
+    def texts():
+        for location_id, text in documents:
+            location_ids.append(location_id)
+            yield text
 
-    # 3. Huấn luyện TF-IDF Vectorizer
     print("Training TF-IDF Vectorizer...")
     vectorizer = TfidfVectorizer(**tfidf_params)
-    vectorizer.fit(descriptions)
+    start = time.perf_counter()
+    tfidf_matrix = vectorizer.fit_transform(texts())
+    # Thời gian fit_transform gồm cả thời gian chờ đọc DB/tách từ; phần còn lại là vector hóa
+    waited = sum(seconds for stage, seconds in timings.seconds.items()
+                 if stage in ('fetch', 'tokenize', 'tokenize (wait)'))
+    timings.add('vectorize (fit_transform)', time.perf_counter() - start - waited)
     print("Training completed.")
     print(f"Vocabulary size: {len(vectorizer.vocabulary_)}")
-
-    # 4. Transform dữ liệu thành ma trận TF-IDF
-    print("Transforming descriptions to TF-IDF matrix...")
-    tfidf_matrix = vectorizer.transform(descriptions)
-    print("Transformation completed.")
     print(f"TF-IDF matrix shape: {tfidf_matrix.shape}") # (số địa điểm, số từ vựng)
+    return vectorizer, tfidf_matrix, location_ids
 
-    # 5. Lưu kết quả
-    print(f"Saving artifacts to {OUTPUT_DIR}...")
-    try:
+def save_artifacts(output_dir, vectorizer, tfidf_matrix, location_ids, timings, storage='float64'):
+    """
+    Lưu vectorizer, ma trận, danh sách ID (.pkl) và index memory-map vào output_dir.
+    storage: dạng lưu trọng số của index memory-map ('float64', 'float32', 'int8'); các file .pkl luôn là float64.
+    """
+    print(f"Saving artifacts to {output_dir}...")
+    with timings.measure('save'):
         # Tạo thư mục nếu chưa tồn tại
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
 
         # Lưu Vectorizer
-        joblib.dump(vectorizer, VECTORIZER_PATH)
-        print(f"Vectorizer saved to {VECTORIZER_PATH}")
+        vectorizer_path = os.path.join(output_dir, VECTORIZER_FILENAME)
+        joblib.dump(vectorizer, vectorizer_path)
+        print(f"Vectorizer saved to {vectorizer_path}")
 
         # Lưu Ma trận TF-IDF (dạng sparse)
-        joblib.dump(tfidf_matrix, MATRIX_PATH)
-        print(f"TF-IDF matrix saved to {MATRIX_PATH}")
+        matrix_path = os.path.join(output_dir, MATRIX_FILENAME)
+        joblib.dump(tfidf_matrix, matrix_path)
+        print(f"TF-IDF matrix saved to {matrix_path}")
 
         # Lưu danh sách ID địa điểm (để biết hàng nào trong ma trận ứng với ID nào)
-        joblib.dump(location_ids, IDS_PATH)
-        print(f"Location IDs saved to {IDS_PATH}")
+        ids_path = os.path.join(output_dir, IDS_FILENAME)
+        joblib.dump(location_ids, ids_path)
+        print(f"Location IDs saved to {ids_path}")
 
-        print("Artifacts saved successfully.")
+        # Lưu index dạng memory-map
+        index_dir = os.path.join(output_dir, INDEX_DIRNAME)
+        manifest = save_index(index_dir, vectorizer, tfidf_matrix, location_ids, storage)
+        print(f"Memory-mapped index (version {manifest['model_version']}, storage {storage}) saved to {index_dir}")
+    return manifest
+
+def save_shards(output_dir, vectorizer, tfidf_matrix, location_ids, num_shards, tfidf_model_version, timings,
+                storage='float64'):
+    """Chia ma trận TF-IDF thành num_shards index memory-map (dùng khi SEARCH_SHARD_PROCESSES > 0)."""
+    with timings.measure('shards'):
+        shards_dir = os.path.join(output_dir, SHARDS_DIRNAME)
+        manifest = save_sharded_index(shards_dir, vectorizer, tfidf_matrix, location_ids, num_shards,
+                                      tfidf_model_version, storage)
+    sizes = ", ".join(f"{shard['rows']} rows/{shard['nnz']} nnz" for shard in manifest['shards'])
+    print(f"Sharded index ({manifest['num_shards']} shards: {sizes}) saved to {shards_dir}")
+
+def save_semantic_index(output_dir, tfidf_matrix, location_ids, tfidf_model_version, n_components, n_lists, timings):
+    """Build index ngữ nghĩa (LSA + IVF), đo recall@RECALL_K so với tìm kiếm chính xác rồi lưu."""
+    print(f"Building semantic index ({n_components} LSA components)...")
+    with timings.measure('semantic'):
+        index = SemanticIndex.build(tfidf_matrix, location_ids, n_components=n_components, n_lists=n_lists or None)
+        queries = sample_query_vectors(index, tfidf_matrix)
+        recall = [measure_recall(index, queries, RECALL_K, n_probe)
+                  for n_probe in sorted({1, SEMANTIC_NPROBE // 2 or 1, SEMANTIC_NPROBE, SEMANTIC_NPROBE * 2})]
+        for item in recall:
+            print(f"  n_probe={item['n_probe']:>3}: recall@{RECALL_K} {item['recall']}, "
+                  f"IVF {item['ivf_ms']} ms, exact {item['exact_ms']} ms")
+        semantic_dir = os.path.join(output_dir, SEMANTIC_INDEX_DIRNAME)
+        index.save(semantic_dir, tfidf_model_version, extra={'recall': recall})
+    print(f"Semantic index ({index.dimensions} dims, {index.n_lists} lists) saved to {semantic_dir}")
+
+def save_suggestion_index(output_dir, vectorizer, tfidf_matrix, location_names, tfidf_model_version, timings):
+    """Build index gợi ý type-ahead từ từ vựng (trọng số theo số văn bản chứa term), synonyms.json và tên địa điểm."""
+    with timings.measure('suggestions'):
+        document_frequency = np.bincount(tfidf_matrix.indices, minlength=tfidf_matrix.shape[1])
+        index = SuggestionIndex.build(vectorizer.vocabulary_, document_frequency, synonyms_dict, location_names)
+        suggestion_dir = os.path.join(output_dir, SUGGESTION_INDEX_DIRNAME)
+        manifest = index.save(suggestion_dir, tfidf_model_version)
+    print(f"Suggestion index ({manifest['entries']}, {manifest['keys']} keys) saved to {suggestion_dir}")
+
+def save_term_resolver(output_dir, vectorizer, tfidf_matrix, tfidf_model_version, timings):
+    """Build index phân giải term (khóa bỏ dấu + xóa ký tự) từ từ vựng, ưu tiên term có nhiều văn bản chứa."""
+    with timings.measure('term_resolver'):
+        document_frequency = np.bincount(tfidf_matrix.indices, minlength=tfidf_matrix.shape[1])
+        resolver = TermResolver.build(vectorizer.vocabulary_, document_frequency)
+        resolver_dir = os.path.join(output_dir, TERM_RESOLVER_DIRNAME)
+        manifest = resolver.save(resolver_dir, tfidf_model_version)
+    print(f"Term resolver ({manifest['deletion_keys']} deletion keys) saved to {resolver_dir}")
+
+def save_synonym_expansion(output_dir, vectorizer, tfidf_model_version, timings):
+    """Biên dịch synonyms.json theo từ vựng vừa fit thành ma trận mở rộng từ đồng nghĩa."""
+    with timings.measure('synonyms'):
+        expansion = SynonymExpansion.build(vectorizer.vocabulary_, synonyms_dict)
+        expansion_dir = os.path.join(output_dir, SYNONYM_EXPANSION_DIRNAME)
+        manifest = expansion.save(expansion_dir, tfidf_model_version)
+    print(f"Synonym expansion ({manifest['sources']} sources, {manifest['entries']} entries) saved to {expansion_dir}")
+    if manifest['skipped_keys']:
+        print(f"  Keys without any synonym in the vocabulary: {', '.join(manifest['skipped_keys'])}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build TF-IDF model artifacts from the dia_danh table.")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR,
+                        help="Thư mục lưu model (mặc định: biến môi trường MODEL_DIR hoặc backend/data/models)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Số tiến trình tách từ (1 = không dùng process pool)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Số dòng mỗi lần đọc từ database / giao cho một tiến trình")
+    parser.add_argument('--storage', choices=STORAGE_TYPES, default='float64',
+                        help="Dạng lưu trọng số của index memory-map: float64, float32 hoặc int8 (lượng tử hóa "
+                             "theo dòng); kiểm tra sai số bằng script/verify_compact_index.py")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="Chia thêm index thành N shard cho tìm kiếm scatter-gather (0 = không chia)")
+    parser.add_argument('--semantic', action='store_true',
+                        help="Build thêm index ngữ nghĩa LSA + IVF (cho tìm kiếm mode=semantic)")
+    parser.add_argument('--lsa-components', type=int, default=128,
+                        help="Số chiều LSA của index ngữ nghĩa")
+    parser.add_argument('--ivf-lists', type=int, default=0,
+                        help="Số cụm IVF của index ngữ nghĩa (0 = tự chọn ~sqrt(số địa điểm))")
+    return parser.parse_args(argv)
+
+# --- Luồng chính ---
+if __name__ == "__main__":
+    args = parse_args()
+    start_time = time.time()
+    timings = StageTimings()
+
+    # 1. Kết nối database
+    with timings.measure('connect'):
+        connection = connect_db()
+    if connection is None:
+        print("No database connection. Exiting.")
+        sys.exit(1)
+
+    try:
+        # 2-4. Đọc dữ liệu theo khối, tách từ song song và huấn luyện TF-IDF trong một lượt
+        print(f"Tokenizing with {args.workers} worker(s), chunk size {args.chunk_size}...")
+        documents = tokenize_stream(stream_rows(connection, args.chunk_size, timings), args.workers, timings)
+        vectorizer, tfidf_matrix, location_ids = build_model(documents, timings)
+        with timings.measure('fetch'):
+            location_names = fetch_location_names(connection)
+    finally:
+        if connection.is_connected():
+            connection.close()
+            print("Database connection closed.")
 
+    if not location_ids:
+        print("No data fetched. Exiting.")
+        sys.exit(1)
+    print(f"Processed {len(location_ids)} records.")
+
+    # 5. Lưu kết quả
+    try:
+        manifest = save_artifacts(args.output_dir, vectorizer, tfidf_matrix, location_ids, timings, args.storage)
+        print("Artifacts saved successfully.")
+        save_suggestion_index(args.output_dir, vectorizer, tfidf_matrix, location_names,
+                              manifest['model_version'], timings)
+        save_term_resolver(args.output_dir, vectorizer, tfidf_matrix, manifest['model_version'], timings)
+        save_synonym_expansion(args.output_dir, vectorizer, manifest['model_version'], timings)
+        if args.shards > 0:
+            save_shards(args.output_dir, vectorizer, tfidf_matrix, location_ids, args.shards,
+                        manifest['model_version'], timings, args.storage)
+        if args.semantic:
+            save_semantic_index(args.output_dir, tfidf_matrix, location_ids, manifest['model_version'],
+                                args.lsa_components, args.ivf_lists, timings)
     except Exception as e:
         print(f"Error saving artifacts: {e}")
 
+    timings.report()
     end_time = time.time()
-    print(f"\nTotal execution time: {end_time - start_time:.2f} seconds")
\ No newline at end of file
+    print(f"\nTotal execution time: {end_time - start_time:.2f} seconds")
@@ -0,0 +1,32 @@
+# backend/script/export_mmap_index.py
+# Chuyển các file .pkl hiện có (vectorizer, ma trận TF-IDF, danh sách ID) sang index dạng
+# memory-map mà không cần chạy lại build_tfidf_model.py (không cần kết nối database).
+import sys
+import os
+import time
+
+import joblib
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import VECTORIZER_PATH, TFIDF_MATRIX_PATH, LOCATION_IDS_PATH, TFIDF_INDEX_DIR
+from app.search_logic.index_store import save_index, load_index
+
+if __name__ == "__main__":
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else TFIDF_INDEX_DIR
+
+    print("Loading .pkl artifacts...")
+    vectorizer = joblib.load(VECTORIZER_PATH)
+    tfidf_matrix = joblib.load(TFIDF_MATRIX_PATH)
+    location_ids = joblib.load(LOCATION_IDS_PATH)
+
+    manifest = save_index(output_dir, vectorizer, tfidf_matrix, location_ids)
+    print(f"Index saved to {output_dir}")
+    print(f"  - model_version: {manifest['model_version']}")
+    print(f"  - shape: {manifest['shape']}, nnz: {manifest['nnz']}")
+
+    start_time = time.perf_counter()
+    load_index(output_dir, mmap=True)
+    print(f"  - memory-mapped load time: {(time.perf_counter() - start_time) * 1000:.2f} ms")
@@ -0,0 +1,55 @@
+# backend/script/test_hybrid_ranker_equivalence.py
+# Kiểm tra HybridRanker.rank (dừng sớm) cho kết quả giống hệt cách tính toàn bộ rồi sắp xếp,
+# trên điểm TF-IDF thật của model và điểm tag ngẫu nhiên.
+import sys
+import os
+
+import numpy as np
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.search_logic.preprocessor import preprocess_query
+from app.search_logic.ranker import HybridRanker, ScoreSignal
+from app.search_logic.tfidf_engine import TFIDFEngine
+
+QUERIES = [
+    "tôi muốn đến một nơi có biển thật đẹp",
+    "chỗ nào để phượt mà lại vắng người",
+    "địa điểm có kiến trúc cổ",
+    "chùa linh thiêng trên núi",
+    "du lịch sinh thái miền tây",
+    "bảo tàng lịch sử",
+]
+
+if __name__ == "__main__":
+    engine = TFIDFEngine()
+    if not engine.is_ready():
+        print("TFIDFEngine chưa sẵn sàng, dừng kiểm tra.")
+        sys.exit(1)
+
+    rng = np.random.default_rng(0)
+    num_rows = len(engine.location_ids)
+    mismatches, total, scored, candidates = 0, 0, 0, 0
+    for query in QUERIES:
+        processed = preprocess_query(query)['tokens_for_tfidf']
+        tfidf = ScoreSignal('tfidf', *engine.score_candidates(processed))
+        for density in (0.01, 0.05, 0.2):
+            tag_rows = np.flatnonzero(rng.random(num_rows) < density)
+            # Điểm tag rời rạc (như tỉ lệ số tag khớp) để có nhiều trường hợp bằng điểm
+            tag = ScoreSignal('tag', tag_rows, rng.integers(1, 4, tag_rows.size) / 3)
+            for weights in ({'tfidf': 0.7, 'tag': 0.3}, {'tfidf': 0.5, 'tag': 0.5}, {'tfidf': 1.0, 'tag': 0.0}):
+                ranker = HybridRanker(weights, block_size=8)
+                for k in (1, 5, 10, 50):
+                    total += 1
+                    fast = ranker.rank([tfidf, tag], k)
+                    scored += ranker.last_stats['scored']
+                    candidates += len(np.union1d(tfidf._rows_by_row, tag._rows_by_row))
+                    if fast != ranker.rank_exhaustive([tfidf, tag], k):
+                        mismatches += 1
+                        print(f"Khác biệt: query='{query}', weights={weights}, k={k}")
+
+    print(f"\nĐã so sánh {total} trường hợp, khác biệt: {mismatches}")
+    print(f"Số ứng viên được tính đủ điểm: {scored} / {candidates} ({scored / max(1, candidates):.1%})")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,118 @@
+# backend/script/test_query_vectorizer_equivalence.py
+# So sánh QueryVectorizer.transform (không dùng sklearn) với TfidfVectorizer.transform của sklearn:
+# cùng các cột và trọng số giống hệt nhau (so từng bit) trên các truy vấn cố định, truy vấn ngẫu nhiên
+# từ từ vựng (có lặp token, chữ hoa, token ngoài từ vựng) và các mô tả địa điểm dạng đã tách từ.
+# Kiểm tra thêm các cấu hình sublinear_tf / norm='l1' / binary trên một vectorizer fit nhỏ, và đo tốc độ.
+import sys
+import os
+import random
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.search_logic.query_vectorizer import QueryVectorizer
+from app.search_logic.tfidf_engine import TFIDFEngine
+
+NUM_RANDOM_QUERIES = 2000
+TIMING_REPEATS = 2000
+
+
+def same_vector(vectorizer, query_vectorizer, text):
+    """True nếu hai cách biến đổi cho cùng cột và cùng trọng số (không sai số)."""
+    expected = vectorizer.transform([text]).tocsr()
+    expected.sort_indices()
+    indices, weights = query_vectorizer.transform(text)
+    return (np.array_equal(expected.indices, indices)
+            and expected.data.dtype == weights.dtype
+            and np.array_equal(expected.data, weights))
+
+
+def build_queries(vocabulary: list) -> list:
+    """Vài câu cố định + truy vấn ngẫu nhiên từ từ vựng (có lặp, viết hoa, token lạ, dấu câu)."""
+    queries = [
+        "",
+        "   ",
+        "tôi muốn đến một nơi có bãi_biển thật đẹp",
+        "Bãi_Biển BÃI_BIỂN bãi_biển, bãi_biển!",
+        "từ_không_có_trong_từ_vựng x y",
+        "a 1 12 đà_lạt-2024",
+    ]
+    rng = random.Random(42)
+    for _ in range(NUM_RANDOM_QUERIES):
+        tokens = [rng.choice(vocabulary) for _ in range(rng.randint(1, 12))]
+        tokens += rng.sample(tokens, rng.randint(0, len(tokens))) # Token lặp lại
+        if rng.random() < 0.3:
+            tokens.append("từ_lạ_%d" % rng.randint(0, 9))
+        if rng.random() < 0.3:
+            tokens = [token.upper() if rng.random() < 0.5 else token for token in tokens]
+        rng.shuffle(tokens)
+        queries.append(" ".join(tokens))
+    return queries
+
+
+def check_configurations(documents: list) -> int:
+    """Các cấu hình khác của TfidfVectorizer được QueryVectorizer hỗ trợ."""
+    mismatches = 0
+    configurations = [
+        {'sublinear_tf': True},
+        {'norm': 'l1'},
+        {'norm': None},
+        {'binary': True},
+        {'use_idf': False},
+        {'dtype': np.float32},
+        {'lowercase': False},
+    ]
+    for params in configurations:
+        vectorizer = TfidfVectorizer(**params).fit(documents[:200])
+        query_vectorizer = QueryVectorizer.from_vectorizer(vectorizer)
+        bad = sum(1 for text in documents if not same_vector(vectorizer, query_vectorizer, text))
+        print(f"  Cấu hình {params}: {len(documents)} chuỗi, khác biệt: {bad}")
+        mismatches += bad
+    return mismatches
+
+
+if __name__ == "__main__":
+    engine = TFIDFEngine()
+    if not engine.is_ready():
+        print("TFIDFEngine chưa sẵn sàng. Hãy chạy script build_tfidf_model.py trước.")
+        sys.exit(1)
+
+    vectorizer = engine.vectorizer # TfidfVectorizer của sklearn (tái tạo từ index)
+    query_vectorizer = engine.query_vectorizer
+    queries = build_queries(sorted(vectorizer.vocabulary_))
+
+    mismatches = 0
+    for query in queries:
+        if not same_vector(vectorizer, query_vectorizer, query):
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"Khác biệt cho truy vấn '{query}'")
+    print(f"Model hiện tại: đã so sánh {len(queries)} truy vấn, khác biệt: {mismatches}")
+
+    # Ma trận theo lô (dùng cho calculate_similarity_batch và cập nhật index)
+    expected_matrix = vectorizer.transform(queries)
+    actual_matrix = query_vectorizer.transform_matrix(queries)
+    batch_equal = (expected_matrix != actual_matrix).nnz == 0
+    print(f"transform_matrix giống transform của sklearn: {batch_equal}")
+    mismatches += 0 if batch_equal else 1
+
+    mismatches += check_configurations(queries)
+
+    sample = queries[6:6 + TIMING_REPEATS]
+    start = time.perf_counter()
+    for query in sample:
+        vectorizer.transform([query])
+    sklearn_us = (time.perf_counter() - start) / len(sample) * 1e6
+    start = time.perf_counter()
+    for query in sample:
+        query_vectorizer.transform(query)
+    query_us = (time.perf_counter() - start) / len(sample) * 1e6
+    print(f"Thời gian trung bình mỗi truy vấn: sklearn {sklearn_us:.1f}µs, QueryVectorizer {query_us:.1f}µs")
+
+    print(f"\nTổng số khác biệt: {mismatches}")
+    sys.exit(1 if mismatches else 0)
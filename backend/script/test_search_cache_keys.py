@@ -0,0 +1,82 @@
+# backend/script/test_search_cache_keys.py
+# Kiểm tra key của cache kết quả và phiên phân trang: hai truy vấn có cùng tập từ khóa nhưng chuỗi được tính
+# điểm khác nhau ('biển' và 'biển đại dương') tìm liên tiếp phải cho kết quả khác nhau, và mỗi truy vấn phải
+# khớp với điểm tính trực tiếp bằng engine (không lấy nhầm kết quả đã cache của truy vấn kia). Cùng truy vấn
+# với bộ lọc allowed_ids phải có key riêng và chỉ trả về các ID được phép.
+# Chi tiết địa điểm được thay bằng dict tối thiểu để không cần database.
+#   python script/test_search_cache_keys.py [--num-results 10]
+import sys
+import os
+import argparse
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.search_logic.preprocessor import preprocess_query
+from app.services import search_service
+
+QUERY_PAIRS = [
+    ("biển", "biển đại dương"),
+    ("biển đại dương", "biển"),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra key cache kết quả của các truy vấn trùng từ khóa.")
+    parser.add_argument('--num-results', type=int, default=10)
+    return parser.parse_args(argv)
+
+
+def stub_details_map(location_ids: list) -> dict:
+    return {loc_id: {'id_dia_diem': loc_id} for loc_id in location_ids}
+
+
+def scored(results: list) -> list:
+    return [(d['id_dia_diem'], d['tfidf_score']) for d in results]
+
+
+def expected_matches(engine, query: str, num_results: int) -> list:
+    query_text = search_service.tfidf_query_text(engine, preprocess_query(query))
+    return [(loc_id, round(float(score), 4))
+            for loc_id, score in engine.calculate_similarity(query_text, num_results)]
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    search_service._get_location_details_map = stub_details_map
+    engine = search_service.get_tfidf_engine()
+    if not engine.is_ready():
+        print("TFIDFEngine chưa sẵn sàng. Hãy chạy build_tfidf_model.py trước.")
+        sys.exit(1)
+
+    failed = False
+    for first, second in QUERY_PAIRS:
+        search_service._result_cache.clear()
+        search_service._search_sessions.clear()
+        results = {}
+        for query in (first, second):
+            expected = expected_matches(engine, query, args.num_results)
+            by_tfidf = scored(search_service.search_locations_by_tfidf(query, args.num_results))
+            page = scored(search_service.search_locations_paginated(query, args.num_results)['results'])
+            matches = bool(expected) and by_tfidf == expected and page == expected
+            failed |= not matches
+            results[query] = by_tfidf
+            print(f"'{query}': {len(by_tfidf)} kết quả, khớp engine (cache kết quả và phiên): {matches}")
+        differ = results[first] != results[second]
+        failed |= not differ
+        print(f"  '{first}' rồi '{second}': kết quả khác nhau: {differ}")
+
+    query = QUERY_PAIRS[0][0]
+    unfiltered = scored(search_service.search_locations_by_tfidf(query, args.num_results))
+    allowed_ids = [loc_id for loc_id, _ in unfiltered[1::2]]
+    for name, search in (("tfidf", search_service.search_locations_by_tfidf),
+                         ("phân trang", lambda *a, **kw: search_service.search_locations_paginated(*a, **kw)['results'])):
+        filtered = scored(search(query, args.num_results, allowed_ids=allowed_ids))
+        matches = bool(filtered) and {loc_id for loc_id, _ in filtered} == set(allowed_ids)
+        failed |= not matches
+        print(f"'{query}' ({name}) với allowed_ids ({len(allowed_ids)} ID): {len(filtered)} kết quả, "
+              f"chỉ gồm ID được phép: {matches}")
+
+    print("\nKẾT QUẢ:", "KHÔNG ĐẠT" if failed else "đạt")
+    sys.exit(1 if failed else 0)
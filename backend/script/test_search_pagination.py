@@ -0,0 +1,77 @@
+# backend/script/test_search_pagination.py
+# Kiểm tra tìm kiếm phân trang (search_locations_paginated): ghép các trang theo next_cursor phải cho
+# đúng thứ tự và điểm của search_locations_by_tfidf với num_results lớn, trang đầu mở lại cùng truy vấn
+# dùng chung phiên, cursor sai/hết hạn bị từ chối. Chi tiết địa điểm được thay bằng dict tối thiểu để so
+# (id_dia_diem, điểm) mà không cần database; truy vấn không có kết quả nào để so cũng tính là không đạt.
+#   python script/test_search_pagination.py [--page-size 7] [--pages 5]
+import sys
+import os
+import argparse
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.services import search_service
+from app.services.search_service import search_locations_by_tfidf, search_locations_paginated
+from app.services.search_sessions import (
+    InvalidCursorError, SearchSessionExpiredError, decode_cursor, encode_cursor
+)
+
+TEST_QUERIES = [
+    "tôi muốn đến một nơi có biển thật đẹp",
+    "chỗ nào để khám phá mà lại yên tĩnh",
+    "địa điểm có kiến trúc cổ",
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra tìm kiếm phân trang theo cursor.")
+    parser.add_argument('--page-size', type=int, default=7)
+    parser.add_argument('--pages', type=int, default=5, help="Số trang ghép để so sánh")
+    return parser.parse_args(argv)
+
+
+def stub_details_map(location_ids: list) -> dict:
+    return {loc_id: {'id_dia_diem': loc_id} for loc_id in location_ids}
+
+
+def collect_pages(query: str, page_size: int, max_pages: int) -> tuple:
+    """(kết quả của tối đa max_pages trang đầu, trang đầu tiên)."""
+    first_page = page = search_locations_paginated(query, page_size)
+    results = list(page['results'])
+    for _ in range(max_pages - 1):
+        if page['next_cursor'] is None:
+            break
+        page = search_locations_paginated(page_size=page_size, cursor=page['next_cursor'])
+        results.extend(page['results'])
+    return results, first_page
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    search_service._get_location_details_map = stub_details_map
+    failed = False
+    for query in TEST_QUERIES:
+        paged, first_page = collect_pages(query, args.page_size, args.pages)
+        expected = search_locations_by_tfidf(query, args.page_size * args.pages)
+        same = len(expected) > 0 and [(d['id_dia_diem'], d['tfidf_score']) for d in paged] == \
+               [(d['id_dia_diem'], d['tfidf_score']) for d in expected]
+        reopened = search_locations_paginated(query, args.page_size)
+        same_session = first_page['next_cursor'] is None or \
+            decode_cursor(reopened['next_cursor'])[0] == decode_cursor(first_page['next_cursor'])[0]
+        failed |= not (same and same_session)
+        print(f"'{query}': tổng {first_page['total']}, ghép {len(paged)} kết quả, "
+              f"khớp top-{len(expected)}: {same}, dùng lại phiên: {same_session}")
+
+    for cursor, error in (("không-phải-cursor", InvalidCursorError),
+                          (encode_cursor("phien-khong-ton-tai", 10), SearchSessionExpiredError)):
+        try:
+            search_locations_paginated(cursor=cursor)
+            print(f"Cursor '{cursor}' không bị từ chối")
+            failed = True
+        except error:
+            print(f"Cursor '{cursor}': {error.__name__} (đúng)")
+
+    print("\nKẾT QUẢ:", "KHÔNG ĐẠT" if failed else "đạt")
+    sys.exit(1 if failed else 0)
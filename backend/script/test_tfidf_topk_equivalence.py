@@ -0,0 +1,84 @@
+# backend/script/test_tfidf_topk_equivalence.py
+# So sánh kết quả của TFIDFEngine.calculate_similarity (posting list + partial top-k)
+# và calculate_similarity_batch với cách tính cũ (cosine_similarity trên toàn bộ ma trận + argsort).
+# Tắt phân giải term và mở rộng từ đồng nghĩa (synonym_weight=0) để hai cách dùng cùng một vector truy vấn.
+import sys
+import os
+import random
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.search_logic.tfidf_engine import TFIDFEngine
+
+NUM_RANDOM_QUERIES = 500
+NUM_RESULTS_OPTIONS = [1, 3, 5, 10, 50]
+SCORE_TOLERANCE = 1e-9
+
+
+def legacy_calculate_similarity(engine, processed_query_text, num_results):
+    """Cách tính cũ: cosine_similarity với mọi địa điểm rồi argsort toàn bộ."""
+    query_vector = engine.vectorizer.transform([processed_query_text])
+    similarity_scores = cosine_similarity(query_vector, engine.tfidf_matrix)[0]
+    actual_num_results = min(num_results, len(engine.location_ids))
+    top_indices = np.argsort(similarity_scores, kind='stable')[::-1][:actual_num_results]
+    results = []
+    for i in top_indices:
+        score = float(similarity_scores[i])
+        if score > 0:
+            results.append((engine.location_ids[i], score))
+    return results
+
+
+def same_results(expected, actual):
+    """Cùng danh sách ID theo đúng thứ tự và điểm lệch không quá SCORE_TOLERANCE."""
+    same_ids = [loc_id for loc_id, _ in expected] == [loc_id for loc_id, _ in actual]
+    return same_ids and all(
+        abs(a - b) <= SCORE_TOLERANCE for (_, a), (_, b) in zip(expected, actual)
+    )
+
+
+def build_queries(engine):
+    """Sinh truy vấn: vài câu đã tách từ cố định + các truy vấn ngẫu nhiên từ từ vựng."""
+    queries = [
+        "tôi muốn đến một nơi có bãi_biển thật đẹp",
+        "chỗ nào để khám_phá mà lại yên_tĩnh",
+        "địa_điểm có kiến_trúc cổ",
+        "từ_không_có_trong_từ_vựng",
+    ]
+    rng = random.Random(42)
+    vocabulary = sorted(engine.vectorizer.vocabulary_)
+    for _ in range(NUM_RANDOM_QUERIES):
+        queries.append(" ".join(rng.sample(vocabulary, rng.randint(1, 8))))
+    return queries
+
+
+if __name__ == "__main__":
+    engine = TFIDFEngine()
+    if not engine.is_ready():
+        print("TFIDFEngine chưa sẵn sàng. Hãy chạy script build_tfidf_model.py trước.")
+        sys.exit(1)
+    engine.term_resolver = None
+
+    queries = build_queries(engine)
+    mismatches = 0
+    total = 0
+    for num_results in NUM_RESULTS_OPTIONS:
+        batch_results = engine.calculate_similarity_batch(queries, num_results, synonym_weight=0)
+        for query, batch_actual in zip(queries, batch_results):
+            expected = legacy_calculate_similarity(engine, query, num_results)
+            for label, actual in (("đơn", engine.calculate_similarity(query, num_results, synonym_weight=0)),
+                                  ("lô", batch_actual)):
+                total += 1
+                if not same_results(expected, actual):
+                    mismatches += 1
+                    print(f"\nKhác biệt ({label}) cho truy vấn '{query}' (num_results={num_results}):")
+                    print(f"  Cũ : {expected}")
+                    print(f"  Mới: {actual}")
+
+    print(f"\nĐã so sánh {total} trường hợp, khác biệt: {mismatches}")
+    sys.exit(1 if mismatches else 0)
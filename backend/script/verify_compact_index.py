@@ -0,0 +1,153 @@
+# backend/script/verify_compact_index.py
+# Kiểm tra index TF-IDF dạng gọn (float32 / int8 lượng tử hóa theo dòng, chỉ số uint16 khi được) so với
+# index float64 hiện có (TFIDF_INDEX_DIR):
+# - Dung lượng các mảng ma trận (CSR + CSC + scale) của từng dạng và phần trăm tiết kiệm.
+# - Trên các truy vấn mẫu (term nổi bật của các địa điểm + truy vấn ngẫu nhiên từ từ vựng):
+#   top-k overlap (tỉ lệ ID của top-k float64 vẫn có trong top-k dạng gọn), tỉ lệ truy vấn giữ nguyên
+#   thứ tự top-k, sai số điểm (so với điểm float64 của cùng địa điểm) và thời gian tính điểm mỗi truy vấn.
+# - Cách tính trực tiếp trên dòng (dùng khi bộ lọc chọn lọc cao) và cách tính theo lô
+#   (calculate_similarity_batch) cho cùng điểm với posting list.
+#   python script/verify_compact_index.py [--k 10] [--queries 500] [--min-overlap 0.95]
+import sys
+import os
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Thêm thư mục `backend` vào PYTHONPATH để có thể import `app`
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import TFIDF_INDEX_DIR
+from app.search_logic import index_store
+from app.search_logic.tfidf_engine import _score_postings, _score_postings_batch, _select_top_k
+
+COMPACT_STORAGES = ('float32', 'int8')
+MATRIX_ARRAYS = ('csr_data', 'csr_indices', 'csr_indptr', 'csc_data', 'csc_indices', 'csc_indptr', 'row_scale')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh index TF-IDF dạng gọn với float64.")
+    parser.add_argument('--k', type=int, default=10, help="Số kết quả top-k")
+    parser.add_argument('--queries', type=int, default=500, help="Số truy vấn mẫu")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-overlap', type=float, default=0.95,
+                        help="Trả về mã lỗi nếu overlap trung bình của một dạng thấp hơn ngưỡng này")
+    return parser.parse_args(argv)
+
+
+def matrix_bytes(index_dir: str, manifest: dict) -> int:
+    """Tổng dung lượng (byte) các file của ma trận (không tính IDF, từ vựng, ID)."""
+    return sum(
+        os.path.getsize(os.path.join(index_dir, info['file']))
+        for name, info in manifest['files'].items() if name in MATRIX_ARRAYS
+    )
+
+
+def sample_queries(tfidf_matrix: csr_matrix, vocabulary_size: int, idf: np.ndarray, num_queries: int, seed: int) -> list:
+    """
+    Truy vấn dạng (indices, weights) đã chuẩn hóa L2 giống QueryVectorizer: một nửa là 1-4 term nổi bật
+    của một địa điểm ngẫu nhiên, một nửa là 1-6 term ngẫu nhiên của từ vựng (trọng số IDF).
+    """
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in range(num_queries):
+        if i % 2 == 0:
+            row = int(rng.integers(tfidf_matrix.shape[0]))
+            start, end = tfidf_matrix.indptr[row], tfidf_matrix.indptr[row + 1]
+            if start == end:
+                continue
+            top = np.argsort(-tfidf_matrix.data[start:end])[:int(rng.integers(1, 5))]
+            indices, weights = tfidf_matrix.indices[start:end][top], tfidf_matrix.data[start:end][top]
+        else:
+            indices = rng.choice(vocabulary_size, int(rng.integers(1, 7)), replace=False)
+            weights = idf[indices].astype(np.float64)
+        order = np.argsort(indices)
+        indices = indices[order].astype(np.int32)
+        weights = weights[order] / np.linalg.norm(weights)
+        queries.append((indices, weights))
+    return queries
+
+
+def query_matrix(queries: list, vocabulary_size: int) -> csr_matrix:
+    """Ma trận (số_truy_vấn, từ_vựng) dạng CSR của các truy vấn mẫu."""
+    indptr = np.concatenate([[0], np.cumsum([indices.size for indices, _ in queries])])
+    return csr_matrix((np.concatenate([weights for _, weights in queries]),
+                       np.concatenate([indices for indices, _ in queries]), indptr),
+                      shape=(len(queries), vocabulary_size))
+
+
+def top_k(postings, indices, weights, k):
+    rows, scores = _score_postings(postings, indices, weights)
+    positive = scores > 0
+    return _select_top_k(rows[positive], scores[positive], k)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not index_store.index_exists(TFIDF_INDEX_DIR):
+        print(f"Không tìm thấy index TF-IDF tại {TFIDF_INDEX_DIR}. Hãy chạy build_tfidf_model.py trước.")
+        sys.exit(1)
+    reference = index_store.load_index(TFIDF_INDEX_DIR, mmap=True)
+    if reference['manifest'].get('storage', 'float64') != 'float64':
+        print("Index hiện tại không phải float64, hãy build lại với --storage float64 để làm chuẩn so sánh.")
+        sys.exit(1)
+    vectorizer = index_store.build_vectorizer(reference['manifest'], reference['vocabulary'], reference['idf'])
+    tfidf_matrix = reference['tfidf_matrix']
+    queries = sample_queries(tfidf_matrix, len(reference['vocabulary']), reference['idf'], args.queries, args.seed)
+    reference_bytes = matrix_bytes(TFIDF_INDEX_DIR, reference['manifest'])
+
+    start = time.perf_counter()
+    expected = [top_k(reference['postings'], indices, weights, args.k) for indices, weights in queries]
+    reference_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+    print(f"Index float64: {tfidf_matrix.shape}, nnz {tfidf_matrix.nnz}, {len(queries)} truy vấn, top-{args.k}")
+    print(f"{'dạng':<9}{'ma trận KB':>12}{'tiết kiệm':>11}{'chỉ số':>9}{'overlap':>10}{'cùng thứ tự':>13}"
+          f"{'sai số TB':>12}{'sai số max':>12}{'µs/truy vấn':>13}")
+    print(f"{'float64':<9}{reference_bytes / 1024:>12.1f}{'-':>11}"
+          f"{reference['manifest']['files']['csc_indices']['dtype']:>9}{1.0:>10.4f}{1.0:>13.4f}"
+          f"{0.0:>12.2e}{0.0:>12.2e}{reference_us:>13.1f}")
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for storage in COMPACT_STORAGES:
+            index_dir = os.path.join(tmp, storage)
+            manifest = index_store.save_index(index_dir, vectorizer, tfidf_matrix, reference['location_ids'], storage)
+            compact = index_store.load_index(index_dir, mmap=True)
+
+            start = time.perf_counter()
+            actual = [top_k(compact['postings'], indices, weights, args.k) for indices, weights in queries]
+            compact_us = (time.perf_counter() - start) / len(queries) * 1e6
+
+            batch_scores = _score_postings_batch(compact['postings'], query_matrix(queries, tfidf_matrix.shape[1]))
+            overlaps, same_order, errors, direct_errors, batch_errors = [], 0, [], [], []
+            for position, ((indices, weights), (expected_rows, _), (rows, scores)) in enumerate(
+                    zip(queries, expected, actual)):
+                if expected_rows.size:
+                    overlaps.append(np.intersect1d(expected_rows, rows).size / expected_rows.size)
+                same_order += int(np.array_equal(expected_rows, rows))
+                if rows.size:
+                    # Điểm float64 của chính các địa điểm trong top-k dạng gọn
+                    query = np.zeros(tfidf_matrix.shape[1])
+                    query[indices] = weights
+                    exact_scores = tfidf_matrix[rows] @ query
+                    errors.append(np.abs(scores - exact_scores))
+                    direct_errors.append(np.abs(compact['tfidf_matrix'].dot_rows(rows, query) - scores).max())
+                    batch_errors.append(np.abs(batch_scores[position].toarray()[0][rows] - scores).max())
+            errors = np.concatenate(errors) if errors else np.zeros(1)
+            overlap = float(np.mean(overlaps)) if overlaps else 1.0
+            failed |= overlap < args.min_overlap
+
+            compact_bytes = matrix_bytes(index_dir, manifest)
+            print(f"{storage:<9}{compact_bytes / 1024:>12.1f}{1 - compact_bytes / reference_bytes:>11.1%}"
+                  f"{manifest['files']['csc_indices']['dtype']:>9}{overlap:>10.4f}{same_order / len(queries):>13.4f}"
+                  f"{errors.mean():>12.2e}{errors.max():>12.2e}{compact_us:>13.1f}")
+            print(f"  {storage}: sai số tính trực tiếp trên dòng so với posting list: "
+                  f"{max(direct_errors) if direct_errors else 0.0:.2e}, theo lô: "
+                  f"{max(batch_errors) if batch_errors else 0.0:.2e}")
+
+    print(f"\nNgưỡng overlap {args.min_overlap}: {'KHÔNG ĐẠT' if failed else 'đạt'}")
+    sys.exit(1 if failed else 0)